@@ -1,14 +1,19 @@
 # backend/app.py
 
 import os
+import csv
 import json
 import time
 import requests
 import urllib.parse
 from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, send_file, Response
 from passlib.hash import sha256_crypt # Para hashing de senha
 import io # Para o PDF
+import itertools
+import shutil
+import tempfile
+from concurrent.futures.process import BrokenProcessPool
 from datetime import timedelta # Para sessão permanente
 from openai import OpenAI # Importação global para uso no endpoint
 
@@ -27,15 +32,34 @@ app.permanent_session_lifetime = timedelta(days=7)
 
 # --- Importações dos Módulos de Lógica da pasta utils ---
 from utils.config_manager import (
-    load_app_config, save_app_config,
-    load_ml_accounts, save_ml_accounts
+    CONFIG_DIR_PATH, load_app_config, get_app_config, update_app_config
 )
 from utils.auth_utils import (
     login_required, FIXED_USERNAME,
     FIXED_PASSWORD_HASH, verify_user_password
 )
-from utils.ml_api_helpers import get_ml_user_info, refresh_ml_token
 from utils.ml_oauth_handler import exchange_ml_code_for_token
+from utils.ml_http_client import ML_API_BASE_URL, configure_ml_http_client, ml_coalescing_stats
+from utils.ml_token_broker import ml_token_broker
+from utils.ml_category_tree import ml_category_tree
+from utils.ml_category_search import rebuild_category_search_index, search_categories_locally
+from utils.server_session import init_server_side_sessions
+from utils.concurrency import (
+    ML_ACCOUNTS_MAX_WORKERS, SingleFlight, bounded_map_unordered, get_executor, run_keyed_tasks,
+    get_process_executor, discard_process_executor
+)
+from utils.rate_limit import KeyedRateLimiter
+from utils.ml_fee_schedule import fee_schedule_category_ids, fee_schedule_stats
+from utils.ml_attribute_cache import ATTRIBUTE_CACHE_TTL_SECONDS, attribute_cache_stats, cached_category_ids
+from utils.ml_shipping_cache import shipping_cache_stats
+from utils.ml_prediction_cache import prediction_cache_stats
+from utils.image_cache import (
+    image_cache_key, image_cache_stats, lookup_processed_image, read_processed_image_bytes,
+    record_hosted_url, store_processed_image
+)
+from utils.image_hosts import ImgurHost, MLPicturesHost, ZeroXZeroHost, upload_to_first_available
+from utils.pricing_grid import evaluate_price_grid, numpy_available
+from utils.ml_rate_governor import ml_rate_governor, ml_priority, PRIORITY_BACKGROUND
 
 try:
     from utils.tiny_api_service import fetch_product_details_from_tiny
@@ -47,27 +71,39 @@ except ImportError:
 try:
     from utils.ml_api_service import (
         get_ml_category_suggestion_logic,
+        predict_categories_batch_logic,
         get_ml_categories_logic,
         search_ml_categories_logic,
         get_ml_category_attributes_logic,
+        prewarm_category_attributes_logic,
         check_sku_on_ml_account_logic
         # Adicionar outras funções de ml_api_service conforme são implementadas
     )
 except ImportError:
     print("ERRO CRÍTICO: Módulo utils.ml_api_service não encontrado.")
     def get_ml_category_suggestion_logic(title, token): return {"error_message": "ml_api_service não carregado."}
+    def predict_categories_batch_logic(titles, token, limit=3): return []
     def get_ml_categories_logic(token, cat_id=None): return {"error_message": "ml_api_service não carregado."}
     def search_ml_categories_logic(query, token): return {"error_message": "ml_api_service não carregado."}
-    def get_ml_category_attributes_logic(cat_id, token): return {"error_message": "ml_api_service não carregado.", "attributes":[]}
+    def get_ml_category_attributes_logic(cat_id, token, slim=False): return {"error_message": "ml_api_service não carregado.", "attributes":[]}
+    def prewarm_category_attributes_logic(category_ids, token): return {"error_message": "ml_api_service não carregado."}
     def check_sku_on_ml_account_logic(sku, token, seller_id): return {"error": True, "found":False, "items":[], "message": "ml_api_service não carregado."}
 
 
 try:
-    from utils.image_processing_logic import process_optimize_image_logic, process_remove_background_logic
+    from utils.image_processing_logic import (
+        process_optimize_image_logic, process_remove_background_logic,
+        fetch_image_logic, optimize_image_bytes, remove_background_bytes,
+        OPTIMIZE_IMAGE_PARAMS, REMOVE_BACKGROUND_PARAMS
+    )
 except ImportError:
     print("ERRO CRÍTICO: Módulo utils.image_processing_logic não encontrado.")
     def process_optimize_image_logic(url): return {"error": True, "message":"image_processing_logic não carregado", "image_bytes": None}
     def process_remove_background_logic(url, key): return {"error": True, "message":"image_processing_logic não carregado", "image_bytes": None, "credits_charged": 0}
+    def fetch_image_logic(url): return {"error": True, "message":"image_processing_logic não carregado"}
+    def optimize_image_bytes(image_bytes): return {"error": True, "message":"image_processing_logic não carregado", "image_bytes": None}
+    def remove_background_bytes(image_bytes, key): return {"error": True, "message":"image_processing_logic não carregado", "image_bytes": None, "credits_charged": 0}
+    OPTIMIZE_IMAGE_PARAMS = REMOVE_BACKGROUND_PARAMS = {}
 
 try:
     from utils.openai_logic import generate_description_with_chatgpt
@@ -77,11 +113,15 @@ except ImportError:
 
 try:
     from utils.pricing_logic import calculate_final_price_for_listing_type, simulate_ml_free_shipping_logic, get_ml_api_fees_for_type_logic
+    from utils.pricing_logic import build_quote_request, quote_prices_for_account, get_fee_tiers_for_listing_type
 except ImportError:
     print("ERRO CRÍTICO: Módulo utils.pricing_logic não encontrado.")
     def calculate_final_price_for_listing_type(*args, **kwargs): return {"price": 0.0, "fees_info": "pricing_logic não carregado"}
     def simulate_ml_free_shipping_logic(*args, **kwargs): return {"error": True, "message": "pricing_logic não carregado", "cost": 9999.99}
     def get_ml_api_fees_for_type_logic(*args, **kwargs): return 0.19, 6.00, 0.0 # Fallback genérico
+    def build_quote_request(payload): raise ValueError("pricing_logic não carregado")
+    def quote_prices_for_account(*args, **kwargs): return {"error": "pricing_logic não carregado"}
+    def get_fee_tiers_for_listing_type(*args, **kwargs): return []
 
 
 # --- Constantes Globais e Configuração do App Flask (do seu código original) ---
@@ -90,34 +130,87 @@ app.config['ML_CLIENT_SECRET'] = os.environ.get('ML_CLIENT_SECRET_ENV', 'msLQzMK
 # IMPORTANTE: Esta URI deve ser a que está configurada no seu app ML e para onde o NGROK (ou seu servidor público) aponta.
 app.config['ML_REDIRECT_URI_CONFIG'] = os.environ.get('ML_REDIRECT_URI_ENV', 'https://api.meliunlocker.cc/oauth/ml/callback') # Do seu Tkinter
 app.config['ML_AUTH_URL_TEMPLATE'] = 'https://auth.mercadolivre.com.br/authorization?response_type=code&client_id={client_id}&redirect_uri={redirect_uri}&state={state}'
-app.config['ML_TOKEN_URL'] = 'https://api.mercadolibre.com/oauth/token'
-app.config['ML_USER_INFO_URL'] = "https://api.mercadolibre.com/users/me"
-app.config['ML_SITES_URL'] = "https://api.mercadolibre.com/sites"
+app.config['ML_TOKEN_URL'] = f"{ML_API_BASE_URL}/oauth/token"
+app.config['ML_USER_INFO_URL'] = f"{ML_API_BASE_URL}/users/me"
+app.config['ML_SITES_URL'] = f"{ML_API_BASE_URL}/sites"
 app.config['ML_SITE_ID'] = "MLB" # Do seu Tkinter
-app.config['ML_CATEGORY_ATTRIBUTES_URL_TEMPLATE'] = "https://api.mercadolibre.com/categories/{cat_id}/attributes" # Do seu Tkinter
+app.config['ML_CATEGORY_ATTRIBUTES_URL_TEMPLATE'] = ML_API_BASE_URL + "/categories/{cat_id}/attributes" # Do seu Tkinter
 app.config['APP_USER_AGENT'] = "MeliUnlockerWebApp/1.0.PyWeb" # Atualizado
+configure_ml_http_client(user_agent=app.config['APP_USER_AGENT']) # Cliente HTTP compartilhado por todas as chamadas ML
+# Com `python app.py`, os processos do pool de imagens (forkserver) reimportam este arquivo
+# como __mp_main__: nesse caso nada de threads em segundo plano
+_IN_IMAGE_WORKER_PROCESS = __name__ == '__mp_main__'
+ml_token_broker.init_app(app, start_renewer=not _IN_IMAGE_WORKER_PROCESS) # Cache de tokens ML + renovação proativa em background
+
+
+def _any_ml_access_token():
+    """Token de qualquer conta conectada, para leituras públicas em segundo plano (ex.: árvore de categorias)."""
+    for nickname in ml_token_broker.list_accounts():
+        access_token, _, error = ml_token_broker.get_token(nickname, need_seller_id=False)
+        if access_token and not error:
+            return access_token
+    return None
+
+
+ml_category_tree.add_listener(rebuild_category_search_index) # Busca de categorias em memória
+ml_category_tree.init_app(app, _any_ml_access_token, start_refresher=not _IN_IMAGE_WORKER_PROCESS) # Árvore de categorias servida do snapshot local
+init_server_side_sessions(app, os.path.join(CONFIG_DIR_PATH, 'sessions.sqlite3')) # Cookie leva só o ID da sessão
 app.config['CHATGPT_MODEL_NAME_APP'] = "gpt-4o-mini" # Do seu Tkinter
 
 
-# --- Funções de Upload de Imagem --- (Mantidas aqui por enquanto)
-def _upload_to_imgur(image_bytes, client_id):
-    if not client_id: print("Imgur: Client ID não fornecido."); return None
-    try:
-        headers = {'Authorization': f'Client-ID {client_id}'}
-        response = requests.post("https://api.imgur.com/3/image", headers=headers, files={'image': image_bytes}, timeout=45)
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('success') and data.get('data', {}).get('link'): return data['data']['link']
-        print(f"Imgur Upload Erro: {response.status_code} - {response.text[:200]}"); return None
-    except Exception as e: print(f"Imgur Upload Exceção: {e}"); return None
-
-def _upload_to_0x0st(image_bytes, filename="image.jpg"):
-    try:
-        response = requests.post("https://0x0.st", files={'file': (filename, image_bytes)}, timeout=30)
-        response.raise_for_status()
-        public_url = response.text.strip()
-        return public_url if public_url.startswith("http") else None
-    except Exception as e: print(f"0x0.st Upload Exceção: {e}"); return None
+# --- Upload de Imagem ---
+def _image_hosts(ml_nickname=None):
+    """Serviços de hospedagem na ordem de preferência: ML (conta informada), Imgur (se configurado), 0x0.st."""
+    hosts = []
+    if ml_nickname and ml_token_broker.has_account(ml_nickname):
+        access_token, _, error_token = ml_token_broker.get_token(ml_nickname, need_seller_id=False)
+        if access_token and not error_token:
+            hosts.append(MLPicturesHost(access_token))
+    imgur_client_id = get_app_config().imgur_client_id
+    if imgur_client_id:
+        hosts.append(ImgurHost(imgur_client_id))
+    hosts.append(ZeroXZeroHost()) # Fallback
+    return hosts
+
+def _process_and_host_image(image_url, operation, params, process_bytes, extension, ml_nickname=None):
+    """
+    Baixa a imagem, aplica `process_bytes(bytes_da_origem)` e hospeda o resultado, passando pelo
+    cache de imagens processadas (ver utils/image_cache.py): se a mesma imagem já passou pela
+    mesma operação, devolve a URL guardada sem processar nem reenviar.
+    Com `ml_nickname`, o resultado vai para as imagens dessa conta no ML (ver utils/image_hosts.py);
+    uma URL guardada de outro serviço ou de outra conta só é reaproveitada se o ML não estiver disponível.
+    Retorna {"error", "message", "public_url", "picture_id", "service_used", "credits_charged", "cached"}.
+    """
+    download = fetch_image_logic(image_url)
+    if download.get("error"):
+        return {**download, "credits_charged": 0}
+    cache_key = image_cache_key(download["image_bytes"], operation, params)
+    cached = lookup_processed_image(cache_key)
+    hosts = _image_hosts(ml_nickname)
+    uploads_to_ml = isinstance(hosts[0], MLPicturesHost)
+    if cached and cached.get("public_url") and (not uploads_to_ml or (cached.get("picture_id") and cached.get("picture_owner") == ml_nickname)):
+        return {"error": False, "public_url": cached["public_url"], "picture_id": cached.get("picture_id"),
+                "service_used": cached["service"], "credits_charged": 0, "cached": True}
+
+    processed_bytes = read_processed_image_bytes(cache_key, cached) if cached else None
+    from_cache = processed_bytes is not None
+    credits_charged = 0
+    if not from_cache: # Só processa (e gasta crédito, no Remove.bg) se o resultado não está guardado
+        result_processing = process_bytes(download["image_bytes"])
+        credits_charged = result_processing.get("credits_charged", 0)
+        if result_processing.get("error") or not result_processing.get("image_bytes"):
+            return {**result_processing, "error": True, "credits_charged": credits_charged}
+        processed_bytes = result_processing["image_bytes"]
+        store_processed_image(cache_key, processed_bytes, extension)
+    del download
+
+    hosted, service_used = upload_to_first_available(hosts, processed_bytes, f"{operation}_{cache_key[:16]}.{extension}")
+    if not hosted:
+        return {"error": False, "public_url": None, "picture_id": None, "service_used": service_used, "credits_charged": credits_charged, "cached": from_cache}
+    picture_owner = ml_nickname if hosted["picture_id"] else None
+    record_hosted_url(cache_key, hosted["public_url"], service_used, hosted["picture_id"], picture_owner)
+    return {"error": False, "public_url": hosted["public_url"], "picture_id": hosted["picture_id"], "service_used": service_used,
+            "credits_charged": credits_charged, "cached": from_cache}
 
 # --- Rotas de Autenticação ---
 @app.before_request
@@ -130,9 +223,8 @@ def login_route():
     if request.method == 'POST':
         username = request.form.get('username'); password = request.form.get('password')
         if username == FIXED_USERNAME and verify_user_password(password, FIXED_PASSWORD_HASH):
+            session.regenerate() # Novo ID de sessão a cada login
             session['logged_in_user'] = username
-            session['app_config'] = load_app_config()
-            session['ml_accounts'] = load_ml_accounts()
             session['active_ml_account_nickname'] = None # Resetar conta ativa no login
             print(f"Usuário '{username}' logado."); next_url = request.args.get('next');
             return redirect(next_url or url_for('dashboard_route'))
@@ -152,140 +244,54 @@ def dashboard_route(): return render_template('dashboard.html', username=session
 @app.route('/api/app-config', methods=['GET', 'POST'])
 @login_required
 def api_app_config_handler():
-    # Garante que app_config na sessão está atualizado se o arquivo mudou externamente (pouco provável aqui)
-    # Mas é bom para consistência.
-    current_config_from_file = load_app_config()
-    session_config = session.get('app_config', {}).copy()
-
-    # Sincroniza sessão com arquivo, priorizando o arquivo se não for POST
+    # Config compartilhada (memória), não mais copiada na sessão de cada usuário
     if request.method == 'GET':
-        for key in current_config_from_file:
-            if key not in session_config or session_config[key] != current_config_from_file[key]:
-                 session_config[key] = current_config_from_file[key]
-        session['app_config'] = session_config # Atualiza sessão
-        return jsonify(session_config)
+        return jsonify(load_app_config())
 
     elif request.method == 'POST':
         data = request.json;
         allowed_keys = ['tiny_api_v2_token', 'removebg_api_key', 'imgur_client_id', 'chatgpt_api_key']
-        updated_config_for_save = current_config_from_file.copy() # Começa com o que está no arquivo
-        session_updated = False
-
-        for key in allowed_keys:
-            if key in data:
-                updated_config_for_save[key] = data[key] # Atualiza o dict que será salvo
-                session_config[key] = data[key] # Atualiza o dict da sessão
-                session_updated = True
-
-        if session_updated: # Se algo foi realmente alterado pelo POST
-            save_app_config(updated_config_for_save)
-            session['app_config'] = session_config # Salva as alterações na sessão
-            return jsonify({"success": True, "message": "Configurações salvas e sessão atualizada."})
+        changes = {key: data[key] for key in allowed_keys if key in data}
+
+        if changes: # Se algo foi realmente alterado pelo POST
+            update_app_config(**changes)
+            return jsonify({"success": True, "message": "Configurações salvas."})
         return jsonify({"error": "Nenhuma chave válida para atualizar ou valores são os mesmos."}), 400
 
 
 # == Mercado Livre Contas & Auth ==
 def _get_active_ml_token_from_session_and_refresh(for_api_call=True):
+    # Tokens vêm do broker (memória); o refresh acontece em background antes de expirar.
     active_nick = session.get('active_ml_account_nickname')
-    ml_accounts_data_session_copy = session.get('ml_accounts', {}).copy()
-
-    if not active_nick or active_nick not in ml_accounts_data_session_copy:
-        return None, "Nenhuma conta ML ativa selecionada."
-
-    account_data = ml_accounts_data_session_copy[active_nick]
-    access_token = account_data.get('access_token')
-    expires_at = account_data.get('expires_at', 0)
-    seller_id = account_data.get('seller_id')
-
-    token_needs_refresh = not access_token or time.time() >= expires_at
-
-    if token_needs_refresh:
-        print(f"Token para '{active_nick}' (Sessão) {'expirado/ausente' if for_api_call else 'precisa de refresh para UI'}, tentando refresh...")
-        new_token_info = refresh_ml_token(account_data.get('refresh_token')) # Usa helper de ml_api_helpers
-        if new_token_info:
-            account_data.update(new_token_info)
-            # Tenta obter/atualizar seller_id após refresh bem-sucedido
-            if not account_data.get('seller_id') and new_token_info.get('access_token'):
-                user_info = get_ml_user_info(new_token_info['access_token'])
-                if user_info and user_info.get("id"):
-                    account_data['seller_id'] = str(user_info.get("id"))
-            
-            all_ml_accounts_master = load_ml_accounts() # Carrega do arquivo para garantir que estamos atualizando a fonte da verdade
-            all_ml_accounts_master[active_nick] = account_data # Atualiza a conta específica
-            save_ml_accounts(all_ml_accounts_master) # Salva no arquivo
-            session['ml_accounts'] = all_ml_accounts_master # Atualiza a sessão Flask com todas as contas
-            
-            access_token = account_data.get('access_token')
-            seller_id = account_data.get('seller_id') # Atualiza seller_id
-            print(f"Token para '{active_nick}' (Sessão) renovado.")
-        else:
-            return None, f"Falha ao renovar token para '{active_nick}'."
-    
-    if not access_token: return None, "Token de acesso inválido após tentativa de refresh."
-    if for_api_call and not seller_id: # Se for para uma chamada de API que precisa de seller_id
-        user_info_seller = get_ml_user_info(access_token)
-        if user_info_seller and user_info_seller.get("id"):
-            seller_id = str(user_info_seller.get("id"))
-            all_ml_accounts_master_sid = load_ml_accounts()
-            if active_nick in all_ml_accounts_master_sid:
-                all_ml_accounts_master_sid[active_nick]['seller_id'] = seller_id
-                save_ml_accounts(all_ml_accounts_master_sid)
-                session['ml_accounts'] = all_ml_accounts_master_sid
-            else: # Improvável, mas por segurança
-                print(f"Aviso: conta {active_nick} não encontrada ao tentar salvar seller_id pós-fetch.")
-        else:
-            return None, f"Falha ao obter Seller ID para {active_nick} para chamada API."
-
-    return access_token, seller_id, None # Retorna token, seller_id e None para erro
+    if not active_nick or not ml_token_broker.has_account(active_nick):
+        return None, None, "Nenhuma conta ML ativa selecionada."
+    return ml_token_broker.get_token(active_nick, need_seller_id=for_api_call)
 
 
 @app.route('/api/ml/accounts', methods=['GET'])
 @login_required
 def api_get_ml_accounts_handler():
-    # Sempre carrega do arquivo para garantir dados frescos,
-    # pois o refresh pode ter acontecido em outra requisição.
-    ml_accounts_from_file = load_ml_accounts()
-    session['ml_accounts'] = ml_accounts_from_file # Sincroniza sessão
-
     accounts_to_send = {}
-    accounts_data_changed_by_refresh_during_list = False
-
-    for nick, acc_data_loop in ml_accounts_from_file.items():
-        temp_acc_data = acc_data_loop.copy() # Trabalha com cópia para cada conta
-        token_expired_or_missing = not temp_acc_data.get('access_token') or \
-                                   not temp_acc_data.get('expires_at') or \
-                                   time.time() >= temp_acc_data['expires_at']
-
-        if token_expired_or_missing and temp_acc_data.get('refresh_token'):
-            print(f"API Listar Contas: Token para {nick} precisa de refresh, tentando...")
-            new_token_data = refresh_ml_token(temp_acc_data.get('refresh_token'))
-            if new_token_data:
-                temp_acc_data.update(new_token_data)
-                # Tenta garantir seller_id após refresh
-                if not temp_acc_data.get('seller_id') and new_token_data.get('access_token'):
-                    user_info = get_ml_user_info(new_token_data['access_token'])
-                    if user_info and user_info.get("id"):
-                        temp_acc_data['seller_id'] = str(user_info.get("id"))
-                ml_accounts_from_file[nick] = temp_acc_data # Atualiza no dict principal que será salvo
-                accounts_data_changed_by_refresh_during_list = True
-                print(f"API Listar Contas: Token para {nick} renovado.")
-            else:
-                print(f"API Listar Contas: Falha ao renovar token para {nick} durante listagem.")
-        
+    needs_background_refresh = False
+
+    for nick, acc_data in ml_token_broker.list_accounts().items():
+        token_valid = bool(acc_data.get('access_token') and \
+                           acc_data.get('expires_at') and \
+                           time.time() < acc_data.get('expires_at'))
+        if not token_valid and acc_data.get('refresh_token'):
+            needs_background_refresh = True
+
         # Prepara os dados para enviar ao frontend (sem tokens sensíveis, apenas info de validade)
         accounts_to_send[nick] = {
-            "nickname": temp_acc_data.get("nickname"),
-            "seller_id": temp_acc_data.get("seller_id"),
-            "shipping_mode": temp_acc_data.get("shipping_mode", "me2"),
-            "token_valid": bool(temp_acc_data.get('access_token') and \
-                                temp_acc_data.get('expires_at') and \
-                                time.time() < temp_acc_data.get('expires_at')),
-            "expires_at_timestamp_for_display": temp_acc_data.get('expires_at') # Para debug no frontend
+            "nickname": acc_data.get("nickname"),
+            "seller_id": acc_data.get("seller_id"),
+            "shipping_mode": acc_data.get("shipping_mode", "me2"),
+            "token_valid": token_valid,
+            "expires_at_timestamp_for_display": acc_data.get('expires_at') # Para debug no frontend
         }
 
-    if accounts_data_changed_by_refresh_during_list:
-        save_ml_accounts(ml_accounts_from_file) # Salva se houve alguma alteração
-        session['ml_accounts'] = ml_accounts_from_file # Atualiza a sessão também
+    if needs_background_refresh:
+        ml_token_broker.request_refresh() # Não bloqueia a listagem
 
     return jsonify(accounts_to_send)
 
@@ -294,12 +300,7 @@ def api_get_ml_accounts_handler():
 @login_required
 def api_remove_ml_account_handler():
     nickname_to_remove = request.json.get('nickname')
-    # Sempre opera sobre os dados do arquivo como fonte da verdade
-    ml_accounts_data_from_file = load_ml_accounts()
-    if nickname_to_remove and nickname_to_remove in ml_accounts_data_from_file:
-        del ml_accounts_data_from_file[nickname_to_remove]
-        save_ml_accounts(ml_accounts_data_from_file)
-        session['ml_accounts'] = ml_accounts_data_from_file # Atualiza sessão
+    if nickname_to_remove and ml_token_broker.remove_account(nickname_to_remove):
         if session.get('active_ml_account_nickname') == nickname_to_remove:
             session['active_ml_account_nickname'] = None
         return jsonify({"success": True, "message": f"Conta {nickname_to_remove} removida."})
@@ -310,45 +311,26 @@ def api_remove_ml_account_handler():
 @login_required
 def api_set_active_ml_account_handler():
     nickname_to_set = request.json.get('nickname')
-    # Sempre opera sobre os dados do arquivo como fonte da verdade
-    ml_accounts_data_from_file = load_ml_accounts()
-
-    if nickname_to_set and nickname_to_set in ml_accounts_data_from_file:
-        acc_data_to_activate = ml_accounts_data_from_file[nickname_to_set].copy()
-        token_needs_refresh = not acc_data_to_activate.get('access_token') or \
-                              not acc_data_to_activate.get('expires_at') or \
-                              time.time() >= acc_data_to_activate.get('expires_at', 0)
-
-        if token_needs_refresh and acc_data_to_activate.get('refresh_token'):
-            print(f"API Set Active: Token para '{nickname_to_set}' precisa de refresh, tentando...")
-            new_token_info = refresh_ml_token(acc_data_to_activate.get('refresh_token'))
-            if new_token_info:
-                acc_data_to_activate.update(new_token_info)
-                if not acc_data_to_activate.get('seller_id') and new_token_info.get('access_token'):
-                    user_info = get_ml_user_info(new_token_info['access_token'])
-                    if user_info and user_info.get("id"):
-                        acc_data_to_activate['seller_id'] = str(user_info.get("id"))
-                ml_accounts_data_from_file[nickname_to_set] = acc_data_to_activate # Atualiza no dict
-                save_ml_accounts(ml_accounts_data_from_file) # Salva todas as contas no arquivo
-                session['ml_accounts'] = ml_accounts_data_from_file # Atualiza a sessão com todas
-            else:
-                # Token não pôde ser renovado, mas a conta ainda pode ser "ativa" na UI,
-                # embora as chamadas de API falharão.
-                # O frontend deve mostrar o status de token inválido.
-                session['active_ml_account_nickname'] = nickname_to_set # Seta como ativa
-                session['ml_accounts'] = ml_accounts_data_from_file # Garante que a sessão tem os dados mais recentes do arquivo
-                return jsonify({
-                    "warning": f"Conta {nickname_to_set} ativada, mas FALHA ao renovar token. API calls podem falhar.",
-                    "active_account_details": {
-                        "nickname": nickname_to_set,
-                        "seller_id": acc_data_to_activate.get('seller_id'),
-                        "shipping_mode": acc_data_to_activate.get('shipping_mode', 'me2'),
-                        "token_valid": False # Indica que o token não é válido
-                    }
-                }), 200 # Retorna 200 mas com aviso
-        
+
+    if nickname_to_set and ml_token_broker.has_account(nickname_to_set):
+        # Só vai à rede se o token já expirou (refresh único por conta, via broker)
+        _, _, error_token = ml_token_broker.get_token(nickname_to_set, need_seller_id=False)
+        acc_data_to_activate = ml_token_broker.get_account(nickname_to_set)
         session['active_ml_account_nickname'] = nickname_to_set
-        session['ml_accounts'] = ml_accounts_data_from_file # Garante que a sessão tem os dados mais recentes do arquivo
+
+        if error_token:
+            # Token não pôde ser renovado, mas a conta ainda pode ser "ativa" na UI,
+            # embora as chamadas de API falharão.
+            # O frontend deve mostrar o status de token inválido.
+            return jsonify({
+                "warning": f"Conta {nickname_to_set} ativada, mas FALHA ao renovar token. API calls podem falhar.",
+                "active_account_details": {
+                    "nickname": nickname_to_set,
+                    "seller_id": acc_data_to_activate.get('seller_id'),
+                    "shipping_mode": acc_data_to_activate.get('shipping_mode', 'me2'),
+                    "token_valid": False # Indica que o token não é válido
+                }
+            }), 200 # Retorna 200 mas com aviso
 
         return jsonify({
             "success": True,
@@ -357,9 +339,7 @@ def api_set_active_ml_account_handler():
                 "nickname": nickname_to_set,
                 "seller_id": acc_data_to_activate.get('seller_id'),
                 "shipping_mode": acc_data_to_activate.get('shipping_mode', 'me2'),
-                "token_valid": bool(acc_data_to_activate.get('access_token') and \
-                                    acc_data_to_activate.get('expires_at') and \
-                                    time.time() < acc_data_to_activate.get('expires_at',0))
+                "token_valid": ml_token_broker.is_token_valid(nickname_to_set)
             }
         })
     return jsonify({"error": "Nickname inválido ou conta não encontrada para ativar."}), 400
@@ -404,16 +384,10 @@ def oauth_ml_callback_route():
 
     new_account_info = result.get("account_data")
     if new_account_info and new_account_info.get("nickname"):
-        # Carrega contas existentes, adiciona/atualiza a nova, e salva
-        ml_accounts = load_ml_accounts() # Carrega do arquivo
-        ml_accounts[new_account_info['nickname']] = new_account_info
-        save_ml_accounts(ml_accounts)
-
-        # Se o usuário estiver logado na aplicação Flask, atualiza a sessão Flask
-        if 'logged_in_user' in session:
-            session['ml_accounts'] = ml_accounts
-            # Opcional: definir esta nova conta como ativa na sessão
-            # session['active_ml_account_nickname'] = new_account_info['nickname']
+        # Adiciona/atualiza a conta no broker (memória + arquivo)
+        ml_token_broker.upsert_account(new_account_info)
+        # Opcional: definir esta nova conta como ativa na sessão
+        # session['active_ml_account_nickname'] = new_account_info['nickname']
         
         return render_template("oauth_success.html", account_name=new_account_info['nickname'])
     else:
@@ -462,11 +436,42 @@ def api_ml_suggest_category_route():
         
     return jsonify(result)
 
+
+ML_PREDICTION_BATCH_MAX_TITLES = int(os.environ.get('ML_PREDICTION_BATCH_MAX_TITLES', 1000))
+ML_PREDICTION_MAX_CANDIDATES = 10
+
+
+@app.route('/api/ml/suggest-category/batch', methods=['POST'])
+@login_required
+def api_ml_suggest_category_batch_route():
+    """Recebe {"titles": [...], "limit": 3} e devolve as categorias candidatas de cada título, na mesma ordem."""
+    data = request.get_json(silent=True) or {}
+    titles = data.get('titles')
+    if not isinstance(titles, list) or not titles:
+        return jsonify({"error_message": "Informe 'titles' (lista de títulos)."}), 400
+    if len(titles) > ML_PREDICTION_BATCH_MAX_TITLES:
+        return jsonify({"error_message": f"Máximo de {ML_PREDICTION_BATCH_MAX_TITLES} títulos por lote."}), 400
+    try:
+        limit = min(max(int(data.get('limit', 3)), 1), ML_PREDICTION_MAX_CANDIDATES)
+    except (TypeError, ValueError):
+        return jsonify({"error_message": "'limit' deve ser um número inteiro."}), 400
+
+    access_token, _, error_token = _get_active_ml_token_from_session_and_refresh()
+    if error_token:
+        return jsonify({"error_message": error_token}), 401
+
+    results = predict_categories_batch_logic([str(t) if t is not None else '' for t in titles], access_token, limit)
+    return jsonify({"limit": limit, "results": results})
+
 @app.route('/api/ml/categories', methods=['GET'])
 @app.route('/api/ml/categories/<category_id>', methods=['GET'])
 @login_required
 def api_ml_get_categories_route(category_id=None):
     print(f"API_ROUTE: /api/ml/categories - ID: {category_id}") # LOG
+    tree = ml_category_tree.get_tree()
+    if tree is not None and (category_id is None or category_id in tree): # Snapshot local: sem token nem rede
+        return jsonify(tree.children(category_id) if category_id else tree.roots())
+
     access_token, _, error_token = _get_active_ml_token_from_session_and_refresh()
     if error_token: return jsonify({"error_message": error_token}), 401
     
@@ -480,7 +485,11 @@ def api_ml_get_categories_route(category_id=None):
 def api_ml_search_categories_route():
     query = request.args.get('q')
     if not query or len(query) < 3: return jsonify({"error_message": "Busca deve ter > 2 chars."}), 400
-    
+
+    local_results = search_categories_locally(query)
+    if local_results: # Índice local; a API só é consultada quando ele não acha nada
+        return jsonify(local_results)
+
     access_token, _, error_token = _get_active_ml_token_from_session_and_refresh()
     if error_token: return jsonify({"error_message": error_token}), 401
     
@@ -497,19 +506,48 @@ def api_ml_search_categories_route():
 def api_ml_get_category_attributes_route(category_id):
     access_token, _, error_token = _get_active_ml_token_from_session_and_refresh()
     if error_token: return jsonify({"error_message": error_token, "attributes": []}), 401 # Envia lista vazia em erro de token
-    
-    result = get_ml_category_attributes_logic(category_id, access_token) # de utils/ml_api_service.py
-    
-    # LOG PARA VER O QUE get_ml_category_attributes_logic RETORNOU
-    print(f"DEBUG APP.PY - Resultado de get_ml_category_attributes_logic para {category_id}: {json.dumps(result, indent=2, ensure_ascii=False)}")
 
-    if result.get("error_message"): 
+    slim = request.args.get('view') == 'slim' # Só os campos que a Ficha Técnica renderiza
+    result = get_ml_category_attributes_logic(category_id, access_token, slim=slim) # de utils/ml_api_service.py
+    if result.get("error_message"):
         return jsonify({"error_message": result.get("error_message"), "attributes": []}), 500
-    
-    # Garante que sempre retorna uma lista de atributos no campo 'attributes'
-    # A função get_ml_category_attributes_logic já deve retornar {"error": False, "attributes": attributes_data}
-    return jsonify(result.get("attributes", [])), 200 # Retorna a lista diretamente
 
+    # A lista de atributos vai direto no corpo (é o que o frontend espera)
+    response = jsonify(result.get("attributes", []))
+    response.headers['Cache-Control'] = f'private, max-age={min(ATTRIBUTE_CACHE_TTL_SECONDS, 3600)}'
+    return response, 200
+
+
+def _known_attribute_categories():
+    """Categorias do catálogo: as já precificadas (tabela de tarifas) e as que já têm atributos em cache."""
+    return list(dict.fromkeys(fee_schedule_category_ids(app.config['ML_SITE_ID']) + cached_category_ids()))
+
+
+@app.route('/api/ml/category-attributes/prewarm', methods=['POST'])
+@login_required
+def api_ml_prewarm_category_attributes_route():
+    """Pré-carrega os atributos das categorias informadas (ou de todas as conhecidas) no cache local."""
+    access_token, _, error_token = _get_active_ml_token_from_session_and_refresh()
+    if error_token: return jsonify({"error_message": error_token}), 401
+    category_ids = (request.get_json(silent=True) or {}).get('category_ids') or _known_attribute_categories()
+    if not isinstance(category_ids, list):
+        return jsonify({"error_message": "category_ids deve ser uma lista."}), 400
+    result = prewarm_category_attributes_logic([str(c) for c in category_ids], access_token)
+    if result.get("error_message"):
+        return jsonify(result), 500
+    return jsonify({"categories": len(category_ids), **result})
+
+
+def _prewarm_known_category_attributes():
+    access_token = _any_ml_access_token()
+    if access_token:
+        with app.app_context():
+            prewarm_category_attributes_logic(_known_attribute_categories(), access_token)
+
+
+# Depois da subida (na thread da árvore de categorias, não na importação), deixa a Ficha
+# Técnica das categorias do catálogo pronta no cache
+ml_category_tree.run_once_in_background(_prewarm_known_category_attributes)
 
 # == OpenAI (ChatGPT) ==
 @app.route('/api/ml/generate-description-chatgpt', methods=['POST'])
@@ -518,103 +556,103 @@ def api_ml_generate_description_chatgpt_route():
     data = request.json; title = data.get('title'); current_description = data.get('current_description', '')
     if not title: return jsonify({"error_message": "Título é necessário."}), 400
     
-    app_cfg = session.get('app_config', {}); openai_api_key = app_cfg.get('chatgpt_api_key')
+    openai_api_key = get_app_config().chatgpt_api_key
     if not openai_api_key: return jsonify({"error_message": "Chave API OpenAI não configurada."}), 400
     
-    model_to_use = current_app.config.get('CHATGPT_MODEL_NAME_APP', 'gpt-4o-mini') # Pega do app.config
+    model_to_use = app.config.get('CHATGPT_MODEL_NAME_APP', 'gpt-4o-mini') # Pega do app.config
     result = generate_description_with_chatgpt(title, current_description, openai_api_key, model_to_use)
     
     if result.get("error"): return jsonify({"error_message": result.get("message")}), 500
     return jsonify({"new_description_html": result.get("new_description_html")})
 
 # == Mercado Livre - SKU Check ==
+# Limite por conta: no máximo 2 checagens/s por conta ML (rajada de 4), mesmo com várias abas/usuários
+sku_check_rate_limiter = KeyedRateLimiter(rate=2, capacity=4)
+
+def _check_sku_for_account(nickname, sku_to_check):
+    access_token, seller_id, error_token = ml_token_broker.get_token(nickname)
+    if error_token:
+        return {"error": error_token}
+    sku_check_rate_limiter.acquire(nickname)
+    return check_sku_on_ml_account_logic(sku_to_check, access_token, seller_id)
+
+
 @app.route('/api/ml/check-sku-status', methods=['POST'])
 @login_required
 def api_ml_check_sku_status_route():
     data = request.json; sku_to_check = data.get('sku')
     if not sku_to_check: return jsonify({"error_message": "SKU não fornecido."}), 400
-    
-    ml_accounts_session_copy = session.get('ml_accounts', {}).copy();
-    sku_check_results = {};
-    accounts_data_changed_by_refresh = False # Flag para salvar ml_accounts se houver refresh
+    stream_results = bool(data.get('stream')) or request.args.get('stream') == '1'
 
-    if not ml_accounts_session_copy:
+    ml_account_nicknames = list(ml_token_broker.list_accounts().keys())
+    if not ml_account_nicknames:
         return jsonify({"message": "Nenhuma conta ML configurada para verificação."})
 
-    for nickname, acc_data_orig in ml_accounts_session_copy.items():
-        access_token_for_sku_check = acc_data_orig.get('access_token');
-        seller_id_for_sku_check = acc_data_orig.get('seller_id')
-        token_expired_or_missing = not access_token_for_sku_check or \
-                                   time.time() >= acc_data_orig.get('expires_at', 0)
-
-        if token_expired_or_missing and acc_data_orig.get('refresh_token'):
-            print(f"API SKU Check: Token para {nickname} expirado, tentando refresh...")
-            new_token_info = refresh_ml_token(acc_data_orig.get('refresh_token'))
-            if new_token_info:
-                acc_data_orig.update(new_token_info)
-                if not acc_data_orig.get('seller_id') and new_token_info.get('access_token'):
-                    user_info = get_ml_user_info(new_token_info['access_token'])
-                    if user_info and user_info.get("id"):
-                        acc_data_orig['seller_id'] = str(user_info.get("id"))
-                
-                # Atualiza a cópia principal que será salva no final
-                ml_accounts_session_copy[nickname] = acc_data_orig
-                access_token_for_sku_check = acc_data_orig.get('access_token')
-                seller_id_for_sku_check = acc_data_orig.get('seller_id')
-                accounts_data_changed_by_refresh = True
-            else:
-                sku_check_results[nickname] = {"error": "Falha ao renovar token."}; continue
-        
-        if not seller_id_for_sku_check and access_token_for_sku_check : # Se ainda não tem seller_id e tem token válido
-            user_info_data = get_ml_user_info(access_token_for_sku_check)
-            if user_info_data and user_info_data.get("id"):
-                seller_id_for_sku_check = str(user_info_data.get("id"))
-                ml_accounts_session_copy[nickname]['seller_id'] = seller_id_for_sku_check
-                accounts_data_changed_by_refresh = True
-            else:
-                sku_check_results[nickname] = {"error": "Falha ao obter Seller ID."}; continue
-        
-        if not access_token_for_sku_check or not seller_id_for_sku_check:
-            sku_check_results[nickname] = {"error": "Token ou Seller ID ausente para esta conta."}; continue
-
-        sku_check_results[nickname] = check_sku_on_ml_account_logic(sku_to_check, access_token_for_sku_check, seller_id_for_sku_check)
-        time.sleep(0.1) # Pequena pausa entre chamadas de API para diferentes contas
+    # Todas as contas em paralelo (pool limitado), em vez de uma após a outra
+    tasks = {nickname: (_check_sku_for_account, (nickname, sku_to_check)) for nickname in ml_account_nicknames}
+    results_iter = run_keyed_tasks(
+        get_executor('ml-accounts', ML_ACCOUNTS_MAX_WORKERS), app, tasks,
+        on_error=lambda nick, e: {"error": True, "found": False, "items": [], "message": f"Erro inesperado ao verificar SKU: {str(e)[:100]}"}
+    )
 
-    if accounts_data_changed_by_refresh:
-        save_ml_accounts(ml_accounts_session_copy) # Salva no arquivo
-        session['ml_accounts'] = ml_accounts_session_copy # Atualiza a sessão Flask
+    if stream_results:
+        # NDJSON: uma linha por conta assim que ela termina
+        def generate_ndjson():
+            for nickname, result in results_iter:
+                yield json.dumps({"account": nickname, "result": result}, ensure_ascii=False) + "\n"
+        return Response(generate_ndjson(), mimetype='application/x-ndjson')
 
-    return jsonify(sku_check_results)
+    sku_check_results = dict(results_iter)
+    return jsonify({nickname: sku_check_results[nickname] for nickname in ml_account_nicknames})
 
 # == Processamento de Imagem ==
+IMAGE_PROCESS_MAX_WORKERS = int(os.environ.get('IMAGE_PROCESS_MAX_WORKERS', os.cpu_count() or 1))
+ML_IMAGE_BATCH_MAX_WORKERS = int(os.environ.get('ML_IMAGE_BATCH_MAX_WORKERS', 16)) # Downloads/uploads simultâneos
+ML_IMAGE_BATCH_MAX_IMAGES = int(os.environ.get('ML_IMAGE_BATCH_MAX_IMAGES', 500))
+
+def _optimize_image_in_process_pool(image_bytes):
+    """Decodificação/redimensionamento/codificação num processo separado (fora do GIL do servidor)."""
+    executor = get_process_executor('image-cpu', IMAGE_PROCESS_MAX_WORKERS, preload_modules=['utils.image_processing_logic'])
+    try:
+        return executor.submit(optimize_image_bytes, image_bytes).result()
+    except BrokenProcessPool:
+        discard_process_executor('image-cpu', executor)
+        return {"error": True, "message": "Processo de imagem interrompido (memória insuficiente?). Tente novamente."}
+
 @app.route('/api/image/optimize', methods=['POST'])
 @login_required
 def api_image_optimize_route():
     data = request.json; image_url = data.get('imageUrl')
     if not image_url: return jsonify({"error_message": "URL da imagem não fornecida."}), 400
     
-    app_cfg = session.get('app_config', {}); imgur_client_id = app_cfg.get('imgur_client_id')
-    # result_processing já é um dict com "error", "message", "image_bytes"
-    result_processing = process_optimize_image_logic(image_url)
-    
-    if result_processing.get("error"):
-        return jsonify({"error_message": result_processing["message"]}), 500
-
-    optimized_bytes = result_processing.get("image_bytes"); public_url = None; service_used = "N/A"
-    if optimized_bytes:
-        if imgur_client_id:
-            public_url = _upload_to_imgur(optimized_bytes, imgur_client_id)
-        if public_url:
-            service_used = "Imgur"
-        else: # Fallback para 0x0.st
-            public_url = _upload_to_0x0st(optimized_bytes, f"opt_{int(time.time())}.jpg")
-            service_used = "0x0.st" if public_url else "Falha Upload"
-        
-        if public_url:
-            return jsonify({"success": True, "newUrl": public_url, "service_used": service_used})
-        return jsonify({"error_message": "Imagem otimizada, mas falha ao hospedar."}), 500 # Erro se upload falhou
-    
-    return jsonify({"error_message": "Falha ao obter bytes otimizados da imagem."}), 500
+    result = _process_and_host_image(image_url, 'optimize', OPTIMIZE_IMAGE_PARAMS, _optimize_image_in_process_pool, 'jpg',
+                                     ml_nickname=session.get('active_ml_account_nickname'))
+    if result.get("error"):
+        return jsonify({"error_message": result.get("message") or "Falha ao obter bytes otimizados da imagem."}), 500
+    if result["public_url"]:
+        return jsonify({"success": True, "newUrl": result["public_url"], "pictureId": result["picture_id"], "service_used": result["service_used"], "cached": result["cached"]})
+    return jsonify({"error_message": "Imagem otimizada, mas falha ao hospedar."}), 500 # Erro se upload falhou
+
+
+REMOVEBG_MONTHLY_FREE_CREDITS = 50
+
+def _remove_background_charging_credits(image_bytes, removebg_api_key):
+    """Remove.bg com controle dos créditos do mês (só é chamado quando a imagem não está no cache)."""
+    # Verifica créditos ANTES de chamar a API externa
+    # (A lógica de crédito no Remove.bg pode ser mais complexa, esta é uma simplificação)
+    if get_app_config().removebg_credits_used_month >= REMOVEBG_MONTHLY_FREE_CREDITS: # Limite mensal gratuito
+        return {"error": True, "message": "Créditos Remove.bg esgotados para este mês.", "credits_charged": 0, "credits_exhausted": True}
+    result_processing = remove_background_bytes(image_bytes, removebg_api_key)
+    credits_charged_api = result_processing.get("credits_charged", 0)
+    if credits_charged_api > 0:
+        app_cfg = get_app_config() # Relê: outra requisição pode ter consumido créditos
+        credits_used_month = app_cfg.removebg_credits_used_month + credits_charged_api
+        current_month_year_str = time.strftime("%m-%Y")
+        if app_cfg.removebg_last_reset_month_year != current_month_year_str:
+            credits_used_month = credits_charged_api # Reseta se mudou o mês
+        update_app_config(removebg_credits_used_month=credits_used_month,
+                          removebg_last_reset_month_year=current_month_year_str)
+    return result_processing
 
 
 @app.route('/api/image/remove-background', methods=['POST'])
@@ -623,204 +661,329 @@ def api_image_remove_background_route():
     data = request.json; image_url = data.get('imageUrl')
     if not image_url: return jsonify({"error_message": "URL da imagem não fornecida."}), 400
     
-    app_cfg_session_copy = session.get('app_config', {}).copy() # Trabalha com cópia
-    removebg_api_key = app_cfg_session_copy.get('removebg_api_key')
-    imgur_client_id = app_cfg_session_copy.get('imgur_client_id')
-
+    removebg_api_key = get_app_config().removebg_api_key
     if not removebg_api_key:
         return jsonify({"error_message": "Chave API Remove.bg não configurada."}), 400
-    
-    # Verifica créditos ANTES de chamar a API externa, se possível
-    # (A lógica de crédito no Remove.bg pode ser mais complexa, esta é uma simplificação)
-    current_credits_used = app_cfg_session_copy.get('removebg_credits_used_month', 0)
-    if current_credits_used >= 50: # Limite mensal gratuito
-        return jsonify({"error_message": "Créditos Remove.bg esgotados para este mês.", "credits_charged": 0}), 429 # Too Many Requests
 
-    result_processing = process_remove_background_logic(image_url, removebg_api_key)
-    credits_charged_api = result_processing.get("credits_charged", 0)
+    remove_background = lambda image_bytes: _remove_background_charging_credits(image_bytes, removebg_api_key)
+    result = _process_and_host_image(image_url, 'remove_background', REMOVE_BACKGROUND_PARAMS, remove_background, 'png',
+                                     ml_nickname=session.get('active_ml_account_nickname'))
+    credits_charged_api = result.get("credits_charged", 0)
+    if result.get("error"):
+        status_code = 429 if result.get("credits_exhausted") else 500 # Too Many Requests
+        return jsonify({"error_message": result.get("message") or "Falha ao obter bytes processados do Remove.bg.", "credits_charged": credits_charged_api}), status_code
+    if result["public_url"]:
+        return jsonify({"success": True, "newUrl": result["public_url"], "pictureId": result["picture_id"], "service_used": result["service_used"], "credits_charged": credits_charged_api, "cached": result["cached"]})
+    # Se o upload falhou, mas o processamento RemoveBG funcionou (o resultado fica no cache para a próxima tentativa)
+    return jsonify({
+        "error_message": "Fundo removido, mas falha ao hospedar.",
+        "service_used": "Local (Upload Falhou)", # Indica que o processamento local (RemoveBG) funcionou
+        "credits_charged": credits_charged_api,
+    }), 200 # Retorna 200 OK, mas com um status que o frontend pode interpretar
+
+
+def _batch_image_result(image_url, operation, image_flights, removebg_api_key, ml_nickname):
+    if not isinstance(image_url, str) or not image_url.startswith(('http://', 'https://')):
+        return {"error_message": "URL da imagem inválida."}
+    if operation == 'remove_background':
+        remove_background = lambda image_bytes: _remove_background_charging_credits(image_bytes, removebg_api_key)
+        operation_args = (REMOVE_BACKGROUND_PARAMS, remove_background, 'png')
+    else:
+        operation_args = (OPTIMIZE_IMAGE_PARAMS, _optimize_image_in_process_pool, 'jpg')
+    # A mesma URL repetida no lote é processada uma vez só
+    result = image_flights.do(image_url, _process_and_host_image, image_url, operation, *operation_args, ml_nickname=ml_nickname)
+    if result.get("error"):
+        return {"error_message": result.get("message"), "credits_charged": result.get("credits_charged", 0)}
+    if not result["public_url"]:
+        return {"error_message": "Imagem processada, mas falha ao hospedar.", "credits_charged": result.get("credits_charged", 0)}
+    return {"success": True, "newUrl": result["public_url"], "pictureId": result["picture_id"], "service_used": result["service_used"],
+            "cached": result["cached"], "credits_charged": result.get("credits_charged", 0)}
 
-    if credits_charged_api > 0:
-        app_cfg_session_copy['removebg_credits_used_month'] = app_cfg_session_copy.get('removebg_credits_used_month', 0) + credits_charged_api
-        current_month_year_str = time.strftime("%m-%Y")
-        if app_cfg_session_copy.get('removebg_last_reset_month_year') != current_month_year_str:
-            app_cfg_session_copy['removebg_credits_used_month'] = credits_charged_api # Reseta se mudou o mês
-            app_cfg_session_copy['removebg_last_reset_month_year'] = current_month_year_str
-        save_app_config(app_cfg_session_copy) # Salva no arquivo
-        session['app_config'] = app_cfg_session_copy # Atualiza sessão
-
-    if result_processing.get("error"):
-        return jsonify({"error_message": result_processing["message"], "credits_charged": credits_charged_api}), 500
-
-    processed_bytes = result_processing.get("image_bytes"); public_url = None; service_used = "N/A"
-    if processed_bytes:
-        if imgur_client_id:
-            public_url = _upload_to_imgur(processed_bytes, imgur_client_id)
-        if public_url:
-            service_used = "Imgur"
-        else: # Fallback para 0x0.st
-            public_url = _upload_to_0x0st(processed_bytes, f"rbg_processed_{int(time.time())}.png") # Salva como PNG
-            service_used = "0x0.st" if public_url else "Falha Upload"
-        
-        if public_url:
-            return jsonify({"success": True, "newUrl": public_url, "service_used": service_used, "credits_charged": credits_charged_api})
-        # Se o upload falhou, mas o processamento RemoveBG funcionou
-        return jsonify({
-            "error_message": "Fundo removido, mas falha ao hospedar.",
-            "service_used": "Local (Upload Falhou)", # Indica que o processamento local (RemoveBG) funcionou
-            "credits_charged": credits_charged_api,
-            # "image_data_b64": base64.b64encode(processed_bytes).decode('utf-8') # Opcional: enviar bytes para o frontend exibir localmente
-        }), 200 # Retorna 200 OK, mas com um status que o frontend pode interpretar
-    
-    return jsonify({"error_message": "Falha ao obter bytes processados do Remove.bg."}), 500
+
+@app.route('/api/image/batch', methods=['POST'])
+@login_required
+def api_image_batch_route():
+    """
+    Processa várias imagens (todas as fotos de um anúncio ou de vários SKUs) de uma vez:
+    downloads e uploads em paralelo, redimensionamento num pool de processos, e cada
+    resultado volta em NDJSON assim que fica pronto.
+    Corpo: {"operation": "optimize" | "remove_background", "images": [{"imageUrl", "sku"} ou "url", ...]}
+    """
+    data = request.get_json(silent=True) or {}
+    operation = data.get('operation', 'optimize')
+    images = data.get('images')
+    if operation not in ('optimize', 'remove_background'):
+        return jsonify({"error_message": "Operação inválida (use optimize ou remove_background)."}), 400
+    if not isinstance(images, list) or not images:
+        return jsonify({"error_message": "Informe 'images' (lista de URLs)."}), 400
+    if len(images) > ML_IMAGE_BATCH_MAX_IMAGES:
+        return jsonify({"error_message": f"Máximo de {ML_IMAGE_BATCH_MAX_IMAGES} imagens por lote."}), 400
+    removebg_api_key = get_app_config().removebg_api_key if operation == 'remove_background' else None
+    if operation == 'remove_background' and not removebg_api_key:
+        return jsonify({"error_message": "Chave API Remove.bg não configurada."}), 400
+
+    ml_nickname = session.get('active_ml_account_nickname') # As tarefas rodam fora da requisição (sem sessão)
+    image_flights = SingleFlight()
+    def iter_tasks():
+        for index, image in enumerate(images):
+            image_url, sku = (image.get('imageUrl'), image.get('sku')) if isinstance(image, dict) else (image, None)
+            yield (index, image_url, sku), (image_url, operation, image_flights, removebg_api_key, ml_nickname)
+
+    results_iter = bounded_map_unordered(
+        get_executor('image-batch', ML_IMAGE_BATCH_MAX_WORKERS), app,
+        _batch_image_result, iter_tasks(), max_in_flight=ML_IMAGE_BATCH_MAX_WORKERS,
+        on_error=lambda key, e: {"error_message": f"Erro inesperado no processamento: {str(e)[:150]}"}
+    )
+    def generate_ndjson():
+        for (index, image_url, sku), result in results_iter:
+            yield json.dumps({"index": index, "imageUrl": image_url, "sku": sku, "result": result}, ensure_ascii=False) + "\n"
+    return Response(generate_ndjson(), mimetype='application/x-ndjson')
 
 
 # == Mercado Livre - Cálculo de Preços ==
+ML_PRICE_QUOTE_TIMEOUT_SECONDS = float(os.environ.get('ML_PRICE_QUOTE_TIMEOUT_SECONDS', 20))
+
+PRICE_QUOTE_REQUIRED_FIELDS = ['cost_price', 'desired_profit', 'profit_type', 'product_category_id']
+
+def _quote_prices_for_account(nickname, quote_request, shipping_simulations):
+    account_data = ml_token_broker.get_account(nickname)
+    if not account_data:
+        return {"error": "Conta ML não encontrada."}
+    access_token, seller_id, error_token = ml_token_broker.get_token(nickname)
+    if error_token:
+        return {"error": error_token}
+    return quote_prices_for_account(
+        quote_request, account_data.get('shipping_mode', 'me2'),
+        access_token, seller_id, shipping_simulations
+    )
+
+
 @app.route('/api/ml/calculate-prices', methods=['POST'])
 @login_required
 def api_ml_calculate_prices_route():
     data_from_frontend = request.json
     print(f"API Calculate Prices: Recebido: {json.dumps(data_from_frontend, indent=2)}")
 
-    required_fields = ['cost_price', 'desired_profit', 'profit_type', 'product_category_id', 'selected_ml_accounts']
-    for field in required_fields:
+    for field in PRICE_QUOTE_REQUIRED_FIELDS + ['selected_ml_accounts']:
         if field not in data_from_frontend or data_from_frontend[field] is None:
              if field == 'desired_profit' and data_from_frontend.get(field) == 0: pass
              else: return jsonify({"error_message": f"Campo obrigatório ausente ou inválido: {field}"}), 400
     if not data_from_frontend['selected_ml_accounts']:
         return jsonify({"error_message": "Nenhuma conta ML selecionada para cálculo."}), 400
 
-    all_results = {}
-    # Trabalhar com cópias da sessão para evitar modificar a sessão diretamente durante o loop
-    ml_accounts_session_copy = session.get('ml_accounts', {}).copy()
-    app_config_data = session.get('app_config', {}) # Usado para taxa de antecipação
-
-    cost_price_base = float(data_from_frontend['cost_price'])
-    if data_from_frontend.get('apply_discount_10'):
-        cost_price_base *= 0.90
-
-    for acc_nick in data_from_frontend['selected_ml_accounts']:
-        if acc_nick not in ml_accounts_session_copy:
-            all_results[acc_nick] = {"error": "Conta ML não encontrada na sessão."}
-            continue
-
-        account_data_loop = ml_accounts_session_copy[acc_nick].copy() # Cópia dos dados da conta
-        access_token = account_data_loop.get('access_token')
-        seller_id = account_data_loop.get('seller_id')
-        shipping_mode = account_data_loop.get('shipping_mode', 'me2')
-        token_expired_loop = not access_token or time.time() >= account_data_loop.get('expires_at', 0)
-
-        if token_expired_loop and account_data_loop.get('refresh_token'):
-            print(f"Calculo Preços: Token para {acc_nick} expirado, tentando refresh...")
-            new_token_info_loop = refresh_ml_token(account_data_loop.get('refresh_token'))
-            if new_token_info_loop:
-                account_data_loop.update(new_token_info_loop)
-                if not account_data_loop.get('seller_id') and new_token_info_loop.get('access_token'):
-                    user_info_loop = get_ml_user_info(new_token_info_loop['access_token'])
-                    if user_info_loop and user_info_loop.get("id"):
-                        account_data_loop['seller_id'] = str(user_info_loop.get("id"))
-                
-                # Atualiza o dict principal que será salvo no arquivo e na sessão depois do loop
-                ml_accounts_session_copy[acc_nick] = account_data_loop
-                access_token = account_data_loop.get('access_token')
-                seller_id = account_data_loop.get('seller_id')
-            else:
-                all_results[acc_nick] = {"error": f"Falha ao renovar token para {acc_nick}."}
-                continue
-        
-        if not seller_id and access_token : # Se ainda não tem seller_id e tem token válido
-            user_info_sid_loop = get_ml_user_info(access_token)
-            if user_info_sid_loop and user_info_sid_loop.get("id"):
-                seller_id = str(user_info_sid_loop.get("id"))
-                ml_accounts_session_copy[acc_nick]['seller_id'] = seller_id
-            else:
-                 all_results[acc_nick] = {"error": f"Falha ao obter Seller ID para {acc_nick}."}
-                 continue
-        
-        if not access_token or not seller_id: # Checagem final pós-refresh/fetch de seller_id
-             all_results[acc_nick] = {"error": f"Token ou Seller ID inválido para {acc_nick} após tentativas."}
-             continue
-
+    quote_request = build_quote_request(data_from_frontend)
+    selected_accounts = list(dict.fromkeys(data_from_frontend['selected_ml_accounts']))
+
+    # Contas em paralelo (pool limitado); conta lenta não segura as demais além do timeout.
+    # Sem SingleFlight aqui: a simulação de frete é por vendedor e cada conta aparece uma vez
+    tasks = {nick: (_quote_prices_for_account, (nick, quote_request, None)) for nick in selected_accounts}
+    all_results = dict(run_keyed_tasks(
+        get_executor('ml-accounts', ML_ACCOUNTS_MAX_WORKERS), app, tasks,
+        timeout=ML_PRICE_QUOTE_TIMEOUT_SECONDS,
+        on_error=lambda nick, e: {"error": f"Erro inesperado no cálculo: {str(e)[:150]}"}
+    ))
+    for nick in selected_accounts:
+        if all_results.get(nick) is None:
+            all_results[nick] = {"error": f"Tempo esgotado ({ML_PRICE_QUOTE_TIMEOUT_SECONDS:g}s) ao calcular para esta conta."}
+
+    return jsonify({nick: all_results[nick] for nick in selected_accounts})
+
+
+# == Mercado Livre - Cálculo de Preços em Lote ==
+ML_BATCH_PRICING_MAX_WORKERS = int(os.environ.get('ML_BATCH_PRICING_MAX_WORKERS', 4))
+ML_BATCH_PRICING_MAX_ROWS = int(os.environ.get('ML_BATCH_PRICING_MAX_ROWS', 20000))
+BATCH_PRICING_SPOOL_MAX_MEMORY_BYTES = 1024 * 1024 # CSV do lote acima disso vai para arquivo temporário em disco
+BATCH_PRICING_CSV_COLUMNS = ['row', 'sku', 'account', 'classic_price', 'premium_price', 'shipping_final_cost', 'classic_fees_info', 'premium_fees_info', 'error']
+_BATCH_NUMERIC_FIELDS = ['cost_price', 'desired_profit', 'height', 'width', 'length', 'weight_kg']
+_BATCH_BOOLEAN_FIELDS = ['offer_free_shipping', 'apply_discount_10', 'include_anticipation_fee', 'publish_classic', 'publish_premium']
+
+def _batch_row_payload(row, defaults):
+    """Linha do lote (campos planos do CSV ou objeto JSON) -> payload no formato do /api/ml/calculate-prices."""
+    payload = dict(defaults)
+    payload.update({k.strip(): v for k, v in row.items() if k and v not in (None, '')})
+    if 'product_category_id' not in payload and 'category_id' in payload:
+        payload['product_category_id'] = payload['category_id']
+    for field in _BATCH_NUMERIC_FIELDS: # CSV brasileiro usa vírgula decimal
+        if isinstance(payload.get(field), str):
+            payload[field] = float(payload[field].strip().replace(',', '.'))
+    for field in _BATCH_BOOLEAN_FIELDS:
+        if isinstance(payload.get(field), str):
+            payload[field] = payload[field].strip().lower() in ('1', 'true', 'sim', 'yes', 's', 'x')
+    if isinstance(payload.get('profit_type'), str):
+        payload['profit_type'] = payload['profit_type'].strip().upper()
+    if not isinstance(payload.get('dimensions'), dict):
+        payload['dimensions'] = {k: payload[k] for k in ('height', 'width', 'length', 'weight_kg') if k in payload}
+    return payload
+
+
+def _quote_batch_row(nickname, row, defaults, shipping_simulations):
+    if not isinstance(row, dict):
+        return {"error": "Linha inválida: esperado um objeto com os campos do produto."}
+    try:
+        row_payload = _batch_row_payload(row, defaults)
+        missing = [f for f in PRICE_QUOTE_REQUIRED_FIELDS if row_payload.get(f) is None]
+        if missing:
+            return {"error": f"Linha inválida: campos ausentes {', '.join(missing)}"}
+        quote_request = build_quote_request(row_payload)
+    except (TypeError, ValueError) as e:
+        return {"error": f"Linha inválida: {str(e)[:100]}"}
+    with ml_priority(PRIORITY_BACKGROUND): # Lotes não podem atrasar as telas interativas
+        return _quote_prices_for_account(nickname, quote_request, shipping_simulations)
+
+
+def _iter_csv_rows_closing(csv_stream, first_line, delimiter):
+    """Linhas do CSV sob demanda; fecha o arquivo ao terminar (ou quando o stream é abandonado)."""
+    with csv_stream:
+        yield from csv.DictReader(itertools.chain([first_line], csv_stream), delimiter=delimiter)
+
+
+def _read_batch_pricing_input():
+    """Retorna (linhas, defaults, contas, formato). As linhas são um iterável lido sob demanda."""
+    uploaded_file = request.files.get('file')
+    if uploaded_file or (request.mimetype or '').startswith('text/'):
+        defaults = {k: v for k, v in request.values.items() if k not in ('selected_ml_accounts', 'format')}
+        accounts_param = request.values.get('selected_ml_accounts', '')
+        accounts = [nick.strip() for nick in accounts_param.split(',') if nick.strip()]
+        output_format = request.values.get('format')
+        # O upload (e o corpo) é fechado junto com a requisição, antes de o stream da resposta ler
+        # as linhas: o CSV é copiado para um arquivo temporário que passa a ser do stream
+        spooled_csv = tempfile.SpooledTemporaryFile(max_size=BATCH_PRICING_SPOOL_MAX_MEMORY_BYTES)
+        shutil.copyfileobj(uploaded_file.stream if uploaded_file else request.stream, spooled_csv)
+        spooled_csv.seek(0)
+        # Decodificado e lido linha a linha, sem carregar tudo na memória
+        csv_stream = io.TextIOWrapper(spooled_csv, encoding='utf-8-sig', newline='')
+        first_line = csv_stream.readline()
+        delimiter = ';' if first_line.count(';') > first_line.count(',') else ','
+        rows = _iter_csv_rows_closing(csv_stream, first_line, delimiter)
+    else:
+        body = request.get_json(silent=True) or {}
+        rows = body.get('rows') or []
+        defaults = {k: v for k, v in body.items() if k not in ('rows', 'selected_ml_accounts', 'format')}
+        accounts = body.get('selected_ml_accounts') or []
+        output_format = body.get('format') or request.args.get('format')
+    if not output_format:
+        output_format = 'csv' if request.accept_mimetypes.best == 'text/csv' else 'ndjson'
+    return rows, defaults, list(dict.fromkeys(accounts)), output_format.lower()
 
-        acc_result_calc = {
-            "account_shipping_mode": shipping_mode, "shipping_final_cost": 0.0,
-            "shipping_list_cost_api": 0.0, "shipping_promoted_amount_api": 0.0, "shipping_api_discount_rate": 0.0,
-            "classic_price": 0.0, "classic_fees_info": "Não calculado",
-            "premium_price": 0.0, "premium_fees_info": "Não calculado",
-            "error": None
-        }
 
-        shipping_cost_for_seller_calc = 0.0
-        if data_from_frontend.get('offer_free_shipping') and shipping_mode == 'me2':
-            dims_calc = data_from_frontend.get('dimensions', {})
-            dims_str_calc = None
-            if all(dims_calc.get(k, 0) > 0 for k in ['height', 'width', 'length', 'weight_kg']):
-                dims_str_calc = f"{int(dims_calc['height'])}x{int(dims_calc['width'])}x{int(dims_calc['length'])},{int(dims_calc['weight_kg'] * 1000)}"
-            
-            zip_calc = data_from_frontend.get('origin_zip')
-            if dims_str_calc and zip_calc:
-                # Estimativa de preço para simulação de frete (melhorada)
-                profit_val_for_est = float(data_from_frontend['desired_profit'])
-                if data_from_frontend['profit_type'] == 'PERCENT':
-                     profit_val_for_est = cost_price_base * (profit_val_for_est / 100.0)
-                
-                est_price_for_ship_sim_calc = (cost_price_base + profit_val_for_est + 25.0 + 6.0) / 0.83 # Denom. para Premium aprox.
-                if est_price_for_ship_sim_calc <= 0: est_price_for_ship_sim_calc = cost_price_base + profit_val_for_est + 5.0
-
-
-                shipping_sim_result_calc = simulate_ml_free_shipping_logic(
-                    access_token, seller_id, est_price_for_ship_sim_calc,
-                    "gold_pro", # Simula com premium para custo seguro
-                    data_from_frontend['product_category_id'],
-                    dims_str_calc, zip_calc
-                )
-                if not shipping_sim_result_calc.get("error"):
-                    shipping_cost_for_seller_calc = shipping_sim_result_calc.get("cost", 0.0)
-                    acc_result_calc.update({
-                        "shipping_final_cost": shipping_cost_for_seller_calc,
-                        "shipping_list_cost_api": shipping_sim_result_calc.get("list_cost_api"),
-                        "shipping_promoted_amount_api": shipping_sim_result_calc.get("promoted_amount_api"),
-                        "shipping_api_discount_rate": shipping_sim_result_calc.get("rate_api")
-                    })
-                else:
-                    acc_result_calc["error"] = f"Falha frete: {shipping_sim_result_calc.get('message')}"
-                    all_results[acc_nick] = acc_result_calc; continue
-            elif data_from_frontend.get('offer_free_shipping'):
-                 acc_result_calc["error"] = "Frete grátis sel., mas dims/CEP ausentes."
-                 all_results[acc_nick] = acc_result_calc; continue
-        
-        # Calcular para Clássico
-        if data_from_frontend.get('publish_classic', True):
-            classic_calc_res = calculate_final_price_for_listing_type(
-                cost_price_base, float(data_from_frontend['desired_profit']),
-                data_from_frontend['profit_type'] == 'PERCENT',
-                shipping_cost_for_seller_calc, data_from_frontend['product_category_id'],
-                'gold_special', access_token,
-                data_from_frontend.get('include_anticipation_fee', False)
-            )
-            acc_result_calc["classic_price"] = classic_calc_res["price"]
-            acc_result_calc["classic_fees_info"] = classic_calc_res["fees_info"]
-
-        # Calcular para Premium
-        if data_from_frontend.get('publish_premium', True):
-            premium_calc_res = calculate_final_price_for_listing_type(
-                cost_price_base, float(data_from_frontend['desired_profit']),
-                data_from_frontend['profit_type'] == 'PERCENT',
-                shipping_cost_for_seller_calc, data_from_frontend['product_category_id'],
-                'gold_pro', access_token,
-                data_from_frontend.get('include_anticipation_fee', False)
-            )
-            acc_result_calc["premium_price"] = premium_calc_res["price"]
-            acc_result_calc["premium_fees_info"] = premium_calc_res["fees_info"]
-        
-        all_results[acc_nick] = acc_result_calc
-        time.sleep(0.15)
+@app.route('/api/ml/calculate-prices/batch', methods=['POST'])
+@login_required
+def api_ml_calculate_prices_batch_route():
+    """
+    Precifica um lote de produtos (CSV ou JSON) em todas as contas selecionadas e devolve
+    cada (linha, conta) assim que termina, em NDJSON ou CSV. Paralelismo e memória são
+    limitados: as linhas são lidas sob demanda e só algumas cotações ficam em andamento.
+    """
+    try:
+        rows, defaults, selected_accounts, output_format = _read_batch_pricing_input()
+    except (UnicodeDecodeError, csv.Error) as e:
+        return jsonify({"error_message": f"Arquivo de lote inválido: {str(e)[:150]}"}), 400
+    if not selected_accounts:
+        return jsonify({"error_message": "Nenhuma conta ML selecionada para cálculo."}), 400
+    if output_format not in ('ndjson', 'csv'):
+        return jsonify({"error_message": "Formato de saída inválido (use ndjson ou csv)."}), 400
+
+    shipping_simulations = SingleFlight() # Só deduplica simulações em andamento; o resto vem do cache de frete
+    trailer_error = [None] # Problema na leitura do lote, reportado ao final do stream
+
+    def iter_tasks():
+        row_index = 0
+        try:
+            for row_index, row in enumerate(rows, start=1):
+                if row_index > ML_BATCH_PRICING_MAX_ROWS:
+                    trailer_error[0] = f"Lote truncado: limite de {ML_BATCH_PRICING_MAX_ROWS} linhas."
+                    return
+                sku = row.get('sku') if isinstance(row, dict) else None
+                for nick in selected_accounts:
+                    yield (row_index, sku, nick), (nick, row, defaults, shipping_simulations)
+        except (UnicodeDecodeError, csv.Error) as e: # O arquivo é lido durante o stream: erros viram o trailer
+            trailer_error[0] = f"CSV inválido a partir da linha {row_index}: {str(e)[:100]}"
+        except (ValueError, OSError) as e: # Falha ao ler o arquivo temporário no meio do stream
+            trailer_error[0] = f"Falha ao ler o lote a partir da linha {row_index}: {str(e)[:100]}"
+
+    results_iter = bounded_map_unordered(
+        get_executor('ml-batch-pricing', ML_BATCH_PRICING_MAX_WORKERS), app,
+        _quote_batch_row, iter_tasks(), max_in_flight=ML_BATCH_PRICING_MAX_WORKERS * 2,
+        on_error=lambda key, e: {"error": f"Erro inesperado no cálculo: {str(e)[:150]}"}
+    )
+    if output_format == 'csv':
+        def generate_csv():
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=BATCH_PRICING_CSV_COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+            for (row_index, sku, nick), result in results_iter:
+                writer.writerow({**result, "row": row_index, "sku": sku, "account": nick})
+                yield buffer.getvalue(); buffer.seek(0); buffer.truncate(0)
+            if trailer_error[0]:
+                writer.writerow({"error": trailer_error[0]})
+                yield buffer.getvalue()
+        return Response(generate_csv(), mimetype='text/csv', headers={"Content-Disposition": "attachment; filename=precos_lote.csv"})
+
+    def generate_ndjson():
+        for (row_index, sku, nick), result in results_iter:
+            yield json.dumps({"row": row_index, "sku": sku, "account": nick, "result": result}, ensure_ascii=False) + "\n"
+        if trailer_error[0]:
+            yield json.dumps({"error": trailer_error[0]}, ensure_ascii=False) + "\n"
+    return Response(generate_ndjson(), mimetype='application/x-ndjson')
+
+
+@app.route('/api/ml/rate-governor', methods=['GET'])
+@login_required
+def api_ml_rate_governor_route():
+    """Métricas do governador de tráfego do ML (429, Retry-After, novas tentativas, esperas locais)."""
+    return jsonify(ml_rate_governor.metrics())
 
-    # Após o loop, se alguma conta foi atualizada devido a refresh de token, salva no arquivo e na sessão.
-    if any(ml_accounts_session_copy[nick] != session.get('ml_accounts',{}).get(nick) for nick in ml_accounts_session_copy):
-        save_ml_accounts(ml_accounts_session_copy)
-        session['ml_accounts'] = ml_accounts_session_copy
+@app.route('/api/ml/price-grid', methods=['POST'])
+@login_required
+def api_ml_price_grid_route():
+    """Curvas de lucro/tarifa/margem para uma faixa de preços (tela Preços & Publicar), com equilíbrio e degraus."""
+    if not numpy_available():
+        return jsonify({"error_message": "NumPy não está instalado no servidor; grade de preços indisponível."}), 501
+    data = request.json or {}
+    category_id = data.get('product_category_id')
+    if not category_id or data.get('cost_price') is None:
+        return jsonify({"error_message": "Informe product_category_id e cost_price."}), 400
+    try:
+        cost_price_base = float(data['cost_price']) * (0.90 if data.get('apply_discount_10') else 1.0)
+        shipping_cost = float(data.get('shipping_cost') or 0.0)
+        price_min = float(data.get('price_min', 50.0))
+        price_max = float(data.get('price_max', 500.0))
+        price_step = float(data.get('price_step', 1.0))
+    except (TypeError, ValueError):
+        return jsonify({"error_message": "Valores numéricos inválidos."}), 400
+
+    # Qualquer conta serve para consultar tarifas (são da categoria, não do vendedor)
+    account_nick = data.get('ml_account') or next(iter(ml_token_broker.list_accounts()), None)
+    if not account_nick:
+        return jsonify({"error_message": "Nenhuma conta ML configurada."}), 400
+    access_token, _, error_token = ml_token_broker.get_token(account_nick, need_seller_id=False)
+    if error_token:
+        return jsonify({"error_message": error_token}), 401
 
-    return jsonify(all_results)
+    listing_types = [lt for lt in data.get('listing_types', ['gold_special', 'gold_pro']) if lt in ('gold_special', 'gold_pro')]
+    fee_tiers_by_type = {lt: get_fee_tiers_for_listing_type(category_id, lt, access_token) for lt in listing_types}
+    grid = evaluate_price_grid(app.config['ML_SITE_ID'], fee_tiers_by_type, cost_price_base, shipping_cost, price_min, price_max, price_step)
+    if grid.get("error"):
+        return jsonify({"error_message": grid["message"]}), 400
+    grid["fee_tiers"] = { # Faixa aberta (sem teto) vai como upper = null
+        lt: [dict(tier._asdict(), upper=None if tier.upper == float('inf') else tier.upper) for tier in tiers]
+        for lt, tiers in fee_tiers_by_type.items()
+    }
+    return jsonify(grid)
+
+@app.route('/api/ml/cache-stats', methods=['GET'])
+@login_required
+def api_ml_cache_stats_route():
+    """Acertos/erros dos caches locais de respostas do ML (tarifas, frete, atributos e previsões de categoria), GETs coalescidos e árvore de categorias."""
+    return jsonify({
+        "category_tree": ml_category_tree.stats(),
+        "category_attributes": attribute_cache_stats(),
+        "category_predictions": prediction_cache_stats(),
+        "processed_images": image_cache_stats(),
+        "fee_schedule": fee_schedule_stats(),
+        "shipping_costs": shipping_cache_stats(),
+        "coalesced_gets": ml_coalescing_stats()
+    })
 
 # Dentro de app.py
 
@@ -0,0 +1,159 @@
+# backend/benchmarks/bench_image_resize.py
+"""
+Benchmark do redimensionamento de imagens (_resize_image_to_target_logic em
+utils/image_processing_logic.py) contra a versão anterior, que fazia cópias em tamanho
+original (conversão de modo, fundo para o alfa) e o LANCZOS a partir da resolução cheia.
+
+Gera fotos sintéticas no tamanho típico de fornecedor (3000-4000px) já decodificadas,
+nos casos usados pelo app:
+  - optimize_rgb: foto RGB -> 1000x1000 JPEG com fundo branco;
+  - optimize_rgba: PNG com transparência -> 1000x1000 JPEG (alfa sobre fundo branco);
+  - optimize_palette: PNG com paleta e transparência -> 1000x1000 JPEG;
+  - removebg_rgba: PNG transparente (saída do Remove.bg) -> 1000x1000 PNG transparente.
+
+Saída em JSON: imagens por segundo de cada versão, o ganho e a diferença média por
+pixel entre os resultados (0-255; perto de zero = mesma imagem).
+
+Uso:
+    python benchmarks/bench_image_resize.py [--rounds 5] [--width 4000] [--height 3000] [--output resultado.json]
+    python benchmarks/bench_image_resize.py --min-speedup 2   # sai com 1 se algum caso ganhar menos que isso
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PIL import Image, ImageChops, ImageDraw, ImageStat
+from utils.image_processing_logic import _resize_image_to_target_logic
+
+TARGET_SIZE = (1000, 1000)
+
+
+def _legacy_resize(pil_image, target_w, target_h, add_bg=True, bg_color=(255,255,255), quality=90, img_format='JPEG'):
+    """_resize_image_to_target_logic antes da redução por fator inteiro (caminho com add_bg, o único usado pelo app)."""
+    if pil_image.mode == 'P' or pil_image.mode == 'LA':
+        pil_image = pil_image.convert("RGBA")
+    elif pil_image.mode == 'CMYK':
+        pil_image = pil_image.convert("RGB")
+    elif pil_image.mode == 'RGBA' and img_format.upper() == 'JPEG':
+        background_for_alpha = Image.new("RGB", pil_image.size, bg_color[:3])
+        background_for_alpha.paste(pil_image, (0, 0), pil_image)
+        pil_image = background_for_alpha
+    original_w, original_h = pil_image.size
+    ratio = min(target_w / original_w, target_h / original_h)
+    new_w, new_h = int(original_w * ratio), int(original_h * ratio)
+    resized_img = pil_image.resize((new_w, new_h), Image.Resampling.LANCZOS)
+    final_img_mode, actual_bg_color = "RGB", bg_color[:3]
+    if img_format.upper() == 'PNG':
+        final_img_mode = "RGBA"
+        if len(bg_color) == 4 and bg_color[3] == 0:
+            actual_bg_color = (255, 255, 255, 0)
+        elif len(bg_color) == 4:
+            actual_bg_color = bg_color
+        else:
+            actual_bg_color = (bg_color[0], bg_color[1], bg_color[2], 255)
+    final_img = Image.new(final_img_mode, (target_w, target_h), actual_bg_color)
+    paste_x, paste_y = (target_w - new_w) // 2, (target_h - new_h) // 2
+    if resized_img.mode == 'RGBA':
+        if final_img.mode == 'RGBA':
+            final_img.paste(resized_img, (paste_x, paste_y), resized_img)
+        else:
+            temp_bg = Image.new("RGB", resized_img.size, actual_bg_color)
+            temp_bg.paste(resized_img, (0, 0), resized_img)
+            final_img.paste(temp_bg, (paste_x, paste_y))
+    else:
+        final_img.paste(resized_img.convert(final_img_mode) if resized_img.mode != final_img_mode else resized_img, (paste_x, paste_y))
+    return final_img
+
+
+def _synthetic_photo(width, height):
+    """Gradiente com ruído e algumas formas: textura parecida com foto de produto, sem arquivo externo."""
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    photo = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    draw = ImageDraw.Draw(photo)
+    for i in range(12):
+        x, y = (i * 997) % width, (i * 613) % height
+        draw.ellipse((x, y, x + width // 6, y + height // 6), fill=((i * 40) % 256, 200, (i * 90) % 256))
+    return photo
+
+
+def _with_transparency(photo):
+    """Produto recortado: elipse opaca no centro, borda suave, resto transparente."""
+    width, height = photo.size
+    mask = Image.new('L', (width, height), 0)
+    ImageDraw.Draw(mask).ellipse((width // 8, height // 8, width * 7 // 8, height * 7 // 8), fill=255)
+    photo = photo.copy()
+    photo.putalpha(mask)
+    return photo
+
+
+def _build_cases(width, height):
+    photo = _synthetic_photo(width, height)
+    transparent = _with_transparency(photo)
+    palette = photo.quantize(colors=255)
+    palette.info['transparency'] = 0
+    return {
+        "optimize_rgb": (photo, {"bg_color": (255, 255, 255), "img_format": 'JPEG'}),
+        "optimize_rgba": (transparent, {"bg_color": (255, 255, 255), "img_format": 'JPEG'}),
+        "optimize_palette": (palette, {"bg_color": (255, 255, 255), "img_format": 'JPEG'}),
+        "removebg_rgba": (transparent, {"bg_color": (255, 255, 255, 0), "img_format": 'PNG'}),
+    }
+
+
+def _throughput(resize_fn, pil_image, kwargs, rounds):
+    resize_fn(pil_image, *TARGET_SIZE, **kwargs) # Aquecimento
+    started = time.perf_counter()
+    for _ in range(rounds):
+        result = resize_fn(pil_image, *TARGET_SIZE, add_bg=True, **kwargs)
+    elapsed = time.perf_counter() - started
+    return rounds / elapsed, result
+
+
+def _mean_pixel_difference(a, b):
+    if a.mode != b.mode:
+        b = b.convert(a.mode)
+    return sum(ImageStat.Stat(ImageChops.difference(a, b)).mean) / len(a.getbands())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--output', help='Grava o relatório JSON neste arquivo')
+    parser.add_argument('--min-speedup', type=float, default=0.0, help='Sai com código 1 se algum caso ficar abaixo deste ganho')
+    args = parser.parse_args()
+
+    report = {"source_size": [args.width, args.height], "target_size": list(TARGET_SIZE), "rounds": args.rounds, "cases": {}}
+    below_minimum = []
+    for name, (pil_image, kwargs) in _build_cases(args.width, args.height).items():
+        legacy_rate, legacy_result = _throughput(_legacy_resize, pil_image, kwargs, args.rounds)
+        current_rate, current_result = _throughput(_resize_image_to_target_logic, pil_image, kwargs, args.rounds)
+        speedup = current_rate / legacy_rate
+        report["cases"][name] = {
+            "source_mode": pil_image.mode,
+            "legacy_images_per_s": round(legacy_rate, 2),
+            "current_images_per_s": round(current_rate, 2),
+            "speedup": round(speedup, 2),
+            "mean_pixel_difference": round(_mean_pixel_difference(legacy_result, current_result), 3)
+        }
+        if speedup < args.min_speedup:
+            below_minimum.append(name)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    if below_minimum:
+        print(f"Ganho abaixo de {args.min_speedup}x em: {', '.join(below_minimum)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
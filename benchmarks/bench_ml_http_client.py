@@ -0,0 +1,126 @@
+# backend/benchmarks/bench_ml_http_client.py
+"""
+Benchmark do cliente HTTP compartilhado do ML (utils/ml_http_client.py).
+
+Sobe um servidor local que imita api.mercadolibre.com, conta quantas conexões
+TCP foram abertas (cada uma = um handshake; em produção ainda há o TLS por cima)
+e compara chamadas com `requests.get` avulso (antes) contra `ml_get` (depois).
+
+Uso:
+    python benchmarks/bench_ml_http_client.py --requests 300 --threads 4 --handshake-ms 30
+
+--handshake-ms adiciona um atraso por conexão nova no servidor, para simular o
+custo de RTT/TLS que não existe em localhost.
+
+O governador de tráfego (utils/ml_rate_governor.py) fica desligado por padrão: aqui
+todas as chamadas usam o mesmo token e o balde por vendedor (20/s) dominaria a latência,
+escondendo o que se mede (conexões reaproveitadas). --with-governor mede com os limites
+configurados no ambiente.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Mantém keep-alive como a API real
+    disable_nagle_algorithm = True # Evita o atraso de ACK em respostas enviadas em duas escritas
+    connection_count = 0
+    handshake_delay_s = 0.0
+    _lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with _StandInHandler._lock:
+            _StandInHandler.connection_count += 1
+        if _StandInHandler.handshake_delay_s:
+            time.sleep(_StandInHandler.handshake_delay_s)
+
+    def do_GET(self):
+        body = json.dumps({"id": 703360332, "nickname": "BENCH"}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _run_mode(call, total_requests, threads):
+    _StandInHandler.connection_count = 0
+    latencies = []
+    latencies_lock = threading.Lock()
+
+    def one_call(_):
+        start = time.perf_counter()
+        response = call()
+        response.raise_for_status()
+        elapsed = (time.perf_counter() - start) * 1000
+        with latencies_lock:
+            latencies.append(elapsed)
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(one_call, range(total_requests)))
+    wall = time.perf_counter() - wall_start
+    latencies.sort()
+    return {
+        "requests": total_requests,
+        "handshakes": _StandInHandler.connection_count,
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p99_ms": round(_percentile(latencies, 99), 3),
+        "wall_s": round(wall, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--handshake-ms', type=float, default=0.0)
+    parser.add_argument('--with-governor', action='store_true', help='Mantém os limites do governador de tráfego')
+    args = parser.parse_args()
+    if not args.with_governor: # Lidos na importação do governador (taxa 0 = balde desligado)
+        os.environ['ML_APP_RATE_PER_SECOND'] = '0'
+        os.environ['ML_SELLER_RATE_PER_SECOND'] = '0'
+
+    _StandInHandler.handshake_delay_s = args.handshake_ms / 1000.0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # O cliente lê a URL base na importação
+    os.environ['ML_API_BASE_URL'] = base_url
+    import requests
+    from utils.ml_http_client import ml_get
+
+    results = {
+        "before_bare_requests": _run_mode(lambda: requests.get(f"{base_url}/users/me", headers={'Authorization': 'Bearer x'}, timeout=10), args.requests, args.threads),
+        "after_shared_client": _run_mode(lambda: ml_get("/users/me", endpoint='user_info', access_token='x'), args.requests, args.threads),
+        "threads": args.threads,
+        "handshake_ms": args.handshake_ms,
+        "governor": args.with_governor,
+    }
+    server.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
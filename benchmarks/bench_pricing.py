@@ -0,0 +1,230 @@
+# backend/benchmarks/bench_pricing.py
+"""
+Benchmark da cotação de preços (utils/pricing_logic.py) contra respostas gravadas do ML.
+
+Sobe um servidor local que responde /sites/MLB/listing_prices e
+/users/{id}/shipping_options/free a partir de benchmarks/fixtures/ml_pricing_responses.json,
+aponta o cliente HTTP para ele (ML_API_BASE_URL) e cota cada caso do fixture com
+`quote_prices_for_account` (frete + Clássico + Premium), em dois modos:
+  - cold: caches de tarifa e frete vazios antes de cada cotação;
+  - warm: caches já preenchidos por uma passada anterior.
+
+Saída em JSON: chamadas HTTP por cotação (por endpoint), consultas de tarifa feitas pelo
+solver (as "iterações" de calculate_final_price_for_listing_type), latência p50/p95 e os
+casos cujo preço diverge do esperado gravado no fixture.
+
+Uso:
+    python benchmarks/bench_pricing.py [--rounds 20] [--latency-ms 40] [--output resultado.json]
+    python benchmarks/bench_pricing.py --baseline resultado_anterior.json   # sai com 1 se piorar
+    python benchmarks/bench_pricing.py --record-expected                    # regrava os preços esperados
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'ml_pricing_responses.json')
+P95_TOLERANCE = 1.25 # Piora aceita na latência p95 em relação ao baseline
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    fixture = None
+    latency_s = 0.0
+    counts = {}
+    _lock = threading.Lock()
+
+    def _count(self, endpoint):
+        with _StandInHandler._lock:
+            _StandInHandler.counts[endpoint] = _StandInHandler.counts.get(endpoint, 0) + 1
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parsed = urllib.parse.urlparse(self.path)
+        params = {k: v[0] for k, v in urllib.parse.parse_qs(parsed.query).items()}
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if parsed.path.endswith('/listing_prices'):
+            self._count('listing_prices')
+            price = float(params.get('price', 0))
+            entries = self.fixture["listing_prices"].get(params.get('category_id'), {}).get(params.get('listing_type_id'))
+            if not entries:
+                return self._send_json(404, {"message": "category not found", "error": "not_found", "status": 404})
+            entry = next(e for e in entries if e["max_price"] is None or price < e["max_price"])
+            response = dict(entry["response"])
+            details = response["sale_fee_details"]
+            response["sale_fee_amount"] = round(price * details["percentage_fee"] / 100.0 + details["fixed_fee"], 2)
+            return self._send_json(200, response)
+        if parsed.path.endswith('/shipping_options/free'):
+            self._count('shipping_options_free')
+            price = float(params.get('item_price', 0))
+            weight_g = int(params.get('dimensions', '0x0x0,0').split(',')[-1])
+            entry = next(e for e in self.fixture["shipping_options_free"]
+                         if (e["max_price"] is None or price < e["max_price"]) and (e["max_weight_g"] is None or weight_g <= e["max_weight_g"]))
+            return self._send_json(200, entry["response"])
+        self._count('other')
+        return self._send_json(404, {"message": "not found", "status": 404})
+
+    def log_message(self, *args):
+        pass
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _run_mode(mode, cases, rounds, quote_one, reset_caches, fee_lookups):
+    latencies, fee_lookup_total, mismatches = [], 0, []
+    _StandInHandler.counts = {}
+    if mode == 'warm':
+        reset_caches()
+        for case in cases: # Passada de aquecimento, fora da medição
+            quote_one(case)
+        _StandInHandler.counts = {}
+    for _ in range(rounds):
+        for case in cases:
+            if mode == 'cold':
+                reset_caches()
+            fee_lookups[0] = 0
+            started = time.perf_counter()
+            result = quote_one(case)
+            latencies.append((time.perf_counter() - started) * 1000)
+            fee_lookup_total += fee_lookups[0]
+            expected = case.get("expected")
+            got = {"classic_price": result.get("classic_price"), "premium_price": result.get("premium_price")}
+            if expected and got != expected and len(mismatches) < 20:
+                mismatches.append({"case": case["name"], "expected": expected, "got": got})
+    quotes = rounds * len(cases)
+    latencies.sort()
+    calls = dict(_StandInHandler.counts)
+    return {
+        "quotes": quotes,
+        "http_calls_per_quote": round(sum(calls.values()) / quotes, 3),
+        "http_calls_by_endpoint": {k: round(v / quotes, 3) for k, v in sorted(calls.items())},
+        "fee_lookups_per_quote": round(fee_lookup_total / quotes, 3),
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50), 2),
+            "p95": round(_percentile(latencies, 95), 2),
+            "max": round(latencies[-1], 2) if latencies else 0.0,
+        },
+        "price_mismatches": mismatches,
+    }
+
+
+def _compare_with_baseline(report, baseline):
+    problems = []
+    for mode, current in report["modes"].items():
+        previous = baseline.get("modes", {}).get(mode)
+        if not previous:
+            continue
+        if current["http_calls_per_quote"] > previous["http_calls_per_quote"]:
+            problems.append(f"{mode}: chamadas/cotação {previous['http_calls_per_quote']} -> {current['http_calls_per_quote']}")
+        if current["latency_ms"]["p95"] > previous["latency_ms"]["p95"] * P95_TOLERANCE:
+            problems.append(f"{mode}: p95 {previous['latency_ms']['p95']}ms -> {current['latency_ms']['p95']}ms")
+        if current["price_mismatches"]:
+            problems.append(f"{mode}: {len(current['price_mismatches'])} preço(s) diferentes do esperado")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Atraso por resposta do servidor (simula a rede)')
+    parser.add_argument('--output', help='Grava o relatório JSON neste arquivo')
+    parser.add_argument('--baseline', help='Relatório anterior; sai com código 1 se houver regressão')
+    parser.add_argument('--record-expected', action='store_true', help='Grava os preços atuais como esperados no fixture')
+    args = parser.parse_args()
+
+    with open(FIXTURE_PATH, 'r', encoding='utf-8') as f:
+        fixture = json.load(f)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StandInHandler)
+    _StandInHandler.fixture = fixture
+    _StandInHandler.latency_s = args.latency_ms / 1000.0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # Precisa ser definido antes de importar utils (lido na importação)
+    os.environ['ML_API_BASE_URL'] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ['ML_CACHE_DIR'] = tempfile.mkdtemp(prefix='bench-pricing-cache-')
+    # Mede o custo da cotação, não o governador de tráfego: limites locais bem acima do benchmark
+    os.environ.setdefault('ML_APP_RATE_PER_SECOND', '100000')
+    os.environ.setdefault('ML_APP_RATE_BURST', '100000')
+    os.environ.setdefault('ML_SELLER_RATE_PER_SECOND', '100000')
+    os.environ.setdefault('ML_SELLER_RATE_BURST', '100000')
+
+    from flask import Flask
+    from utils import pricing_logic, ml_fee_schedule, ml_shipping_cache
+
+    fee_lookups = [0]
+    real_get_fees = pricing_logic.get_ml_api_fees_for_type_logic
+    def counted_get_fees(*fee_args, **fee_kwargs):
+        fee_lookups[0] += 1
+        return real_get_fees(*fee_args, **fee_kwargs)
+    pricing_logic.get_ml_api_fees_for_type_logic = counted_get_fees
+
+    def reset_caches():
+        ml_fee_schedule._fee_store.replace({})
+        ml_shipping_cache._shipping_store.replace({})
+
+    app = Flask(__name__)
+    app.config['ML_SITE_ID'] = fixture["site_id"]
+
+    def quote_one(case):
+        quote_request = pricing_logic.build_quote_request(case)
+        with contextlib.redirect_stdout(io.StringIO()): # Os prints de log não entram na medição
+            return pricing_logic.quote_prices_for_account(quote_request, 'me2', 'bench-token', 703360332)
+
+    report = {"cases": len(fixture["cases"]), "rounds": args.rounds, "latency_ms_per_call": args.latency_ms, "modes": {}}
+    with app.app_context():
+        if args.record_expected:
+            reset_caches()
+            for case in fixture["cases"]:
+                result = quote_one(case)
+                case["expected"] = {"classic_price": result.get("classic_price"), "premium_price": result.get("premium_price")}
+            with open(FIXTURE_PATH, 'w', encoding='utf-8') as f:
+                json.dump(fixture, f, indent=2, ensure_ascii=False)
+                f.write('\n')
+            print(f"Preços esperados gravados em {FIXTURE_PATH}")
+            return 0
+        for mode in ('cold', 'warm'):
+            report["modes"][mode] = _run_mode(mode, fixture["cases"], args.rounds, quote_one, reset_caches, fee_lookups)
+    server.shutdown()
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+
+    problems = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            problems = _compare_with_baseline(report, json.load(f))
+    problems += [f"{mode}: preço divergente" for mode, r in report["modes"].items() if r["price_mismatches"] and not args.baseline]
+    for problem in problems:
+        print("REGRESSÃO:", problem, file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
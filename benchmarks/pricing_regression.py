@@ -0,0 +1,105 @@
+# backend/benchmarks/pricing_regression.py
+"""
+Regressão do solver de preço (utils/pricing_engine.py) contra o laço iterativo antigo.
+
+benchmarks/fixtures/pricing_regression.json traz tabelas de tarifa por faixa e, para
+cada caso, o preço que o `calculate_final_price_for_listing_type` iterativo devolvia
+(`legacy_price`) e quantas consultas de tarifa ele fazia. Aqui rodamos a função atual
+com as mesmas tabelas (sem rede) e comparamos.
+
+Casos divergentes só são aceitos quando o laço antigo oscilava no degrau de R$79 e
+devolvia um preço que não cobre custo + lucro; nesses o preço correto é o próprio degrau.
+
+Uso:
+    python benchmarks/pricing_regression.py [--verbose]
+"""
+import argparse
+import bisect
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from utils import pricing_logic
+from utils.ml_fee_schedule import ML_FEE_PRICE_CUTOFFS
+from utils.pricing_engine import ANTICIPATION_FEE_RATE
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'pricing_regression.json')
+
+
+def _table_fee(fixture, category_id, listing_type_id, price):
+    band = bisect.bisect_right(ML_FEE_PRICE_CUTOFFS[fixture["site_id"]], float(price))
+    return fixture["fee_tables"][category_id][listing_type_id][band]
+
+
+def _covers_costs(fixture, case, price):
+    """True se `price` paga tarifa, antecipação, frete e custo e ainda deixa o lucro pedido."""
+    fee_rate, fixed_fee = _table_fee(fixture, case["category_id"], case["listing_type_id"], price)
+    base = case["cost_price_adjusted"] + case["shipping_cost_for_seller"]
+    profit = base * case["desired_profit"] / 100.0 if case["profit_type_is_percent"] else case["desired_profit"]
+    anticipation = price * ANTICIPATION_FEE_RATE if case["include_anticipation_fee"] else 0.0
+    return price - (price * fee_rate + fixed_fee) - anticipation - base >= profit - 0.01
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    with open(FIXTURE_PATH, 'r', encoding='utf-8') as f:
+        fixture = json.load(f)
+
+    fee_calls = [0]
+    def table_fees(category_id, sell_price, listing_type_id, access_token):
+        fee_calls[0] += 1
+        fee_rate, fixed_fee = _table_fee(fixture, category_id, listing_type_id, sell_price)
+        return fee_rate, fixed_fee, float(sell_price) * fee_rate + fixed_fee
+    pricing_logic.get_ml_api_fees_for_type_logic = table_fees # Tabela local no lugar da API/cache
+
+    app = Flask(__name__)
+    app.config['ML_SITE_ID'] = fixture["site_id"]
+
+    identical, cliff_fixed, failures = 0, 0, []
+    legacy_calls, new_calls, elapsed = 0, 0, 0.0
+    with app.app_context():
+        for case in fixture["cases"]:
+            fee_calls[0] = 0
+            started = time.perf_counter()
+            result = pricing_logic.calculate_final_price_for_listing_type(
+                case["cost_price_adjusted"], case["desired_profit"], case["profit_type_is_percent"],
+                case["shipping_cost_for_seller"], case["category_id"], case["listing_type_id"],
+                "fixture-token", case["include_anticipation_fee"]
+            )
+            elapsed += time.perf_counter() - started
+            legacy_calls += case["legacy_fee_calls"]
+            new_calls += fee_calls[0]
+
+            if result["price"] == case["legacy_price"]:
+                identical += 1
+            elif not _covers_costs(fixture, case, case["legacy_price"]) and _covers_costs(fixture, case, result["price"]):
+                cliff_fixed += 1
+                if args.verbose:
+                    print(f"degrau: {case['category_id']}/{case['listing_type_id']} custo {case['cost_price_adjusted']}: antigo {case['legacy_price']} -> {result['price']}")
+            else:
+                failures.append({"case": case, "price": result["price"]})
+
+    report = {
+        "cases": len(fixture["cases"]),
+        "identical": identical,
+        "cliff_cases_corrected": cliff_fixed,
+        "failures": len(failures),
+        "fee_lookups_per_quote_legacy": round(legacy_calls / len(fixture["cases"]), 2),
+        "fee_lookups_per_quote_solver": round(new_calls / len(fixture["cases"]), 2),
+        "solver_mean_us": round(elapsed / len(fixture["cases"]) * 1e6, 1),
+    }
+    print(json.dumps(report, indent=2))
+    for failure in failures[:10]:
+        print("FALHA:", json.dumps(failure))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
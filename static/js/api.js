@@ -96,7 +96,7 @@ export async function searchMLCategoriesAPI(query) {
 }
 
 export async function fetchMLCategoryAttributesAPI(categoryId) {
-    const response = await fetch(`${API_BASE_URL}/api/ml/category-attributes/${categoryId}`);
+    const response = await fetch(`${API_BASE_URL}/api/ml/category-attributes/${categoryId}?view=slim`);
     return handleApiResponse(response, 'fetchMLCategoryAttributesAPI'); // Espera-se que o backend retorne a lista
 }
 
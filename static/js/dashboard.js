@@ -741,7 +741,7 @@ document.addEventListener('DOMContentLoaded', function () {
         }
 
         try {
-            const response = await fetch(`/api/ml/category-attributes/${categoryId}`);
+            const response = await fetch(`/api/ml/category-attributes/${categoryId}?view=slim`);
             const result = await response.json();
             if (!response.ok) {
                 // No seu app.py, você retorna uma lista vazia em caso de erro, então o erro vem daqui
@@ -1045,7 +1045,7 @@ document.addEventListener('DOMContentLoaded', function () {
 			attributesStatus.style.display = 'block';
 
 			try {
-				const response = await fetch(`/api/ml/category-attributes/${categoryId}`);
+				const response = await fetch(`/api/ml/category-attributes/${categoryId}?view=slim`);
 				const attributes = await response.json();
 
 				if (!response.ok) {
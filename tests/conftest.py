@@ -0,0 +1,9 @@
+# backend/tests/conftest.py
+import os
+import sys
+import tempfile
+
+# Mesmo esquema dos benchmarks: os testes importam `utils.*` a partir da raiz do backend
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Precisa ser definido antes de importar utils (lido na importação): não suja o cache real
+os.environ.setdefault('ML_CACHE_DIR', tempfile.mkdtemp(prefix='tests-cache-'))
@@ -0,0 +1,60 @@
+# backend/tests/test_batch_pricing_route.py
+import io
+import json
+
+import pytest
+
+from app import app
+
+BATCH_CSV = (
+    "sku;cost_price;desired_profit;profit_type;product_category_id\n"
+    "A1;10;5;fixed;MLB1055\n"
+    "B2;20;7;fixed;MLB1055\n"
+).encode('utf-8')
+
+
+@pytest.fixture
+def client():
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in_user'] = 'teste'
+    return client
+
+
+def _ndjson_lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_batch_pricing_multipart_upload(client):
+    # O upload é fechado junto com a requisição, antes de o stream da resposta ler o CSV
+    response = client.post('/api/ml/calculate-prices/batch', content_type='multipart/form-data', data={
+        'file': (io.BytesIO(BATCH_CSV), 'lote.csv'),
+        'selected_ml_accounts': 'conta-inexistente',
+    })
+
+    assert response.status_code == 200
+    lines = _ndjson_lines(response)
+    assert not [line for line in lines if "error" in line], lines # Sem trailer de erro de leitura
+    assert sorted((line["row"], line["sku"]) for line in lines) == [(1, "A1"), (2, "B2")]
+    assert all(line["account"] == 'conta-inexistente' and line["result"]["error"] == "Conta ML não encontrada." for line in lines)
+
+
+def test_batch_pricing_multipart_upload_csv_output(client):
+    response = client.post('/api/ml/calculate-prices/batch', content_type='multipart/form-data', data={
+        'file': (io.BytesIO(BATCH_CSV.replace(b';', b',')), 'lote.csv'),
+        'selected_ml_accounts': 'conta-inexistente',
+        'format': 'csv',
+    })
+
+    assert response.status_code == 200
+    rows = response.get_data(as_text=True).splitlines()
+    assert rows[0].startswith('row,sku,account,')
+    assert sorted(row.split(',')[1] for row in rows[1:]) == ["A1", "B2"]
+
+
+def test_batch_pricing_text_csv_body(client):
+    response = client.post('/api/ml/calculate-prices/batch?selected_ml_accounts=conta-inexistente',
+                           data=BATCH_CSV, content_type='text/csv')
+
+    assert response.status_code == 200
+    assert sorted(line["sku"] for line in _ndjson_lines(response)) == ["A1", "B2"]
@@ -0,0 +1,117 @@
+# backend/tests/test_image_hosts.py
+import pytest
+import requests
+
+from utils import image_hosts
+from utils.image_hosts import ImageHost, ImgurHost, MLPicturesHost, ZeroXZeroHost, upload_to_first_available
+
+IMAGE_BYTES = b'\xff\xd8\xff fake jpeg'
+
+
+class _StubResponse:
+    def __init__(self, status_code, json_data=None, text=''):
+        self.status_code = status_code
+        self._json_data = json_data
+        self.text = text
+
+    def json(self):
+        if self._json_data is None:
+            raise ValueError("sem JSON")
+        return self._json_data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code}")
+
+
+ML_PICTURE = {
+    "id": "123-MLA456_789",
+    "max_size": "1000x1000",
+    "variations": [
+        {"size": "1000x1000", "url": "http://http2.mlstatic.com/D_123-F.jpg", "secure_url": "https://http2.mlstatic.com/D_123-F.jpg"},
+        {"size": "500x500", "url": "http://http2.mlstatic.com/D_123-O.jpg", "secure_url": "https://http2.mlstatic.com/D_123-O.jpg"},
+    ],
+}
+IMGUR_RESPONSE = {"success": True, "data": {"link": "https://i.imgur.com/abc.jpg"}}
+
+
+@pytest.fixture
+def stub_uploads(monkeypatch):
+    """Troca ml_post e requests.post por respostas fixas; registra as chamadas feitas."""
+    calls = []
+    responses = {}
+
+    def fake_ml_post(path, endpoint=None, access_token=None, **kwargs):
+        calls.append(("ml", path))
+        response = responses["ml"]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def fake_post(url, **kwargs):
+        calls.append(("post", url))
+        response = responses[url]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(image_hosts, "ml_post", fake_ml_post)
+    monkeypatch.setattr(image_hosts.requests, "post", fake_post)
+    return responses, calls
+
+
+def _all_hosts():
+    return [MLPicturesHost("APP_USR-token"), ImgurHost("client-id"), ZeroXZeroHost()]
+
+
+def test_image_host_requires_upload():
+    class IncompleteHost(ImageHost):
+        name = "incompleto"
+
+    with pytest.raises(TypeError):
+        IncompleteHost()
+
+
+def test_ml_upload_success(stub_uploads):
+    responses, calls = stub_uploads
+    responses["ml"] = _StubResponse(201, ML_PICTURE)
+
+    hosted, service = upload_to_first_available(_all_hosts(), IMAGE_BYTES, "foto.jpg")
+
+    assert service == "Mercado Livre"
+    assert hosted == {"public_url": "https://http2.mlstatic.com/D_123-F.jpg", "picture_id": "123-MLA456_789"}
+    assert calls == [("ml", "/pictures/items/upload")]
+
+
+def test_ml_failure_falls_back_to_imgur(stub_uploads):
+    responses, calls = stub_uploads
+    responses["ml"] = _StubResponse(400, {"message": "invalid image"}, text='{"message": "invalid image"}')
+    responses["https://api.imgur.com/3/image"] = _StubResponse(200, IMGUR_RESPONSE)
+
+    hosted, service = upload_to_first_available(_all_hosts(), IMAGE_BYTES, "foto.jpg")
+
+    assert service == "Imgur"
+    assert hosted == {"public_url": "https://i.imgur.com/abc.jpg", "picture_id": None}
+    assert calls == [("ml", "/pictures/items/upload"), ("post", "https://api.imgur.com/3/image")]
+
+
+def test_falls_back_to_0x0_when_ml_and_imgur_fail(stub_uploads):
+    responses, calls = stub_uploads
+    responses["ml"] = requests.exceptions.ConnectionError("sem rede")
+    responses["https://api.imgur.com/3/image"] = _StubResponse(429, text="Too Many Requests")
+    responses["https://0x0.st"] = _StubResponse(200, text="https://0x0.st/abc.jpg\n")
+
+    hosted, service = upload_to_first_available(_all_hosts(), IMAGE_BYTES, "foto.jpg")
+
+    assert service == "0x0.st"
+    assert hosted == {"public_url": "https://0x0.st/abc.jpg", "picture_id": None}
+    assert [url for _, url in calls] == ["/pictures/items/upload", "https://api.imgur.com/3/image", "https://0x0.st"]
+
+
+def test_all_hosts_failing(stub_uploads):
+    responses, _ = stub_uploads
+    responses["ml"] = _StubResponse(500, text="erro")
+    responses["https://api.imgur.com/3/image"] = _StubResponse(500, text="erro")
+    responses["https://0x0.st"] = _StubResponse(503, text="erro")
+
+    assert upload_to_first_available(_all_hosts(), IMAGE_BYTES, "foto.jpg") == (None, "Falha Upload")
@@ -0,0 +1,29 @@
+# backend/tests/test_image_processing_logic.py
+import io
+
+from PIL import Image
+
+from utils.image_processing_logic import OPTIMIZE_IMAGE_PARAMS, optimize_image_bytes
+
+
+def _png_16bit_grayscale(width=1600, height=1200):
+    """Gradiente vertical em 16 bits (0-65535), salvo como PNG (abre no modo I;16)."""
+    gradient = Image.linear_gradient('L').resize((width, height)).convert('I').point(lambda value: value * 257)
+    buffer = io.BytesIO()
+    gradient.convert('I;16').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_optimize_16bit_png():
+    png_bytes = _png_16bit_grayscale()
+    assert Image.open(io.BytesIO(png_bytes)).mode == 'I;16'
+
+    result = optimize_image_bytes(png_bytes)
+
+    assert result["error"] is False, result.get("message")
+    optimized = Image.open(io.BytesIO(result["image_bytes"]))
+    assert optimized.format == 'JPEG'
+    assert optimized.size == (OPTIMIZE_IMAGE_PARAMS["width"], OPTIMIZE_IMAGE_PARAMS["height"])
+    # Escala de 16 para 8 bits preservada (sem saturar tudo em branco): escuro em cima, claro embaixo
+    top, middle, bottom = (optimized.convert('L').getpixel((500, y)) for y in (150, 500, 850))
+    assert top < 30 and 110 < middle < 145 and bottom > 225
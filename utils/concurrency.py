@@ -0,0 +1,188 @@
+# backend/utils/concurrency.py
+import os
+import threading
+import multiprocessing
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+# Pools de threads compartilhados por processo, um por finalidade. Pools separados
+# evitam deadlock quando uma tarefa de um pool espera tarefas de outro
+# (ex.: checagem por conta -> multiget em paralelo).
+# Trabalho pesado de CPU (ex.: redimensionar imagens com Pillow) vai para pools de
+# processos, fora do GIL, via get_process_executor.
+
+ML_ACCOUNTS_MAX_WORKERS = int(os.environ.get('ML_ACCOUNTS_MAX_WORKERS', 8))
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name, max_workers):
+    """Retorna (criando se preciso) o ThreadPoolExecutor nomeado deste processo."""
+    with _executors_lock:
+        executor = _executors.get(name)
+        if executor is None:
+            executor = _executors[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        return executor
+
+
+_process_executors = {}
+
+
+def _process_pool_context(preload_modules):
+    """
+    Processos do pool nascem de um forkserver limpo, não de um fork do servidor: o processo
+    do app já tem threads (renovação de tokens, árvore de categorias, pools) e um fork no meio
+    de um lock seguro por outra thread (stdout, import) trava o filho.
+    """
+    try:
+        context = multiprocessing.get_context('forkserver')
+    except ValueError: # Sem forkserver (Windows)
+        return multiprocessing.get_context('spawn')
+    # O padrão pré-carrega o __main__ (ex.: app.py), que subiria as threads do app no forkserver
+    context.set_forkserver_preload(list(preload_modules))
+    return context
+
+
+def get_process_executor(name, max_workers, preload_modules=()):
+    """
+    Retorna (criando se preciso) o ProcessPoolExecutor nomeado. As funções submetidas
+    precisam ser de nível de módulo (são enviadas por pickle) e não têm app context.
+    `preload_modules` são importados uma vez no forkserver (ex.: o módulo com o Pillow).
+    """
+    with _executors_lock:
+        executor = _process_executors.get(name)
+        if executor is None:
+            executor = _process_executors[name] = ProcessPoolExecutor(max_workers=max_workers, mp_context=_process_pool_context(preload_modules))
+        return executor
+
+
+def discard_process_executor(name, executor):
+    """Descarta um pool quebrado (ex.: processo morto por falta de memória); o próximo uso cria outro."""
+    with _executors_lock:
+        if _process_executors.get(name) is executor:
+            del _process_executors[name]
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _call_in_app_context(app, fn, args, kwargs):
+    if app is None:
+        return fn(*args, **kwargs)
+    with app.app_context():
+        return fn(*args, **kwargs)
+
+
+def submit_in_app_context(executor, app, fn, *args, **kwargs):
+    """
+    Submete `fn` ao executor rodando dentro do app context do Flask (current_app disponível)
+    e com as context vars de quem submeteu (ex.: prioridade das chamadas ML).
+    """
+    caller_context = contextvars.copy_context()
+    return executor.submit(caller_context.run, _call_in_app_context, app, fn, args, kwargs)
+
+
+def map_in_app_context(executor, app, fn, items):
+    """
+    Como executor.map (resultados na ordem de `items`; a primeira exceção é propagada), mas
+    cada chamada roda via submit_in_app_context. Depois de uma falha, o que nem começou é cancelado.
+    """
+    futures = [submit_in_app_context(executor, app, fn, item) for item in items]
+    try:
+        return [future.result() for future in futures]
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def run_keyed_tasks(executor, app, tasks, timeout=None, on_error=None):
+    """
+    Executa `tasks` ({chave: (fn, args)}) em paralelo e gera (chave, resultado)
+    na ordem em que terminam. Exceções viram `on_error(chave, exc)`.
+    Com `timeout`, as chaves que não terminaram a tempo saem com resultado None e as
+    tarefas que ainda nem começaram são canceladas (não ocupam o pool compartilhado).
+    """
+    futures = {submit_in_app_context(executor, app, fn, *args): key for key, (fn, args) in tasks.items()}
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            pending.discard(future)
+            key = futures[future]
+            try:
+                yield key, future.result()
+            except Exception as e:
+                yield key, on_error(key, e) if on_error else {"error": True, "message": f"Erro inesperado: {str(e)[:150]}"}
+    except FuturesTimeoutError:
+        for future in pending:
+            future.cancel()
+        for future in pending:
+            yield futures[future], None
+    finally:
+        for future in pending: # Timeout ou consumidor desistiu
+            future.cancel()
+
+
+def bounded_map_unordered(executor, app, fn, items, max_in_flight, on_error=None):
+    """
+    Como run_keyed_tasks, mas para entradas grandes: `items` ((chave, args) ...) é consumido
+    sob demanda e no máximo `max_in_flight` tarefas ficam pendentes, então a memória não
+    cresce com o tamanho da entrada. Gera (chave, resultado) na ordem em que terminam.
+    """
+    items = iter(items)
+    in_flight = {}
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(in_flight) < max_in_flight:
+                try:
+                    key, args = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                in_flight[submit_in_app_context(executor, app, fn, *args)] = key
+            if not in_flight:
+                return
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = on_error(key, e) if on_error else {"error": True, "message": f"Erro inesperado: {str(e)[:150]}"}
+                yield key, result
+    finally:
+        for future in in_flight: # Consumidor desistiu (ex.: cliente desconectou): descarta o que nem começou
+            future.cancel()
+
+
+class SingleFlight:
+    """
+    Deduplica chamadas idênticas simultâneas: a primeira thread com uma chave executa
+    `fn`, as demais com a mesma chave esperam e recebem o mesmo resultado (ou exceção).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {} # chave -> Future
+        self._stats = {"executed": 0, "shared": 0}
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            self._stats["executed" if leader else "shared"] += 1
+        if not leader:
+            return future.result()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        with self._lock:
+            self._calls.pop(key, None)
+        return future.result()
@@ -2,6 +2,11 @@
 import os
 import json
 import time
+import threading
+from dataclasses import dataclass, field, fields
+from types import MappingProxyType
+from typing import Any, Mapping
+from .json_file_store import JsonFileStore
 
 # Ajuste para garantir que o diretório 'config' seja criado DENTRO da pasta 'backend'
 # se esta estrutura for desejada, ou um nível acima se 'config' for na raiz do projeto.
@@ -11,6 +16,10 @@ os.makedirs(CONFIG_DIR_PATH, exist_ok=True) # Cria o diretório se não existir
 
 APP_CONFIG_FILE = os.path.join(CONFIG_DIR_PATH, 'app_config.json')
 ACCOUNTS_FILE = os.path.join(CONFIG_DIR_PATH, 'ml_accounts.json')
+# Caches locais (tarifas, frete, categorias...): podem ser apagados sem perda de dados.
+# ML_CACHE_DIR permite isolar os caches (ex.: benchmarks não sujam o cache real).
+CACHE_DIR_PATH = os.environ.get('ML_CACHE_DIR') or os.path.join(CONFIG_DIR_PATH, 'cache')
+os.makedirs(CACHE_DIR_PATH, exist_ok=True)
 
 
 def _init_default_file(filepath, default_content_generator):
@@ -42,53 +51,115 @@ _init_default_file(APP_CONFIG_FILE, get_default_app_config)
 _init_default_file(ACCOUNTS_FILE, get_default_ml_accounts)
 
 
+@dataclass(frozen=True)
+class AppConfigSnapshot:
+    """Visão imutável e tipada de app_config.json. Chaves desconhecidas ficam em `extra`."""
+    tiny_api_v2_token: str = ''
+    removebg_api_key: str = ''
+    imgur_client_id: str = ''
+    chatgpt_api_key: str = ''
+    removebg_credits_used_month: int = 0
+    removebg_last_reset_month_year: str = ''
+    tiny_v3_client_id: str = ''
+    tiny_v3_client_secret: str = ''
+    tiny_v3_access_token: str = ''
+    tiny_v3_refresh_token: str = ''
+    tiny_v3_expires_at: float = 0.0
+    extra: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+
+    @classmethod
+    def from_dict(cls, raw_config):
+        merged = get_default_app_config()
+        merged.update(raw_config or {})
+        known = {}
+        for f in fields(cls):
+            if f.name == 'extra' or f.name not in merged:
+                continue
+            value = merged[f.name]
+            try:
+                known[f.name] = f.type(value) if value is not None else f.default
+            except (TypeError, ValueError):
+                known[f.name] = f.default
+        extra = {k: v for k, v in merged.items() if k not in known and k != 'extra'}
+        return cls(extra=MappingProxyType(extra), **known)
+
+    def get(self, key, default=None):
+        if key != 'extra' and key in self.__dataclass_fields__:
+            return getattr(self, key)
+        return self.extra.get(key, default)
+
+    def to_dict(self):
+        data = dict(self.extra)
+        data.update({f.name: getattr(self, f.name) for f in fields(self) if f.name != 'extra'})
+        return data
+
+
+# app_config.json em memória: relido só quando o mtime muda; gravações atômicas
+# e agrupadas (debounce) pela thread do store.
+app_config_store = JsonFileStore(APP_CONFIG_FILE, get_default_app_config, write_delay=1.0)
+_app_config_snapshot_lock = threading.Lock()
+_app_config_snapshot = (None, None) # (versão do store, snapshot)
+
+
+def get_app_config():
+    """Retorna o AppConfigSnapshot atual (reconstruído apenas quando o conteúdo muda)."""
+    global _app_config_snapshot
+    version = app_config_store.version()
+    cached_version, snapshot = _app_config_snapshot
+    if cached_version == version:
+        return snapshot
+    with _app_config_snapshot_lock:
+        snapshot = app_config_store.read(AppConfigSnapshot.from_dict)
+        _app_config_snapshot = (version, snapshot)
+        return snapshot
+
+
 def load_app_config():
-    """Carrega app_config.json do servidor."""
-    try:
-        with open(APP_CONFIG_FILE, 'r', encoding='utf-8') as f:
-            config_from_file = json.load(f)
-            # Garante que todas as chaves default existam e adiciona se faltar
-            default_conf = get_default_app_config()
-            updated = False
-            for key, value in default_conf.items():
-                if key not in config_from_file:
-                    config_from_file[key] = value
-                    updated = True
-            if updated:
-                save_app_config(config_from_file) # Salva se adicionou chaves default
-            return config_from_file
-    except (IOError, json.JSONDecodeError) as e:
-        print(f"Erro ao carregar {APP_CONFIG_FILE}: {e}. Recriando com defaults.")
-        default_config = get_default_app_config()
-        save_app_config(default_config)
-        return default_config
+    """Retorna app_config como dict (cópia, com as chaves padrão preenchidas)."""
+    return get_app_config().to_dict()
+
 
 def save_app_config(config_data):
-    """Salva app_config.json no servidor."""
-    try:
-        with open(APP_CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config_data, f, indent=2)
-        print(f"Configuração da aplicação salva em {APP_CONFIG_FILE}")
-    except IOError as e:
-        print(f"Erro ao salvar configuração da aplicação em {APP_CONFIG_FILE}: {e}")
+    """Substitui o app_config; a gravação em disco é atômica e agrupada em background."""
+    app_config_store.replace(config_data)
+
+
+def update_app_config(**changes):
+    """Atualiza apenas as chaves informadas e retorna o novo snapshot."""
+    app_config_store.update(lambda config: config.update(changes))
+    return get_app_config()
+
+
+# Repositório de contas ML: mantido em memória, cada conta alterada é gravada na hora
+# de forma atômica e relido apenas quando o mtime de ml_accounts.json muda.
+ml_accounts_store = JsonFileStore(ACCOUNTS_FILE, get_default_ml_accounts)
+
 
 def load_ml_accounts():
-    """Carrega ml_accounts.json do servidor."""
-    try:
-        with open(ACCOUNTS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (IOError, json.JSONDecodeError) as e:
-        print(f"Erro ao carregar {ACCOUNTS_FILE}: {e}. Retornando dicionário vazio e recriando arquivo.")
-        default_accounts = get_default_ml_accounts()
-        save_ml_accounts(default_accounts) # Recria o arquivo se estiver corrompido
-        return default_accounts
+    """Retorna uma cópia de todas as contas ML (servida da memória)."""
+    return ml_accounts_store.read()
 
 
 def save_ml_accounts(accounts_data):
-    """Salva ml_accounts.json no servidor."""
-    try:
-        with open(ACCOUNTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(accounts_data, f, indent=2)
-        print(f"Contas Mercado Livre salvas em {ACCOUNTS_FILE}")
-    except IOError as e:
-        print(f"Erro ao salvar contas Mercado Livre em {ACCOUNTS_FILE}: {e}")
\ No newline at end of file
+    """Substitui todas as contas ML; a gravação em disco é agrupada em background."""
+    ml_accounts_store.replace(accounts_data)
+
+
+def get_ml_account(nickname, check_disk=False):
+    """Retorna uma cópia de uma conta ML ou None. `check_disk=True` confere agora se outro worker gravou o arquivo."""
+    return ml_accounts_store.read(lambda accounts: dict(accounts[nickname]) if nickname in accounts else None, check_disk=check_disk)
+
+
+def upsert_ml_account(nickname, account_data):
+    """
+    Adiciona/atualiza uma única conta sem reescrever as demais. Grava na hora: o refresh
+    token anterior já foi consumido pelo ML e o novo não pode ficar só na memória.
+    """
+    def _apply(accounts):
+        accounts[nickname] = dict(account_data)
+    ml_accounts_store.update(_apply, durable=True)
+
+
+def remove_ml_account(nickname):
+    """Remove uma conta. Retorna True se ela existia."""
+    return ml_accounts_store.update(lambda accounts: accounts.pop(nickname, None) is not None, durable=True)
\ No newline at end of file
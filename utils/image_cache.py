@@ -0,0 +1,138 @@
+# backend/utils/image_cache.py
+import os
+import json
+import time
+import hashlib
+import threading
+from .config_manager import CACHE_DIR_PATH
+from .json_file_store import JsonFileStore, atomic_write_bytes
+
+# Cache endereçado por conteúdo das imagens processadas (otimizar, remover fundo).
+# A chave é o hash de (bytes da imagem de origem, operação, parâmetros): a mesma foto
+# processada do mesmo jeito reaproveita o resultado, mesmo vinda de outra URL.
+# Guarda os bytes gerados (em disco, com limite de tamanho e remoção LRU) e a URL
+# pública devolvida pelo serviço de hospedagem (ver image_hosts.py), mais o ID da foto
+# quando ela foi enviada ao Mercado Livre e a conta dona dela; com a URL ainda válida,
+# a resposta sai sem processar nem reenviar nada (no Remove.bg, sem gastar crédito).
+
+IMAGE_CACHE_DIR = os.path.join(CACHE_DIR_PATH, 'images')
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('ML_IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+# Por quanto tempo a URL hospedada é reaproveitada (hosts gratuitos apagam arquivos antigos)
+HOSTED_URL_TTL_SECONDS = int(os.environ.get('ML_IMAGE_HOSTED_URL_TTL_SECONDS', 30 * 24 * 60 * 60))
+# O horário de acesso (ordem LRU) só é regravado se o guardado tiver mais que isso: um acerto
+# no cache não reescreve o index.json a cada leitura, e a remoção LRU não precisa de mais precisão
+IMAGE_CACHE_TOUCH_INTERVAL_SECONDS = 10 * 60
+
+_index_store = JsonFileStore(os.path.join(IMAGE_CACHE_DIR, 'index.json'), dict, write_delay=2.0)
+_stats_lock = threading.Lock()
+_stats = {"url_hits": 0, "bytes_hits": 0, "misses": 0, "evictions": 0}
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def image_cache_key(source_bytes, operation, params):
+    source_hash = hashlib.sha256(source_bytes).hexdigest()
+    canonical_params = json.dumps(params or {}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{source_hash}|{operation}|{canonical_params}".encode('utf-8')).hexdigest()
+
+
+def _filepath(filename):
+    return os.path.join(IMAGE_CACHE_DIR, filename)
+
+
+def lookup_processed_image(key):
+    """
+    Entrada do cache ({"public_url", "service", "picture_id", "picture_owner", "file", ...}) ou None.
+    `public_url` (e o `picture_id`) só vêm preenchidos se ainda estão dentro de HOSTED_URL_TTL_SECONDS.
+    """
+    now = time.time()
+    entry = _index_store.read(lambda index: dict(index[key]) if key in index else None)
+    if entry is None:
+        _count("misses")
+        return None
+    if now - (entry.get("last_access") or 0) >= IMAGE_CACHE_TOUCH_INTERVAL_SECONDS:
+        _index_store.update(lambda index: _touch(index, key, now)) # Mantém a ordem LRU
+    if entry.get("public_url") and now - (entry.get("uploaded_at") or 0) < HOSTED_URL_TTL_SECONDS:
+        _count("url_hits")
+    else:
+        entry["public_url"] = entry["picture_id"] = None
+    return entry
+
+
+def _touch(index, key, now):
+    if key in index:
+        index[key]["last_access"] = now
+
+
+def read_processed_image_bytes(key, entry):
+    """Bytes guardados da entrada (None se o arquivo sumiu; a entrada é descartada)."""
+    try:
+        with open(_filepath(entry["file"]), 'rb') as f:
+            data = f.read()
+    except OSError:
+        _index_store.update(lambda index: index.pop(key, None))
+        _count("misses")
+        return None
+    _count("bytes_hits")
+    return data
+
+
+def store_processed_image(key, image_bytes, extension):
+    """Guarda os bytes processados e remove as entradas menos usadas se passar de IMAGE_CACHE_MAX_BYTES."""
+    filename = f"{key}.{extension}"
+    try:
+        os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+        atomic_write_bytes(_filepath(filename), image_bytes)
+    except OSError as e:
+        print(f"Image Cache: erro ao gravar {filename}: {e}")
+        return
+    now = time.time()
+    evicted_files = []
+
+    def _store(index):
+        index[key] = {"file": filename, "size": len(image_bytes), "created_at": now, "last_access": now,
+                      "public_url": None, "service": None, "uploaded_at": None, "picture_id": None, "picture_owner": None}
+        total = sum(entry.get("size", 0) for entry in index.values())
+        if total <= IMAGE_CACHE_MAX_BYTES:
+            return
+        for old_key in sorted(index, key=lambda k: index[k].get("last_access", 0)):
+            if total <= IMAGE_CACHE_MAX_BYTES:
+                break
+            if old_key == key:
+                continue
+            old_entry = index.pop(old_key)
+            total -= old_entry.get("size", 0)
+            evicted_files.append(old_entry["file"])
+    _index_store.update(_store)
+
+    for old_file in evicted_files:
+        try:
+            os.remove(_filepath(old_file))
+        except OSError:
+            pass
+    if evicted_files:
+        _count("evictions", len(evicted_files))
+
+
+def record_hosted_url(key, public_url, service, picture_id=None, picture_owner=None):
+    """Associa a URL pública (e o serviço que a hospeda; no ML, o ID da foto e a conta) aos bytes guardados."""
+    now = time.time()
+
+    def _record(index):
+        entry = index.get(key)
+        if entry is not None:
+            entry.update({"public_url": public_url, "service": service, "uploaded_at": now,
+                          "picture_id": picture_id, "picture_owner": picture_owner})
+    _index_store.update(_record)
+
+
+def image_cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["url_hits"] + stats["bytes_hits"] + stats["misses"]
+    stats["hit_rate"] = round((stats["url_hits"] + stats["bytes_hits"]) / lookups, 4) if lookups else 0.0
+    stats["entries"], stats["bytes"] = _index_store.read(lambda index: (len(index), sum(e.get("size", 0) for e in index.values())))
+    return stats
@@ -0,0 +1,89 @@
+# backend/utils/image_hosts.py
+from abc import ABC, abstractmethod
+import requests
+from .ml_http_client import ml_post
+
+# Serviços que hospedam as imagens processadas, todos com a mesma interface:
+# `upload(image_bytes, filename)` -> {"public_url", "picture_id"} ou None se falhou.
+# O primeiro da lista é o próprio Mercado Livre (/pictures/items/upload na conta ativa):
+# a foto já fica nos servidores do ML e o anúncio pode usar o ID dela, sem o ML ter de
+# baixar de um host gratuito. Imgur e 0x0.st ficam como alternativa (sem conta ML ativa
+# ou se o upload ao ML falhar).
+
+_MIME_BY_EXTENSION = {'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp', 'gif': 'image/gif'}
+
+
+def _mime_type(filename):
+    return _MIME_BY_EXTENSION.get(filename.rsplit('.', 1)[-1].lower(), 'application/octet-stream')
+
+
+class ImageHost(ABC):
+    name = None
+
+    @abstractmethod
+    def upload(self, image_bytes, filename):
+        """Retorna {"public_url", "picture_id"} ou None se o upload falhou."""
+
+
+class MLPicturesHost(ImageHost):
+    """Upload direto para as imagens da conta no Mercado Livre."""
+    name = "Mercado Livre"
+
+    def __init__(self, access_token):
+        self.access_token = access_token
+
+    def upload(self, image_bytes, filename):
+        try:
+            response = ml_post('/pictures/items/upload', endpoint='pictures_upload', access_token=self.access_token,
+                               files={'file': (filename, image_bytes, _mime_type(filename))})
+            if response.status_code not in (200, 201):
+                print(f"ML Pictures Upload Erro: {response.status_code} - {response.text[:200]}"); return None
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"ML Pictures Upload Exceção: {e}"); return None
+        variations = data.get('variations') or []
+        # Variação no tamanho máximo guardado pelo ML (a lista costuma vir da maior para a menor)
+        largest = next((v for v in variations if v.get('size') == data.get('max_size')), variations[0] if variations else {})
+        public_url = largest.get('secure_url') or largest.get('url')
+        if not data.get('id') or not public_url:
+            print(f"ML Pictures Upload: resposta sem id/url: {str(data)[:200]}"); return None
+        return {"public_url": public_url, "picture_id": data['id']}
+
+
+class ImgurHost(ImageHost):
+    name = "Imgur"
+
+    def __init__(self, client_id):
+        self.client_id = client_id
+
+    def upload(self, image_bytes, filename):
+        try:
+            headers = {'Authorization': f'Client-ID {self.client_id}'}
+            response = requests.post("https://api.imgur.com/3/image", headers=headers, files={'image': image_bytes}, timeout=45)
+            if response.status_code == 200:
+                data = response.json()
+                if data.get('success') and data.get('data', {}).get('link'):
+                    return {"public_url": data['data']['link'], "picture_id": None}
+            print(f"Imgur Upload Erro: {response.status_code} - {response.text[:200]}"); return None
+        except Exception as e: print(f"Imgur Upload Exceção: {e}"); return None
+
+
+class ZeroXZeroHost(ImageHost):
+    name = "0x0.st"
+
+    def upload(self, image_bytes, filename):
+        try:
+            response = requests.post("https://0x0.st", files={'file': (filename, image_bytes)}, timeout=30)
+            response.raise_for_status()
+            public_url = response.text.strip()
+            return {"public_url": public_url, "picture_id": None} if public_url.startswith("http") else None
+        except Exception as e: print(f"0x0.st Upload Exceção: {e}"); return None
+
+
+def upload_to_first_available(hosts, image_bytes, filename):
+    """Tenta cada serviço na ordem. Retorna ({"public_url", "picture_id"}, nome do serviço) ou (None, "Falha Upload")."""
+    for host in hosts:
+        hosted = host.upload(image_bytes, filename)
+        if hosted:
+            return hosted, host.name
+    return None, "Falha Upload"
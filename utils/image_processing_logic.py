@@ -4,114 +4,247 @@ import io
 from PIL import Image, UnidentifiedImageError
 import time
 
+MAX_IMAGE_SIZE_BYTES = 15 * 1024 * 1024
+IMAGE_DOWNLOAD_TIMEOUT = (3.05, 20) # (conexão, leitura)
+IMAGE_DOWNLOAD_CHUNK_BYTES = 64 * 1024
+# JPEG: decodifica já reduzido (escala 1/2, 1/4 ou 1/8 do DCT) para pelo menos este múltiplo
+# do tamanho final; o LANCZOS faz o resto. Mesmo critério do reducing_gap do Image.thumbnail.
+JPEG_DRAFT_REDUCING_GAP = 2.0
+# Resize: Image.reduce por fator inteiro enquanto sobrar este múltiplo do tamanho final, depois LANCZOS
+# (1.5 já reduz as fotos de 3000px pela metade para o alvo de 1000px, sem diferença visível)
+RESIZE_REDUCING_GAP = 1.5
+
+# Assinaturas (primeiros bytes) dos formatos aceitos
+_IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'), (b'GIF89a', 'GIF'),
+    (b'BM', 'BMP'),
+    (b'II*\x00', 'TIFF'), (b'MM\x00*', 'TIFF'),
+)
+IMAGE_SNIFF_BYTES = 12
+
+
+def sniff_image_format(head):
+    """Formato da imagem pelos primeiros bytes (None se não parece uma imagem conhecida)."""
+    head = bytes(head[:IMAGE_SNIFF_BYTES])
+    for signature, image_format in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    if head[4:8] == b'ftyp' and head[8:12] in (b'avif', b'avis'):
+        return 'AVIF'
+    return None
+
+
+def download_image_bytes(image_url, max_bytes=MAX_IMAGE_SIZE_BYTES):
+    """
+    Baixa a imagem em blocos, sem nunca guardar mais que `max_bytes`: a transferência é
+    interrompida assim que o limite é passado (mesmo sem content-length) ou se os primeiros
+    bytes não são de uma imagem (ex.: página HTML de erro).
+    Retorna {"error": False, "image_bytes", "format"} ou {"error": True, "message"}.
+    """
+    response = requests.get(image_url, timeout=IMAGE_DOWNLOAD_TIMEOUT, stream=True)
+    with response:
+        response.raise_for_status()
+        content_length = response.headers.get('content-length')
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            return {"error": True, "message": f"Imagem original excede {round(max_bytes / (1024 * 1024), 1):g}MB."}
+        buffer = bytearray()
+        image_format = None
+        for chunk in response.iter_content(IMAGE_DOWNLOAD_CHUNK_BYTES):
+            buffer += chunk
+            if len(buffer) > max_bytes:
+                return {"error": True, "message": f"Imagem original excede {round(max_bytes / (1024 * 1024), 1):g}MB."}
+            if image_format is None and len(buffer) >= IMAGE_SNIFF_BYTES:
+                image_format = sniff_image_format(buffer)
+                if image_format is None:
+                    return {"error": True, "message": "O endereço não retornou uma imagem em formato reconhecido."}
+    if image_format is None:
+        image_format = sniff_image_format(buffer)
+        if image_format is None:
+            return {"error": True, "message": "O endereço não retornou uma imagem em formato reconhecido."}
+    return {"error": False, "image_bytes": bytes(buffer), "format": image_format}
+
+
+def _draft_for_target(pil_image, target_w, target_h):
+    """Pede ao decodificador JPEG a menor escala que ainda cobre JPEG_DRAFT_REDUCING_GAP x o tamanho final (sem efeito em imagem já carregada)."""
+    if pil_image.format == 'JPEG' and pil_image.width and pil_image.height:
+        ratio = min(target_w / pil_image.width, target_h / pil_image.height)
+        pil_image.draft(None, (max(1, int(pil_image.width * ratio * JPEG_DRAFT_REDUCING_GAP)),
+                               max(1, int(pil_image.height * ratio * JPEG_DRAFT_REDUCING_GAP))))
+
+
+def open_image_for_target(image_bytes, target_w, target_h):
+    """
+    Abre a imagem já pensando no tamanho final: JPEGs são decodificados em escala reduzida
+    (draft), então uma foto de 50 MP vira ~2000px na decodificação em vez de ocupar centenas de MB.
+    """
+    pil_image = Image.open(io.BytesIO(image_bytes))
+    _draft_for_target(pil_image, target_w, target_h)
+    pil_image.load()
+    return pil_image
+
+
+def _reduce_and_resize(pil_image, size):
+    """
+    LANCZOS até `size`, reduzindo antes por fator inteiro (Image.reduce, média de blocos) enquanto
+    sobrar pelo menos RESIZE_REDUCING_GAP x o tamanho final. Com alfa, a imagem é pré-multiplicada
+    uma vez e o reduce/resize trabalham direto nela (o Pillow refaria a conversão em cada etapa).
+    """
+    premultiplied_mode = {'RGBA': 'RGBa', 'LA': 'La'}.get(pil_image.mode)
+    if premultiplied_mode:
+        original_mode = pil_image.mode
+        pil_image = pil_image.convert(premultiplied_mode)
+    factor_x = int(pil_image.width / size[0] / RESIZE_REDUCING_GAP) or 1
+    factor_y = int(pil_image.height / size[1] / RESIZE_REDUCING_GAP) or 1
+    if factor_x > 1 or factor_y > 1:
+        pil_image = pil_image.reduce((factor_x, factor_y))
+    resized_img = pil_image.resize(size, Image.Resampling.LANCZOS)
+    return resized_img.convert(original_mode) if premultiplied_mode else resized_img
+
+
+def _to_8bit_grayscale(pil_image):
+    """
+    Cinza de 16/32 bits (PNG/TIFF de 16 bits: modos I;16*, I, F) -> L. O reduce não aceita I;16
+    e o convert('L') direto satura tudo acima de 255, então os valores de 16 bits são escalados antes.
+    """
+    if pil_image.mode != 'F':
+        pil_image = pil_image.convert('I')
+    if pil_image.getextrema()[1] > 255:
+        pil_image = pil_image.point(lambda value: value / 256)
+    return pil_image.convert('L')
+
+
 def _resize_image_to_target_logic(pil_image, target_w, target_h, add_bg=True, bg_color=(255,255,255), quality=90, img_format='JPEG'):
-    """Redimensiona, adiciona fundo branco se necessário, e controla formato/qualidade."""
+    """
+    Redimensiona, adiciona fundo branco se necessário, e controla formato/qualidade.
+    Nenhuma cópia extra em tamanho original: o resize reduz primeiro por fator inteiro e só faz
+    o LANCZOS na imagem já pequena (ver _reduce_and_resize); o alfa é composto uma única vez,
+    no tamanho final, direto sobre o fundo.
+    """
     try:
-        # Converte modos problemáticos antes do processamento
-        if pil_image.mode == 'P' or pil_image.mode == 'LA':
-            pil_image = pil_image.convert("RGBA")
-        elif pil_image.mode == 'CMYK':
-             pil_image = pil_image.convert("RGB")
-        elif pil_image.mode == 'RGBA' and img_format.upper() == 'JPEG':
-            # Se for salvar como JPEG e tiver alfa, precisa de um fundo
-            background_for_alpha = Image.new("RGB", pil_image.size, bg_color[:3])
-            # Cola a imagem RGBA sobre o fundo RGB. O canal alfa da imagem RGBA será usado como máscara.
-            background_for_alpha.paste(pil_image, (0, 0), pil_image)
-            pil_image = background_for_alpha
-
+        original_w, original_h = pil_image.size
+        if original_w == 0 or original_h == 0:
+            print("Aviso: Imagem original com dimensão zero.")
+            return None
 
         if add_bg:
-            original_w, original_h = pil_image.size
-            if original_w == 0 or original_h == 0:
-                print("Aviso: Imagem original com dimensão zero.")
-                return None
-
             ratio = min(target_w / original_w, target_h / original_h)
             new_w = int(original_w * ratio)
             new_h = int(original_h * ratio)
             if new_w == 0 or new_h == 0:
                 print(f"Aviso: Novas dimensões calculadas são zero ({new_w}x{new_h}) para imagem original {original_w}x{original_h} e alvo {target_w}x{target_h}.")
                 return None # Evita erro no resize
-
-            resized_img = pil_image.resize((new_w, new_h), Image.Resampling.LANCZOS)
-
-            final_img_mode = "RGB"
-            actual_bg_color = bg_color[:3] # Default para JPEG
-
-            if img_format.upper() == 'PNG':
-                final_img_mode = "RGBA"
-                if len(bg_color) == 4 and bg_color[3] == 0: # Fundo transparente para PNG
-                    actual_bg_color = (255, 255, 255, 0)
-                elif len(bg_color) == 4: # Usa a cor RGBA fornecida
-                    actual_bg_color = bg_color
-                else: # Converte RGB para RGBA opaco
-                    actual_bg_color = (bg_color[0], bg_color[1], bg_color[2], 255)
-            
-            final_img = Image.new(final_img_mode, (target_w, target_h), actual_bg_color)
-            paste_x = (target_w - new_w) // 2
-            paste_y = (target_h - new_h) // 2
-
-            if resized_img.mode == 'RGBA':
-                if final_img.mode == 'RGBA':
-                    final_img.paste(resized_img, (paste_x, paste_y), resized_img) # Usa canal alfa da imagem como máscara
-                else: # final_img é RGB (para JPEG)
-                    # Cria um fundo temporário da cor desejada, cola a imagem RGBA nele, depois cola esse resultado
-                    temp_bg = Image.new("RGB", resized_img.size, actual_bg_color)
-                    temp_bg.paste(resized_img, (0,0), resized_img)
-                    final_img.paste(temp_bg, (paste_x, paste_y))
-            else: # Imagem redimensionada não tem alfa
-                # Converte para o modo da imagem final se for diferente
-                final_img.paste(resized_img.convert(final_img_mode) if resized_img.mode != final_img_mode else resized_img, (paste_x, paste_y))
-            return final_img
         else: # Apenas redimensiona, pode distorcer
-            return pil_image.resize((target_w, target_h), Image.Resampling.LANCZOS)
+            new_w, new_h = target_w, target_h
+
+        _draft_for_target(pil_image, new_w, new_h) # Só faz efeito se o JPEG ainda não foi decodificado
+
+        # Paleta, 1-bit e cinza de 16/32 bits não são reamostrados como estão; os demais modos
+        # (inclusive CMYK e LA) são redimensionados assim e só convertidos no paste, já no tamanho final
+        if pil_image.mode in ('P', 'PA'):
+            has_alpha = pil_image.mode == 'PA' or 'transparency' in pil_image.info
+            pil_image = pil_image.convert("RGBA" if has_alpha else "RGB")
+        elif pil_image.mode == '1':
+            pil_image = pil_image.convert("L")
+        elif pil_image.mode.startswith('I;16') or pil_image.mode in ('I', 'F'):
+            pil_image = _to_8bit_grayscale(pil_image)
+
+        resized_img = _reduce_and_resize(pil_image, (new_w, new_h))
+        has_alpha = resized_img.mode in ('RGBA', 'LA')
+        is_png = img_format.upper() == 'PNG'
+
+        if not add_bg and (resized_img.mode in ('RGB', 'L') or (is_png and has_alpha)):
+            return resized_img # Sem fundo: o canvas só é necessário para achatar alfa ou converter CMYK
+
+        final_img_mode = "RGB"
+        actual_bg_color = bg_color[:3] # Default para JPEG
+        if is_png:
+            final_img_mode = "RGBA"
+            if len(bg_color) == 4 and bg_color[3] == 0: # Fundo transparente para PNG
+                actual_bg_color = (255, 255, 255, 0)
+            elif len(bg_color) == 4: # Usa a cor RGBA fornecida
+                actual_bg_color = bg_color
+            else: # Converte RGB para RGBA opaco
+                actual_bg_color = (bg_color[0], bg_color[1], bg_color[2], 255)
+
+        final_img = Image.new(final_img_mode, (target_w, target_h), actual_bg_color)
+        paste_position = ((target_w - new_w) // 2, (target_h - new_h) // 2)
+        if has_alpha and final_img_mode == "RGBA":
+            if resized_img.mode != "RGBA":
+                resized_img = resized_img.convert("RGBA")
+            final_img.alpha_composite(resized_img, paste_position)
+        elif has_alpha: # Fundo RGB (JPEG): o próprio alfa é a máscara do paste
+            final_img.paste(resized_img, paste_position, resized_img)
+        else: # paste converte L/CMYK para o modo do fundo
+            final_img.paste(resized_img, paste_position)
+        return final_img
     except Exception as e:
         print(f"Erro severo em _resize_image_to_target_logic: {e}")
         return None
 
-def process_optimize_image_logic(image_url):
-    """Baixa, otimiza (1000x1000, fundo branco JPEG) e retorna bytes da imagem."""
+# Parâmetros de cada operação (também fazem parte da chave do cache de imagens processadas)
+OPTIMIZE_IMAGE_PARAMS = {"width": 1000, "height": 1000, "format": "JPEG", "quality": 90, "bg_color": [255, 255, 255]}
+REMOVE_BACKGROUND_PARAMS = {"width": 1000, "height": 1000, "format": "PNG", "removebg_size": "auto"}
+
+
+def optimize_image_bytes(image_bytes):
+    """Otimiza (1000x1000, fundo branco JPEG) a imagem já baixada e retorna os bytes do resultado."""
+    params = OPTIMIZE_IMAGE_PARAMS
     try:
-        print(f"Image Processing: Baixando para otimizar: {image_url}")
-        response = requests.get(image_url, timeout=20, stream=True)
-        response.raise_for_status()
-        MAX_IMAGE_SIZE_BYTES = 15 * 1024 * 1024
-        content_length = response.headers.get('content-length')
-        if content_length and int(content_length) > MAX_IMAGE_SIZE_BYTES:
-            return {"error": True, "message": "Imagem original excede 15MB."}
-        image_bytes = response.content
-        pil_image = Image.open(io.BytesIO(image_bytes))
-        
-        # Redimensionamento preliminar para imagens muito grandes para evitar consumo excessivo de memória
-        MAX_INITIAL_PIXELS = 5000 * 5000 # Limite arbitrário
-        if pil_image.width * pil_image.height > MAX_INITIAL_PIXELS:
-             pil_image.thumbnail((4000,4000), Image.Resampling.LANCZOS) # Reduz antes de processar mais
+        pil_image = open_image_for_target(image_bytes, params["width"], params["height"])
 
-        optimized_pil_image = _resize_image_to_target_logic(pil_image, 1000, 1000, add_bg=True, bg_color=(255,255,255), img_format='JPEG', quality=90)
+        optimized_pil_image = _resize_image_to_target_logic(pil_image, params["width"], params["height"], add_bg=True, bg_color=tuple(params["bg_color"]), img_format=params["format"], quality=params["quality"])
         if not optimized_pil_image:
             return {"error": True, "message": "Falha ao redimensionar/otimizar imagem (imagem resultante nula)."}
         byte_arr = io.BytesIO()
-        optimized_pil_image.save(byte_arr, format='JPEG', quality=90)
+        optimized_pil_image.save(byte_arr, format=params["format"], quality=params["quality"])
         print("Image Processing: Imagem otimizada para 1000x1000 JPEG.")
         return {"error": False, "image_bytes": byte_arr.getvalue()}
     except UnidentifiedImageError: return {"error": True, "message": "Formato de imagem não reconhecido ou arquivo corrompido."}
-    except requests.exceptions.RequestException as e: return {"error": True, "message": f"Erro de rede ao baixar imagem: {str(e)}"}
     except IOError as e_io: return {"error": True, "message": f"Erro de I/O ao processar imagem (Pillow): {str(e_io)}"}
     except Exception as e: return {"error": True, "message": f"Erro inesperado durante otimização da imagem: {str(e)}"}
 
+
+def fetch_image_logic(image_url):
+    """Baixa a imagem de origem (ver download_image_bytes), convertendo falhas de rede em erro."""
+    try:
+        return download_image_bytes(image_url)
+    except requests.exceptions.RequestException as e:
+        return {"error": True, "message": f"Erro de rede ao baixar imagem: {str(e)}"}
+
+
+def process_optimize_image_logic(image_url):
+    """Baixa, otimiza (1000x1000, fundo branco JPEG) e retorna bytes da imagem."""
+    print(f"Image Processing: Baixando para otimizar: {image_url}")
+    download = fetch_image_logic(image_url)
+    if download["error"]:
+        return download
+    return optimize_image_bytes(download["image_bytes"])
+
 def process_remove_background_logic(image_url, removebg_api_key):
     """Baixa imagem, remove fundo usando Remove.bg API, redimensiona para PNG com transparência e retorna bytes."""
     if not removebg_api_key:
         return {"error": True, "message": "Chave API Remove.bg não fornecida."}
+    print(f"Image Processing: Baixando para Remove.bg: {image_url}")
+    download = fetch_image_logic(image_url)
+    if download["error"]:
+        return {**download, "credits_charged": 0}
+    return remove_background_bytes(download["image_bytes"], removebg_api_key)
+
+
+def remove_background_bytes(original_image_bytes, removebg_api_key):
+    """Remove o fundo da imagem já baixada (Remove.bg), ajusta para 1000x1000 PNG transparente e retorna os bytes."""
+    if not removebg_api_key:
+        return {"error": True, "message": "Chave API Remove.bg não fornecida."}
+    params = REMOVE_BACKGROUND_PARAMS
     try:
-        print(f"Image Processing: Baixando para Remove.bg: {image_url}")
-        response_orig = requests.get(image_url, timeout=20, stream=True); response_orig.raise_for_status()
-        original_image_bytes = response_orig.content
-        
         print("Image Processing: Enviando para API Remove.bg...")
         files = {'image_file': ('original_image', original_image_bytes)} # O nome do arquivo aqui não é crítico
         headers = {'X-Api-Key': removebg_api_key}
-        data_payload = {'size': 'auto', 'format': 'png'} # Pede PNG para manter transparência
+        data_payload = {'size': params["removebg_size"], 'format': 'png'} # Pede PNG para manter transparência
         response_rbg = requests.post('https://api.remove.bg/v1.0/removebg', files=files, data=data_payload, headers=headers, timeout=45)
         
         credits_charged_str = response_rbg.headers.get('X-Credits-Charged', "0")
@@ -125,12 +258,10 @@ def process_remove_background_logic(image_url, removebg_api_key):
 
         if response_rbg.status_code == requests.codes.ok:
             processed_bytes_png = response_rbg.content
-            pil_image_no_bg = Image.open(io.BytesIO(processed_bytes_png))
-            if pil_image_no_bg.mode != 'RGBA': # Garante que é RGBA para o processamento de transparência
-                pil_image_no_bg = pil_image_no_bg.convert('RGBA')
+            pil_image_no_bg = Image.open(io.BytesIO(processed_bytes_png)) # O alfa é tratado no resize, já no tamanho final
 
             # Redimensiona para 1000x1000 mantendo transparência (add_bg=True, mas bg_color com alfa 0)
-            final_pil_image = _resize_image_to_target_logic(pil_image_no_bg, 1000, 1000, add_bg=True, bg_color=(255,255,255,0), img_format='PNG')
+            final_pil_image = _resize_image_to_target_logic(pil_image_no_bg, params["width"], params["height"], add_bg=True, bg_color=(255,255,255,0), img_format=params["format"])
             if not final_pil_image:
                  return {"error": True, "message": "Falha ao redimensionar imagem pós-Remove.bg.", "credits_charged": credits_charged}
             byte_arr = io.BytesIO()
@@ -0,0 +1,244 @@
+# backend/utils/json_file_store.py
+import os
+import json
+import time
+import copy
+import atexit
+import tempfile
+import threading
+
+try:
+    import fcntl # Trava entre workers (POSIX); no Windows a gravação segue só com o lock do processo
+except ImportError:
+    fcntl = None
+
+# Armazenamento JSON em memória com persistência "write-behind".
+# - Leituras servidas da memória (sem I/O); o arquivo só é relido quando o
+#   mtime muda (ex.: editado à mão ou gravado por outro worker), verificado
+#   no máximo a cada `reload_check_interval` segundos.
+# - Escritas marcam o conteúdo como sujo e são agrupadas por uma thread que
+#   grava após `write_delay` segundos, via arquivo temporário + fsync + rename,
+#   então um crash no meio da escrita nunca deixa o JSON truncado.
+# - Vários workers podem gravar o mesmo arquivo: a gravação acontece sob um flock
+#   (<arquivo>.lock) e, se outro processo gravou desde a última leitura, o arquivo é
+#   relido e as alterações locais ainda pendentes são reaplicadas sobre ele antes de
+#   gravar. Por isso as funções passadas a `update` devem só mutar os dados recebidos.
+
+
+def atomic_write_bytes(filepath, data):
+    """Grava bytes de forma atômica (temp no mesmo diretório + fsync + os.replace)."""
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(filepath) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+    try: # Garante que o rename também foi para o disco (POSIX)
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try: os.fsync(dir_fd)
+        finally: os.close(dir_fd)
+    except (OSError, AttributeError):
+        pass
+
+
+def atomic_write_text(filepath, text):
+    atomic_write_bytes(filepath, text.encode('utf-8'))
+
+
+def atomic_write_json(filepath, data, indent=2):
+    atomic_write_text(filepath, json.dumps(data, indent=indent, ensure_ascii=False))
+
+
+class JsonFileStore:
+    def __init__(self, filepath, default_factory, write_delay=0.5, reload_check_interval=2.0):
+        self.filepath = filepath
+        self.default_factory = default_factory
+        self.write_delay = write_delay
+        self.reload_check_interval = reload_check_interval
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock() # Serializa gravações sem bloquear leitores
+        self._data = None
+        self._version = 0 # Incrementado a cada mudança do conteúdo em memória
+        self._file_signature = None # (mtime_ns, size) do arquivo que está em memória
+        self._last_reload_check = 0.0
+        self._dirty = False
+        self._pending_updates = [] # Funções de update ainda não gravadas (reaplicadas se o arquivo mudar)
+        self._replaced = False # replace() pendente: o conteúdo em memória vale por inteiro
+        self._write_requested = threading.Event()
+        self._writer_thread = None
+        atexit.register(self.flush)
+
+    # --- Leitura ---
+    def _signature_on_disk(self):
+        try:
+            st = os.stat(self.filepath)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _load_from_disk(self):
+        signature = self._signature_on_disk()
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = self.default_factory()
+            self._dirty = True
+            self._schedule_write()
+        except (IOError, json.JSONDecodeError) as e:
+            if self._data is not None:
+                # Mantém o último conteúdo bom em memória em vez de zerar
+                print(f"JsonFileStore: {self.filepath} ilegível ({e}). Mantendo versão em memória.")
+                self._file_signature = signature
+                return
+            backup_path = f"{self.filepath}.corrupt-{int(time.time())}"
+            try: os.replace(self.filepath, backup_path)
+            except OSError: backup_path = None
+            print(f"JsonFileStore: {self.filepath} corrompido ({e}). Cópia em {backup_path}; usando conteúdo padrão.")
+            data = self.default_factory()
+            self._dirty = True
+            self._schedule_write()
+        self._data = data
+        self._version += 1
+        self._file_signature = signature
+
+    def _reload_keeping_pending_updates(self):
+        """Relê o arquivo (gravado por outro processo) e reaplica as alterações locais ainda não gravadas."""
+        version_before = self._version
+        self._load_from_disk()
+        if self._version == version_before:
+            return # Arquivo ilegível: a versão em memória (já com as alterações) foi mantida
+        for fn in self._pending_updates:
+            try:
+                fn(self._data)
+            except Exception as e:
+                print(f"JsonFileStore: alteração pendente não pôde ser reaplicada em {self.filepath}: {e}")
+
+    def _ensure_fresh(self, check_disk=False):
+        if self._data is None:
+            self._load_from_disk()
+            self._last_reload_check = time.monotonic()
+            return
+        now = time.monotonic()
+        if not check_disk and now - self._last_reload_check < self.reload_check_interval:
+            return
+        self._last_reload_check = now
+        if self._replaced:
+            return # replace() pendente tem prioridade sobre o arquivo
+        signature = self._signature_on_disk()
+        if signature is not None and signature != self._file_signature:
+            self._reload_keeping_pending_updates()
+
+    def version(self):
+        """Versão do conteúdo (permite a quem deriva dados do store cachear o resultado)."""
+        with self._lock:
+            self._ensure_fresh()
+            return self._version
+
+    def read(self, fn=None, check_disk=False):
+        """
+        Executa `fn(data)` sob o lock (sem copiar). Sem `fn`, retorna uma cópia profunda.
+        `check_disk=True` confere o mtime agora, sem esperar `reload_check_interval`.
+        """
+        with self._lock:
+            self._ensure_fresh(check_disk)
+            return fn(self._data) if fn else copy.deepcopy(self._data)
+
+    # --- Escrita ---
+    def update(self, fn, durable=False):
+        """
+        Aplica `fn(data)` (mutação in-place) e agenda a gravação. Retorna o resultado de fn.
+        `durable=True` grava antes de retornar (ex.: refresh tokens, que não podem se perder).
+        """
+        with self._lock:
+            self._ensure_fresh()
+            result = fn(self._data)
+            if not self._replaced:
+                self._pending_updates.append(fn)
+            self._version += 1
+            self._dirty = True
+        if durable:
+            self.flush()
+        else:
+            self._schedule_write()
+        return result
+
+    def replace(self, new_data):
+        with self._lock:
+            self._data = copy.deepcopy(new_data)
+            self._pending_updates = []
+            self._replaced = True
+            self._version += 1
+            self._dirty = True
+        self._schedule_write()
+
+    def _schedule_write(self):
+        with self._lock:
+            if self._writer_thread is None or not self._writer_thread.is_alive():
+                self._writer_thread = threading.Thread(target=self._writer_loop, name=f"store-writer-{os.path.basename(self.filepath)}", daemon=True)
+                self._writer_thread.start()
+        self._write_requested.set()
+
+    def _writer_loop(self):
+        while True:
+            self._write_requested.wait()
+            time.sleep(self.write_delay) # Agrupa rajadas de alterações numa única escrita
+            self._write_requested.clear()
+            self.flush()
+
+    def _open_process_lock(self):
+        if fcntl is None:
+            return None
+        try:
+            lock_file = open(self.filepath + '.lock', 'w')
+        except OSError as e:
+            print(f"JsonFileStore: sem trava entre processos para {self.filepath}: {e}")
+            return None
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def flush(self):
+        """Grava imediatamente se houver alterações pendentes."""
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty or self._data is None:
+                    return
+            lock_file = self._open_process_lock()
+            try:
+                self._flush_locked()
+            finally:
+                if lock_file is not None:
+                    lock_file.close()
+
+    def _flush_locked(self):
+        with self._lock:
+            if not self._dirty or self._data is None:
+                return
+            if not self._replaced and self._signature_on_disk() not in (None, self._file_signature):
+                self._reload_keeping_pending_updates() # Outro worker gravou: não sobrescreve o que ele salvou
+            try:
+                payload = json.dumps(self._data, indent=2, ensure_ascii=False)
+            except (TypeError, ValueError) as e:
+                print(f"JsonFileStore: conteúdo não serializável para {self.filepath}: {e}")
+                return
+            written_updates = len(self._pending_updates)
+            was_replaced = self._replaced
+            self._dirty = False
+            self._replaced = False
+        try:
+            atomic_write_text(self.filepath, payload)
+        except (IOError, OSError) as e:
+            print(f"JsonFileStore: erro ao salvar {self.filepath}: {e}")
+            with self._lock:
+                self._dirty = True
+                self._replaced = self._replaced or was_replaced
+            return
+        with self._lock:
+            del self._pending_updates[:written_updates]
+            self._file_signature = self._signature_on_disk()
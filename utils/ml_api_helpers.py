@@ -3,6 +3,7 @@ import requests
 import time
 import json
 from flask import current_app # Para acessar config do Flask
+from .ml_http_client import ml_get, ml_post
 
 def get_ml_user_info(access_token):
     """Busca informações do usuário ML (nickname, ID) usando o access_token."""
@@ -11,15 +12,13 @@ def get_ml_user_info(access_token):
         return None
     
     ml_user_info_url = current_app.config.get('ML_USER_INFO_URL')
-    app_user_agent = current_app.config.get('APP_USER_AGENT')
 
-    if not ml_user_info_url or not app_user_agent:
-        print("get_ml_user_info: Configurações ML_USER_INFO_URL ou APP_USER_AGENT não encontradas no app Flask.")
+    if not ml_user_info_url:
+        print("get_ml_user_info: Configuração ML_USER_INFO_URL não encontrada no app Flask.")
         return None
 
-    headers = {'Authorization': f'Bearer {access_token}', 'User-Agent': app_user_agent}
     try:
-        response = requests.get(ml_user_info_url, headers=headers, timeout=10)
+        response = ml_get(ml_user_info_url, endpoint='user_info', access_token=access_token)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -40,9 +39,8 @@ def refresh_ml_token(refresh_token_value):
     client_id = current_app.config.get('ML_CLIENT_ID')
     client_secret = current_app.config.get('ML_CLIENT_SECRET')
     token_url = current_app.config.get('ML_TOKEN_URL')
-    app_user_agent = current_app.config.get('APP_USER_AGENT')
 
-    if not all([client_id, client_secret, token_url, app_user_agent]):
+    if not all([client_id, client_secret, token_url]):
         print("refresh_ml_token: Configurações ML ausentes no app Flask.")
         return None
 
@@ -52,10 +50,9 @@ def refresh_ml_token(refresh_token_value):
         'client_secret': client_secret,
         'refresh_token': refresh_token_value
     }
-    headers = {'Accept': 'application/json', 'User-Agent': app_user_agent}
     try:
         print(f"Refresh ML Token: Tentando renovar com refresh_token: ...{refresh_token_value[-6:]}")
-        res = requests.post(token_url, data=payload, headers=headers, timeout=20)
+        res = ml_post(token_url, endpoint='oauth_token', data=payload)
         res.raise_for_status()
         token_data = res.json()
 
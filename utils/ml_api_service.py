@@ -1,75 +1,152 @@
 # backend/utils/ml_api_service.py
+import os
 import requests
 import time
 import json
 from flask import current_app
+from .ml_http_client import ml_get, ml_get_coalesced, ml_url
+from .concurrency import SingleFlight, get_executor, map_in_app_context, run_keyed_tasks
+from .ml_rate_governor import ml_priority, PRIORITY_BACKGROUND
+from .ml_attribute_cache import (
+    count_attribute_cache_event, get_slim_attributes, lookup_category_attributes,
+    record_category_attributes, touch_category_attributes
+)
+from .ml_prediction_cache import lookup_prediction, normalize_title, record_prediction
+from .ml_category_tree import ml_category_tree
 
-def get_ml_category_suggestion_logic(title, access_token):
-    if not title:
+ML_ATTRIBUTE_PREWARM_MAX_WORKERS = 4
+ML_PREDICTION_MAX_WORKERS = int(os.environ.get('ML_PREDICTION_MAX_WORKERS', 8))
+
+def _category_path(category_id, access_token):
+    """
+    path_from_root da categoria: do snapshot local da árvore ou, se ele ainda não existe
+    (primeira subida, download falhou) ou não tem a categoria, de /categories/{id}.
+    Retorna [] se nenhum dos dois respondeu.
+    """
+    tree = ml_category_tree.get_tree()
+    if tree is not None and category_id in tree:
+        return tree.path_from_root(category_id)
+    try:
+        response = ml_get_coalesced(ml_url(f"/categories/{category_id}"), endpoint='categories', access_token=access_token, auth_scope='public')
+        response.raise_for_status()
+        return [{"id": node.get("id"), "name": node.get("name")} for node in response.json().get("path_from_root") or []]
+    except (requests.exceptions.RequestException, ValueError, AttributeError) as e:
+        print(f"ML_API_SERVICE (Predict): Caminho da categoria {category_id} indisponível - {str(e)[:150]}")
+        return []
+
+
+def _fetch_category_candidates(title, access_token, limit):
+    site_id = current_app.config.get('ML_SITE_ID', "MLB")
+    url = ml_url(f"/sites/{site_id}/domain_discovery/search")
+    params = {'q': title, 'limit': limit}
+    print(f"ML_API_SERVICE (Predict): Chamando URL: {url} com params: {params}")
+    response = ml_get_coalesced(url, endpoint='category_predictor', access_token=access_token, params=params, auth_scope='public')
+    print(f"ML_API_SERVICE (Predict): Status da API ML: {response.status_code}")
+    if response.status_code == 404: # O ML não encontrou nada para o título
+        return []
+    response.raise_for_status()
+    candidates = []
+    for raw in response.json() or []:
+        if isinstance(raw, dict) and raw.get("category_id"):
+            candidates.append({
+                "category_id": raw["category_id"],
+                "category_name": raw.get("category_name"),
+                "domain_id": raw.get("domain_id"),
+                "domain_name": raw.get("domain_name"),
+                "path_from_root": _category_path(raw["category_id"], access_token)
+            })
+    return candidates
+
+
+def predict_categories_logic(title, access_token, limit=1):
+    """
+    Até `limit` categorias candidatas para o título, da mais provável para a menos.
+    Previsões ficam em cache pelo título normalizado (ver ml_prediction_cache.py).
+    """
+    if not title or not title.strip():
         return {"error": True, "message": "Título é obrigatório para sugestão de categoria."} # Erro da nossa app
+    site_id = current_app.config.get('ML_SITE_ID', "MLB")
+    candidates = lookup_prediction(site_id, title, limit)
+    if candidates is not None:
+        return {"error": False, "candidates": candidates}
     if not access_token:
         return {"error": True, "message": "Token de acesso ML não fornecido."} # Erro da nossa app
 
-    sites_url = current_app.config.get('ML_SITES_URL', "https://api.mercadolibre.com/sites")
-    site_id = current_app.config.get('ML_SITE_ID', "MLB")
-    app_user_agent = current_app.config.get('APP_USER_AGENT')
-    url = f"{sites_url}/{site_id}/category_predictor/predict"
-    headers = {'Authorization': f'Bearer {access_token}', 'User-Agent': app_user_agent}
-    params = {'title': title, 'limit': 1}
-
     try:
-        print(f"ML_API_SERVICE (Suggest): Chamando URL: {url} com params: {params}")
-        response = requests.get(url, headers=headers, params=params, timeout=10)
-        print(f"ML_API_SERVICE (Suggest): Status da API ML: {response.status_code}")
-
-        if response.status_code == 200:
-            prediction = response.json()
-            if prediction and prediction.get("id"):
-                return {
-                    "error": False, # Indica sucesso da nossa perspectiva
-                    "category_id": prediction["id"],
-                    "category_name": prediction["name"],
-                    "path_from_root": prediction.get("path_from_root", [])
-                }
-            else:
-                # API retornou 200 mas sem sugestão válida
-                return {"error": False, "message": "Nenhuma sugestão de categoria encontrada pelo preditor do ML."}
-        elif response.status_code == 404:
-            # API do ML não encontrou nada para o título
-            return {"error": False, "message": f"Nenhuma sugestão de categoria para o título (API ML: 404)."}
-        else:
-            # Outros erros HTTP da API ML
-            response.raise_for_status() # Deixa outros erros serem capturados abaixo
-            return {"error": True, "message": "Resposta inesperada do preditor de categoria ML."} # Fallback
-
+        candidates = _fetch_category_candidates(title, access_token, limit)
     except requests.exceptions.HTTPError as e_http:
         err_detail = e_http.response.text[:150] if hasattr(e_http, 'response') and e_http.response else str(e_http)
         status_code = e_http.response.status_code if hasattr(e_http, 'response') and e_http.response else 500
-        print(f"ML_API_SERVICE (Suggest): Erro HTTP {status_code} da API ML - {err_detail}")
+        print(f"ML_API_SERVICE (Predict): Erro HTTP {status_code} da API ML - {err_detail}")
         return {"error": True, "message": f"Erro da API ML ao sugerir categoria ({status_code}): {err_detail}"}
     except requests.exceptions.RequestException as e:
-        print(f"ML_API_SERVICE (Suggest): Erro de rede - {str(e)}")
+        print(f"ML_API_SERVICE (Predict): Erro de rede - {str(e)}")
         return {"error": True, "message": f"Erro de rede ao buscar sugestão de categoria ML: {str(e)}"}
-    except Exception as e_gen:
-        print(f"ML_API_SERVICE (Suggest): Erro inesperado - {str(e_gen)}")
-        return {"error": True, "message": f"Erro inesperado na sugestão de categoria ML: {str(e_gen)}"}
+    except ValueError as e:
+        print(f"ML_API_SERVICE (Predict): Resposta inválida - {str(e)}")
+        return {"error": True, "message": "Resposta inesperada do preditor de categoria ML."}
+    # Resposta vazia (pode ser passageira) ou sem caminho: não fica em cache, tenta de novo na próxima vez
+    if candidates and all(candidate["path_from_root"] for candidate in candidates):
+        record_prediction(site_id, title, limit, candidates)
+    return {"error": False, "candidates": candidates}
+
+
+def get_ml_category_suggestion_logic(title, access_token):
+    result = predict_categories_logic(title, access_token, limit=1)
+    if result.get("error"):
+        return result
+    if not result["candidates"]:
+        return {"error": False, "message": "Nenhuma sugestão de categoria encontrada pelo preditor do ML."}
+    best = result["candidates"][0]
+    return {
+        "error": False, # Indica sucesso da nossa perspectiva
+        "category_id": best["category_id"],
+        "category_name": best["category_name"],
+        "path_from_root": best["path_from_root"]
+    }
+
+
+def predict_categories_batch_logic(titles, access_token, limit=3):
+    """
+    Previsão para muitos títulos de uma vez (ex.: importação de produtos do Tiny).
+    Títulos repetidos (após normalização) são consultados uma única vez; as consultas
+    rodam em paralelo com prioridade de segundo plano no governador de tráfego.
+    Retorna [{"title", "candidates"} ou {"title", "error_message"}] na ordem de entrada.
+    """
+    by_normalized = {}
+    for title in titles:
+        by_normalized.setdefault(normalize_title(title or ''), title)
+    app = current_app._get_current_object()
+    executor = get_executor('ml-category-prediction', ML_PREDICTION_MAX_WORKERS)
+    tasks = {normalized: (predict_categories_logic, (title, access_token, limit)) for normalized, title in by_normalized.items()}
+    results = {}
+    with ml_priority(PRIORITY_BACKGROUND):
+        for normalized, result in run_keyed_tasks(executor, app, tasks):
+            results[normalized] = result
+
+    output = []
+    for title in titles:
+        result = results.get(normalize_title(title or '')) or {"error": True, "message": "Sem resposta."}
+        if result.get("error"):
+            output.append({"title": title, "error_message": result.get("message")})
+        else:
+            output.append({"title": title, "candidates": result["candidates"]})
+    return output
 
 
 def get_ml_categories_logic(access_token, category_id=None):
     # ... (esta função parecia estar ok, mas adicione logs similares se precisar depurar) ...
     if not access_token:
         return {"error": True, "message": "Token de acesso ML não fornecido."}
-    sites_url = current_app.config.get('ML_SITES_URL', "https://api.mercadolibre.com/sites")
+    sites_url = current_app.config.get('ML_SITES_URL', ml_url("/sites"))
     site_id = current_app.config.get('ML_SITE_ID', "MLB")
-    app_user_agent = current_app.config.get('APP_USER_AGENT')
     if category_id:
-        url = f"https://api.mercadolibre.com/categories/{category_id}"
+        url = ml_url(f"/categories/{category_id}")
     else:
         url = f"{sites_url}/{site_id}/categories"
-    headers = {'Authorization': f'Bearer {access_token}', 'User-Agent': app_user_agent}
     try:
         print(f"ML_API_SERVICE (GetCategories): Chamando URL: {url}")
-        response = requests.get(url, headers=headers, timeout=10)
+        response = ml_get_coalesced(url, endpoint='categories', access_token=access_token, auth_scope='public')
         print(f"ML_API_SERVICE (GetCategories): Status da API ML: {response.status_code}")
         response.raise_for_status()
         data = response.json()
@@ -94,13 +171,11 @@ def search_ml_categories_logic(query, access_token):
         return {"error": True, "message": "Token de acesso ML não fornecido."}
 
     site_id = current_app.config.get('ML_SITE_ID', "MLB")
-    app_user_agent = current_app.config.get('APP_USER_AGENT')
-    url = f"https://api.mercadolibre.com/sites/{site_id}/category_discovery/search"
+    url = ml_url(f"/sites/{site_id}/category_discovery/search")
     params = {'q': query, 'limit': 30}
-    headers = {'Authorization': f'Bearer {access_token}', 'User-Agent': app_user_agent}
     try:
         print(f"ML_API_SERVICE (SearchCategories): Chamando URL: {url} com params: {params}")
-        response = requests.get(url, headers=headers, params=params, timeout=15)
+        response = ml_get_coalesced(url, endpoint='category_search', access_token=access_token, params=params, auth_scope='public')
         print(f"ML_API_SERVICE (SearchCategories): Status da API ML: {response.status_code}")
         # Tratar 403 especificamente ou deixar raise_for_status pegar
         if response.status_code == 403:
@@ -131,95 +206,199 @@ def search_ml_categories_logic(query, access_token):
         print(f"ML_API_SERVICE (SearchCategories): Erro - {str(e)}")
         return {"error": True, "message": f"Erro na busca de categorias ML: {str(e)}"}
 
-# ... (get_ml_category_attributes_logic e check_sku_on_ml_account_logic como antes, mas adicione logs se necessário) ...
-def get_ml_category_attributes_logic(category_id, access_token):
-    if not category_id or not access_token:
-        return {"error_message": "ID da categoria ou token de acesso ausente para buscar atributos."}
-    ml_attributes_url_template = current_app.config['ML_CATEGORY_ATTRIBUTES_URL_TEMPLATE']
-    app_user_agent = current_app.config['APP_USER_AGENT']
-    url = ml_attributes_url_template.format(cat_id=category_id)
-    headers = {'Authorization': f'Bearer {access_token}', 'User-Agent': app_user_agent}
-    try:
-        print(f"ML_API_SERVICE (GetAttributes): Chamando URL: {url}")
-        response = requests.get(url, headers=headers, timeout=15)
-        print(f"ML_API_SERVICE (GetAttributes): Status da API ML: {response.status_code}")
-        response.raise_for_status()
-        attributes_data = response.json()
-        print(f"DEBUG ML_API_SERVICE - Atributos BRUTOS da API ML para {category_id}: {json.dumps(attributes_data, indent=2, ensure_ascii=False)}")
-        if not isinstance(attributes_data, list):
-            print(f"ML_API_SERVICE - AVISO: Resposta de atributos para {category_id} NÃO é uma lista. Tipo: {type(attributes_data)}")
-            return {"error_message": "Resposta da API de atributos ML não é uma lista.", "attributes": []}
-        return {"error": False, "attributes": attributes_data}
-        return {"error": False, "attributes": attributes_data}
-    except requests.exceptions.HTTPError as e_http:
-        err_detail = e_http.response.text[:150] if hasattr(e_http, 'response') and e_http.response else str(e_http)
-        status_code = e_http.response.status_code if hasattr(e_http, 'response') and e_http.response else 500
-        print(f"ML_API_SERVICE (GetAttributes): Erro HTTP {status_code} - {err_detail}")
-        return {"error_message": f"Erro HTTP atributos ML ({status_code}): {err_detail}", "attributes": []}
-    except Exception as e:
-        print(f"ML_API_SERVICE (GetAttributes): Erro - {str(e)}")
-        return {"error_message": f"Erro ao buscar atributos ML: {str(e)}", "attributes": []}
+def _fetch_category_attributes(category_id, access_token, cached):
+    """Baixa (ou revalida com If-None-Match) os atributos da categoria e atualiza o cache."""
+    url = current_app.config['ML_CATEGORY_ATTRIBUTES_URL_TEMPLATE'].format(cat_id=category_id)
+    headers = {'If-None-Match': cached["etag"]} if cached and cached.get("etag") else None
+    print(f"ML_API_SERVICE (GetAttributes): Chamando URL: {url}{' (revalidação)' if headers else ''}")
+    response = ml_get(url, endpoint='category_attributes', access_token=access_token, headers=headers)
+    print(f"ML_API_SERVICE (GetAttributes): Status da API ML: {response.status_code}")
+    if response.status_code == 304 and cached:
+        count_attribute_cache_event("revalidated")
+        return touch_category_attributes(category_id, cached)
+    response.raise_for_status()
+    attributes_data = response.json()
+    if not isinstance(attributes_data, list):
+        raise ValueError(f"Resposta da API de atributos ML não é uma lista (tipo: {type(attributes_data).__name__}).")
+    count_attribute_cache_event("refreshed" if cached else "misses")
+    return record_category_attributes(category_id, attributes_data, response.headers.get('ETag'))
+
+
+_attribute_fetches = SingleFlight() # Uma única busca por categoria, mesmo com várias abas abrindo a Ficha Técnica
+
+
+def get_ml_category_attributes_logic(category_id, access_token, slim=False):
+    """
+    Atributos da categoria, do cache local sempre que possível (ver ml_attribute_cache.py).
+    `slim=True` devolve só os campos que o frontend renderiza.
+    """
+    if not category_id:
+        return {"error_message": "ID da categoria ausente para buscar atributos."}
+    cached = lookup_category_attributes(category_id)
+    entry = None
+    if cached and cached["fresh"]:
+        count_attribute_cache_event("hits")
+        entry = cached
+    elif not access_token:
+        if not cached:
+            return {"error_message": "ID da categoria ou token de acesso ausente para buscar atributos."}
+        count_attribute_cache_event("stale_served")
+        entry = cached
+    else:
+        try:
+            entry = _attribute_fetches.do(category_id, _fetch_category_attributes, category_id, access_token, cached)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+                err_detail = f"Erro HTTP atributos ML ({e.response.status_code}): {e.response.text[:150]}"
+            else:
+                err_detail = f"Erro ao buscar atributos ML: {str(e)}"
+            print(f"ML_API_SERVICE (GetAttributes): {err_detail}")
+            if not cached:
+                return {"error_message": err_detail, "attributes": []}
+            print(f"ML_API_SERVICE (GetAttributes): usando cache vencido de {category_id}.")
+            count_attribute_cache_event("stale_served")
+            entry = cached
+    attributes = get_slim_attributes(category_id, entry) if slim else entry["attributes"]
+    return {"error": False, "attributes": attributes}
+
+
+def prewarm_category_attributes_logic(category_ids, access_token):
+    """
+    Baixa/revalida em segundo plano os atributos das categorias informadas que não estão frescos no cache.
+    Retorna a contagem por situação ({"fresh", "updated", "failed"}).
+    """
+    summary = {"fresh": 0, "updated": 0, "failed": 0}
+    pending = []
+    for category_id in dict.fromkeys(category_ids):
+        cached = lookup_category_attributes(category_id)
+        if cached and cached["fresh"]:
+            summary["fresh"] += 1
+        else:
+            pending.append(category_id)
+    if not pending:
+        return summary
+
+    app = current_app._get_current_object()
+    executor = get_executor('ml-attribute-prewarm', ML_ATTRIBUTE_PREWARM_MAX_WORKERS)
+    with ml_priority(PRIORITY_BACKGROUND):
+        tasks = {category_id: (get_ml_category_attributes_logic, (category_id, access_token)) for category_id in pending}
+        for _, result in run_keyed_tasks(executor, app, tasks):
+            summary["failed" if result.get("error_message") or result.get("error") else "updated"] += 1
+    print(f"ML_API_SERVICE (PrewarmAttributes): {summary}")
+    return summary
+
+
+ML_ITEMS_SEARCH_PAGE_SIZE = 100 # Máximo aceito por /users/{id}/items/search
+ML_ITEMS_SEARCH_MAX_OFFSET = 1000 # Acima disso o ML exige search_type=scan
+ML_MULTIGET_CHUNK_SIZE = 20 # Máximo de ids por /items?ids=
+ML_MULTIGET_MAX_WORKERS = int(os.environ.get('ML_MULTIGET_MAX_WORKERS', 8))
+# Campos do item usados na checagem de SKU (o resto do corpo não é baixado)
+SKU_CHECK_ITEM_FIELDS = 'id,title,permalink,listing_type_id,status,price,seller_custom_field,attributes,sold_quantity'
+
+
+def _search_item_ids_by_sku(search_url, access_token, sku_to_check):
+    """Pagina /items/search até o fim e retorna todos os ids (sem duplicatas, na ordem do ML)."""
+    base_params = {'seller_sku': sku_to_check, 'status': 'active,paused', 'limit': ML_ITEMS_SEARCH_PAGE_SIZE}
+
+    response = ml_get(search_url, endpoint='items_search', access_token=access_token, params={**base_params, 'offset': 0})
+    response.raise_for_status()
+    first_page = response.json()
+    item_ids = list(first_page.get("results", []))
+    total = int(first_page.get("paging", {}).get("total") or len(item_ids))
+
+    if total > ML_ITEMS_SEARCH_MAX_OFFSET:
+        # Muitos resultados: modo scan (sequencial, via scroll_id)
+        item_ids = []
+        scan_params = {**base_params, 'search_type': 'scan'}
+        while True:
+            response = ml_get(search_url, endpoint='items_search', access_token=access_token, params=scan_params)
+            response.raise_for_status()
+            page = response.json()
+            page_ids = page.get("results", [])
+            if not page_ids:
+                break
+            item_ids.extend(page_ids)
+            scan_params['scroll_id'] = page.get("scroll_id")
+            if not scan_params['scroll_id']:
+                break
+    elif total > len(item_ids):
+        # Demais páginas em paralelo
+        def fetch_page(offset):
+            page_response = ml_get(search_url, endpoint='items_search', access_token=access_token, params={**base_params, 'offset': offset})
+            page_response.raise_for_status()
+            return page_response.json().get("results", [])
+        # Nas threads do pool, mantém app context e prioridade de quem chamou (ex.: lote em segundo plano)
+        executor = get_executor('ml-multiget', ML_MULTIGET_MAX_WORKERS)
+        offsets = range(ML_ITEMS_SEARCH_PAGE_SIZE, total, ML_ITEMS_SEARCH_PAGE_SIZE)
+        for page_ids in map_in_app_context(executor, current_app._get_current_object(), fetch_page, offsets):
+            item_ids.extend(page_ids)
+
+    return list(dict.fromkeys(item_ids))
+
+
+def _multiget_items(item_ids, access_token, fields):
+    """Busca os itens em blocos de 20 ids, com os blocos em paralelo. Retorna os corpos (code 200)."""
+    def fetch_chunk(chunk_ids):
+        mg_response = ml_get(ml_url("/items"), endpoint='items_multiget', access_token=access_token,
+                             params={'ids': ",".join(chunk_ids), 'attributes': fields})
+        mg_response.raise_for_status()
+        return mg_response.json()
+
+    chunks = [item_ids[i:i + ML_MULTIGET_CHUNK_SIZE] for i in range(0, len(item_ids), ML_MULTIGET_CHUNK_SIZE)]
+    if len(chunks) == 1:
+        chunk_results = [fetch_chunk(chunks[0])]
+    else:
+        executor = get_executor('ml-multiget', ML_MULTIGET_MAX_WORKERS)
+        chunk_results = map_in_app_context(executor, current_app._get_current_object(), fetch_chunk, chunks)
+
+    bodies = []
+    for mg_data in chunk_results:
+        for item_result_wrapper in mg_data or []:
+            if isinstance(item_result_wrapper, dict) and item_result_wrapper.get('code') == 200 and item_result_wrapper.get('body'):
+                bodies.append(item_result_wrapper['body'])
+    return bodies
+
+
+def _item_matches_sku(item_body, sku_normalized):
+    """SKU exato: atributo SELLER_SKU tem prioridade; seller_custom_field só vale se não houver SELLER_SKU."""
+    for attr_check in item_body.get('attributes') or []:
+        if attr_check.get('id') == 'SELLER_SKU':
+            seller_sku_value = attr_check.get('value_name')
+            if seller_sku_value:
+                return seller_sku_value.strip().lower() == sku_normalized
+            break
+    custom_field_value = item_body.get('seller_custom_field')
+    return bool(custom_field_value) and custom_field_value.strip().lower() == sku_normalized
 
 
 def check_sku_on_ml_account_logic(sku_to_check, access_token, seller_id):
-    # ... (código como na sua última versão) ...
     if not sku_to_check or not access_token or not seller_id:
         return {"error": True, "message": "Dados insuficientes para verificar SKU (SKU, token ou seller_id ausente)."} # Mudado para error:True
 
-    search_url = f"https://api.mercadolibre.com/users/{seller_id}/items/search"
-    params_sku = {'seller_sku': sku_to_check, 'status': 'active,paused', 'limit': 50} 
-    headers_ml = {'Authorization': f'Bearer {access_token}', 'User-Agent': current_app.config['APP_USER_AGENT']}
+    search_url = ml_url(f"/users/{seller_id}/items/search")
+    sku_normalized = sku_to_check.strip().lower()
     found_items_for_account = []
 
     try:
         print(f"  ML SKU Check Logic: Buscando SKU '{sku_to_check}' para vendedor '{seller_id}'")
-        response = requests.get(search_url, headers=headers_ml, params=params_sku, timeout=20)
-        response.raise_for_status()
-        search_data = response.json()
-        item_ids_found_initial = search_data.get("results", [])
-        print(f"    ML SKU Check Logic: IDs da busca inicial por seller_sku: {item_ids_found_initial}")
-
-        if item_ids_found_initial:
-            ids_to_fetch_details = item_ids_found_initial[:20] 
-            if ids_to_fetch_details:
-                multiget_url = f"https://api.mercadolibre.com/items"
-                multiget_params = {
-                    'ids': ",".join(ids_to_fetch_details),
-                    'attributes': 'id,title,permalink,listing_type_id,status,price,seller_custom_field,attributes,sold_quantity'
-                }
-                mg_response = requests.get(multiget_url, headers=headers_ml, params=multiget_params, timeout=25)
-                mg_response.raise_for_status()
-                mg_data = mg_response.json()
-
-                for item_result_wrapper in mg_data:
-                    if isinstance(item_result_wrapper, dict) and item_result_wrapper.get('code') == 200:
-                        item_body = item_result_wrapper.get('body', {})
-                        if not item_body: continue
-                        item_seller_sku_attr_val = None
-                        attributes_list_check = item_body.get('attributes', [])
-                        for attr_check in attributes_list_check:
-                            if attr_check.get('id') == 'SELLER_SKU':
-                                item_seller_sku_attr_val = attr_check.get('value_name'); break
-                        item_custom_field_val = item_body.get('seller_custom_field')
-                        sku_matches_exactly = False
-                        if item_seller_sku_attr_val and sku_to_check.strip().lower() == item_seller_sku_attr_val.strip().lower():
-                            sku_matches_exactly = True
-                        elif not item_seller_sku_attr_val and item_custom_field_val and sku_to_check.strip().lower() == item_custom_field_val.strip().lower():
-                            sku_matches_exactly = True
-                        
-                        if sku_matches_exactly:
-                            found_items_for_account.append({
-                                "id": item_body.get("id"), "title": item_body.get("title", "N/A")[:70],
-                                "permalink": item_body.get("permalink"), "status": item_body.get("status"),
-                                "listing_type_id": item_body.get("listing_type_id"), "price": item_body.get("price"),
-                                "sold_quantity": item_body.get("sold_quantity", 0)
-                            })
+        item_ids_found = _search_item_ids_by_sku(search_url, access_token, sku_to_check)
+        print(f"    ML SKU Check Logic: {len(item_ids_found)} IDs encontrados pela busca por seller_sku")
+
+        if item_ids_found:
+            for item_body in _multiget_items(item_ids_found, access_token, SKU_CHECK_ITEM_FIELDS):
+                if _item_matches_sku(item_body, sku_normalized):
+                    found_items_for_account.append({
+                        "id": item_body.get("id"), "title": (item_body.get("title") or "N/A")[:70],
+                        "permalink": item_body.get("permalink"), "status": item_body.get("status"),
+                        "listing_type_id": item_body.get("listing_type_id"), "price": item_body.get("price"),
+                        "sold_quantity": item_body.get("sold_quantity", 0)
+                    })
         return {"error": False, "found": bool(found_items_for_account), "items": found_items_for_account}
     except requests.exceptions.HTTPError as e_http:
-        err_detail = e_http.response.text[:100] if hasattr(e_http,'response') and e_http.response else str(e_http)
-        status_code = e_http.response.status_code if hasattr(e_http,'response') and e_http.response else 500
+        err_detail = e_http.response.text[:100] if hasattr(e_http,'response') and e_http.response is not None else str(e_http)
+        status_code = e_http.response.status_code if hasattr(e_http,'response') and e_http.response is not None else 500
         return {"error": True, "found": False, "items": [], "message": f"Erro HTTP {status_code} ao verificar SKU: {err_detail}"}
     except requests.exceptions.RequestException as e_req:
         return {"error": True, "found": False, "items": [], "message": f"Erro de rede ao verificar SKU: {str(e_req)[:100]}"}
     except Exception as e_gen:
-        return {"error": True, "found": False, "items": [], "message": f"Erro inesperado ao verificar SKU: {str(e_gen)[:100]}"}
\ No newline at end of file
+        return {"error": True, "found": False, "items": [], "message": f"Erro inesperado ao verificar SKU: {str(e_gen)[:100]}"}
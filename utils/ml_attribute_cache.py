@@ -0,0 +1,136 @@
+# backend/utils/ml_attribute_cache.py
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from .config_manager import CACHE_DIR_PATH
+from .json_file_store import atomic_write_json
+
+# Cache dos esquemas de atributos por categoria (/categories/{id}/attributes).
+# As listas chegam a centenas de KB e mudam raramente: cada categoria fica num arquivo
+# próprio (um JSON único seria regravado inteiro a cada categoria nova), com as mais
+# usadas também em memória. Depois do TTL a entrada é revalidada com If-None-Match:
+# se o ML responder 304, só o horário é atualizado, sem baixar a lista de novo.
+
+ATTRIBUTE_CACHE_DIR = os.path.join(CACHE_DIR_PATH, 'ml_category_attributes')
+ATTRIBUTE_CACHE_TTL_SECONDS = int(os.environ.get('ML_ATTRIBUTE_CACHE_TTL_SECONDS', 24 * 60 * 60))
+ATTRIBUTE_CACHE_MEMORY_ENTRIES = 128
+
+# Campos que o frontend usa para montar a Ficha Técnica (ver createAttributeInput em static/js)
+SLIM_ATTRIBUTE_FIELDS = ('id', 'name', 'tags', 'value_type', 'value_max_length', 'default_unit', 'allowed_units')
+SLIM_VALUE_FIELDS = ('id', 'name')
+
+_SAFE_CATEGORY_ID = re.compile(r'^[A-Za-z0-9_-]+$')
+
+_memory = OrderedDict() # category_id -> entrada (LRU)
+_memory_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "revalidated": 0, "refreshed": 0, "stale_served": 0}
+
+
+def count_attribute_cache_event(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _filepath(category_id):
+    return os.path.join(ATTRIBUTE_CACHE_DIR, f'{category_id}.json')
+
+
+def slim_attributes(attributes):
+    """Projeção só com os campos renderizados pelo frontend (valores reduzidos a id/nome)."""
+    slim = []
+    for attribute in attributes:
+        projected = {field: attribute[field] for field in SLIM_ATTRIBUTE_FIELDS if field in attribute}
+        if attribute.get('values'):
+            projected['values'] = [{field: value.get(field) for field in SLIM_VALUE_FIELDS} for value in attribute['values']]
+        slim.append(projected)
+    return slim
+
+
+def _remember(category_id, entry):
+    with _memory_lock:
+        _memory[category_id] = entry
+        _memory.move_to_end(category_id)
+        while len(_memory) > ATTRIBUTE_CACHE_MEMORY_ENTRIES:
+            _memory.popitem(last=False)
+
+
+def lookup_category_attributes(category_id):
+    """
+    Entrada guardada da categoria ({"attributes", "etag", "fetched_at", "fresh"}) ou None.
+    `fresh` é False depois do TTL: quem chama revalida com o `etag` e, se falhar, ainda pode usar a entrada.
+    """
+    if not _SAFE_CATEGORY_ID.match(category_id or ''):
+        return None
+    with _memory_lock:
+        entry = _memory.get(category_id)
+        if entry is not None:
+            _memory.move_to_end(category_id)
+    if entry is None:
+        try:
+            with open(_filepath(category_id), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            entry = None
+        except (IOError, ValueError) as e:
+            print(f"Attribute Cache: erro ao ler cache de {category_id}: {e}")
+            entry = None
+        if entry is not None:
+            _remember(category_id, entry)
+    if entry is None:
+        return None
+    return {**entry, "fresh": time.time() - entry.get("fetched_at", 0) < ATTRIBUTE_CACHE_TTL_SECONDS}
+
+
+def get_slim_attributes(category_id, entry):
+    """Projeção enxuta da entrada, calculada uma vez e guardada junto dela em memória."""
+    with _memory_lock:
+        cached = _memory.get(category_id)
+        if cached is not None and cached.get("fetched_at") == entry.get("fetched_at") and "slim" in cached:
+            return cached["slim"]
+    slim = slim_attributes(entry["attributes"])
+    with _memory_lock:
+        cached = _memory.get(category_id)
+        if cached is not None and cached.get("fetched_at") == entry.get("fetched_at"):
+            cached["slim"] = slim
+    return slim
+
+
+def record_category_attributes(category_id, attributes, etag=None):
+    """Guarda (memória + disco) a lista de atributos baixada da API."""
+    entry = {"category_id": category_id, "etag": etag, "fetched_at": time.time(), "attributes": attributes}
+    if not _SAFE_CATEGORY_ID.match(category_id or ''):
+        return entry
+    _remember(category_id, entry)
+    try:
+        os.makedirs(ATTRIBUTE_CACHE_DIR, exist_ok=True)
+        atomic_write_json(_filepath(category_id), entry, indent=None)
+    except OSError as e:
+        print(f"Attribute Cache: erro ao gravar cache de {category_id}: {e}")
+    return entry
+
+
+def touch_category_attributes(category_id, entry):
+    """304 Not Modified: a lista guardada continua valendo por mais um TTL."""
+    return record_category_attributes(category_id, entry["attributes"], entry.get("etag"))
+
+
+def cached_category_ids():
+    try:
+        return sorted(name[:-5] for name in os.listdir(ATTRIBUTE_CACHE_DIR) if name.endswith('.json'))
+    except FileNotFoundError:
+        return []
+
+
+def attribute_cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"] + stats["revalidated"] + stats["refreshed"]
+    stats["hit_rate"] = round((stats["hits"] + stats["revalidated"]) / lookups, 4) if lookups else 0.0
+    with _memory_lock:
+        stats["in_memory"] = len(_memory)
+    stats["entries"] = len(cached_category_ids())
+    return stats
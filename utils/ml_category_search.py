@@ -0,0 +1,155 @@
+# backend/utils/ml_category_search.py
+import re
+import threading
+import unicodedata
+
+# Busca local de categorias sobre o snapshot da árvore (ver ml_category_tree.py).
+# Índice invertido (termo -> categorias e peso) mais uma trie de prefixos sobre o
+# vocabulário, para responder enquanto o usuário digita ("sup tv" acha "Suportes para TV").
+# Nomes e caminhos são normalizados sem acento e em minúsculas ("Eletrônicos" == "eletronicos").
+
+CATEGORY_SEARCH_DEFAULT_LIMIT = 30
+CATEGORY_SEARCH_MIN_PREFIX_LEN = 2 # Termos menores só casam por igualdade
+CATEGORY_SEARCH_MAX_PREFIX_TERMS = 200 # Expansões de prefixo consideradas por termo da busca
+
+# Pesos: o termo no nome da própria categoria vale mais que no nome de um ancestral,
+# e casar a palavra inteira vale mais que casar só o começo dela.
+WEIGHT_NAME = 3.0
+WEIGHT_PATH = 1.0
+PREFIX_MATCH_FACTOR = 0.6
+LEAF_BONUS = 2.0 # Só categorias folha aceitam anúncios; sobem na lista
+
+PORTUGUESE_STOPWORDS = frozenset(('a', 'o', 'as', 'os', 'e', 'de', 'da', 'do', 'das', 'dos', 'em', 'para', 'p', 'com', 'sem', 'por', 'na', 'no', 'nas', 'nos'))
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+def fold_text(text):
+    """'Peças p/ Motos' -> 'pecas p motos' (sem acentos, minúsculas, só letras e números)."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    without_accents = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(' ', without_accents.lower()).strip()
+
+
+def tokenize(text):
+    return [term for term in fold_text(text).split() if term not in PORTUGUESE_STOPWORDS]
+
+
+class _PrefixTrie:
+    __slots__ = ('root',)
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, term):
+        node = self.root
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node[''] = term # Chave vazia marca o fim de um termo
+
+    def expand(self, prefix, limit):
+        node = self.root
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None:
+                return []
+        terms, stack = [], [node]
+        while stack and len(terms) < limit:
+            current = stack.pop()
+            for ch, child in current.items():
+                if ch == '':
+                    terms.append(child)
+                else:
+                    stack.append(child)
+        return terms[:limit]
+
+
+class CategorySearchIndex:
+    def __init__(self, tree):
+        self.tree = tree
+        self._ids = []
+        self._names = []
+        self._leaf = []
+        self._depth = []
+        self._position_of = {}
+        self._postings = {} # termo -> {posição da categoria: peso}
+        self._trie = _PrefixTrie()
+        ancestor_terms = {} # id -> termos dos ancestores + da própria categoria (reaproveitado pelos filhos)
+        for position, (category_id, name, parent_id, is_leaf) in enumerate(tree.iter_categories()):
+            name_terms = tokenize(name)
+            inherited = ancestor_terms.get(parent_id, frozenset())
+            ancestor_terms[category_id] = inherited.union(name_terms)
+            self._ids.append(category_id)
+            self._names.append(name)
+            self._leaf.append(is_leaf)
+            self._depth.append(self._depth[self._position_of[parent_id]] + 1 if parent_id in self._position_of else 1)
+            self._position_of[category_id] = position
+            weights = dict.fromkeys(inherited, WEIGHT_PATH)
+            weights.update(dict.fromkeys(name_terms, WEIGHT_NAME))
+            for term, weight in weights.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    self._trie.add(term)
+                postings[position] = weight
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _term_scores(self, term):
+        """Melhor peso de cada categoria para um termo da busca (igual ou como prefixo)."""
+        scores = dict(self._postings.get(term, {}))
+        if len(term) >= CATEGORY_SEARCH_MIN_PREFIX_LEN:
+            for expanded in self._trie.expand(term, CATEGORY_SEARCH_MAX_PREFIX_TERMS):
+                if expanded == term:
+                    continue
+                for position, weight in self._postings[expanded].items():
+                    weight *= PREFIX_MATCH_FACTOR
+                    if weight > scores.get(position, 0.0):
+                        scores[position] = weight
+        return scores
+
+    def search(self, query, limit=CATEGORY_SEARCH_DEFAULT_LIMIT):
+        """Categorias que contêm todos os termos da busca, no formato da busca remota (ver search_ml_categories_logic)."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        per_term = sorted((self._term_scores(term) for term in terms), key=len)
+        if not per_term[0]:
+            return []
+        totals = dict(per_term[0])
+        for scores in per_term[1:]:
+            totals = {position: total + scores[position] for position, total in totals.items() if position in scores}
+            if not totals:
+                return []
+        ranked = sorted(
+            totals,
+            key=lambda p: (-(totals[p] + (LEAF_BONUS if self._leaf[p] else 0.0)), self._depth[p], self._names[p])
+        )
+        return [{
+            "id": self._ids[p],
+            "name": self._names[p],
+            "path_from_root": self.tree.path_from_root(self._ids[p]),
+            "settings": {"leaf": self._leaf[p]}
+        } for p in ranked[:limit]]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def rebuild_category_search_index(tree):
+    """Listener de ml_category_tree: reconstrói o índice a cada snapshot novo e troca de uma vez."""
+    global _index
+    new_index = CategorySearchIndex(tree)
+    with _index_lock:
+        _index = new_index
+    print(f"Category Search: índice local com {len(new_index)} categorias e {len(new_index._postings)} termos.")
+
+
+def search_categories_locally(query, limit=CATEGORY_SEARCH_DEFAULT_LIMIT):
+    """Resultados da busca local, ou None se o índice ainda não existe (quem chama usa a API)."""
+    index = _index
+    if index is None:
+        return None
+    return index.search(query, limit)
@@ -0,0 +1,302 @@
+# backend/utils/ml_category_tree.py
+import os
+import gzip
+import json
+import time
+import random
+import shutil
+import tempfile
+import threading
+import requests
+from .config_manager import CACHE_DIR_PATH
+from .json_file_store import atomic_write_json
+from .ml_http_client import ml_get, ml_url
+from .ml_rate_governor import ml_priority, PRIORITY_BACKGROUND
+
+try:
+    import fcntl # Trava entre workers (POSIX); no Windows cada processo baixa por conta própria
+except ImportError:
+    fcntl = None
+
+# Snapshot local da árvore de categorias do site (ex.: MLB).
+# A árvore muda pouco: é baixada inteira de /sites/{site}/categories/all, gravada num JSON
+# compacto (ids, nomes e pai em listas paralelas, ~1/50 do dump original) e carregada em
+# memória com índices de filhos e caminho, então navegar a árvore não chama a API.
+# Uma thread em segundo plano renova o snapshot quando ele fica velho; os demais
+# workers percebem o arquivo novo pelo mtime e recarregam.
+
+CATEGORY_TREE_FORMAT_VERSION = 1
+CATEGORY_TREE_MAX_AGE_SECONDS = int(os.environ.get('ML_CATEGORY_TREE_MAX_AGE_SECONDS', 3 * 24 * 60 * 60))
+CATEGORY_TREE_CHECK_INTERVAL_SECONDS = 60 * 60
+CATEGORY_TREE_RETRY_AFTER_FAILURE_SECONDS = 15 * 60
+CATEGORY_TREE_RELOAD_CHECK_SECONDS = 30
+
+
+def category_tree_file(site_id):
+    return os.path.join(CACHE_DIR_PATH, f'ml_category_tree_{site_id}.json')
+
+
+class CategoryTree:
+    """Snapshot imutável da árvore. Consultas são O(1) (ou O(profundidade) para o caminho)."""
+
+    def __init__(self, snapshot):
+        self.site_id = snapshot["site_id"]
+        self.downloaded_at = snapshot["downloaded_at"]
+        self._ids = snapshot["ids"]
+        self._names = snapshot["names"]
+        self._parents = snapshot["parents"] # índice do pai, ou -1 para raiz
+        self._total_items = snapshot["total_items"]
+        self._index = {cat_id: i for i, cat_id in enumerate(self._ids)}
+        self._children = [[] for _ in self._ids]
+        self._roots = []
+        for i, parent in enumerate(self._parents): # A ordem do arquivo preserva a ordem de filhos do ML
+            (self._children[parent] if parent >= 0 else self._roots).append(i)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, category_id):
+        return category_id in self._index
+
+    def _summary(self, i):
+        return {"id": self._ids[i], "name": self._names[i], "total_items_in_this_category": self._total_items[i]}
+
+    def roots(self):
+        """Mesmo formato de /sites/{site}/categories."""
+        return [{"id": self._ids[i], "name": self._names[i]} for i in self._roots]
+
+    def children(self, category_id):
+        """Mesmo formato de `children_categories` em /categories/{id}."""
+        return [self._summary(i) for i in self._children[self._index[category_id]]]
+
+    def is_leaf(self, category_id):
+        return not self._children[self._index[category_id]]
+
+    def path_from_root(self, category_id):
+        path, i = [], self._index[category_id]
+        while i >= 0:
+            path.append({"id": self._ids[i], "name": self._names[i]})
+            i = self._parents[i]
+        return path[::-1]
+
+    def get(self, category_id):
+        """Categoria no formato resumido de /categories/{id} (ou None se não existe no snapshot)."""
+        if category_id not in self._index:
+            return None
+        return {
+            **self._summary(self._index[category_id]),
+            "path_from_root": self.path_from_root(category_id),
+            "children_categories": self.children(category_id),
+            "settings": {"leaf": self.is_leaf(category_id)}
+        }
+
+    def iter_categories(self):
+        """(id, nome, id do pai ou None, é_folha) de todas as categorias, sempre com o pai antes dos filhos."""
+        for i, cat_id in enumerate(self._ids):
+            parent = self._parents[i]
+            yield cat_id, self._names[i], self._ids[parent] if parent >= 0 else None, not self._children[i]
+
+
+def _compact_snapshot(site_id, categories_by_id):
+    """Dump de /categories/all -> listas paralelas, em ordem de árvore (raízes, depois filhos na ordem do ML)."""
+    parent_of = {}
+    for cat_id, cat in categories_by_id.items():
+        path = cat.get("path_from_root") or []
+        parent_of[cat_id] = path[-2]["id"] if len(path) > 1 else None
+
+    ordered = []
+    queue = [cat_id for cat_id, parent in parent_of.items() if parent is None or parent not in categories_by_id]
+    seen = set()
+    while queue:
+        next_queue = []
+        for cat_id in queue:
+            if cat_id in seen:
+                continue
+            seen.add(cat_id)
+            ordered.append(cat_id)
+            for child in categories_by_id[cat_id].get("children_categories") or []:
+                if child.get("id") in categories_by_id:
+                    next_queue.append(child["id"])
+        queue = next_queue
+
+    position = {cat_id: i for i, cat_id in enumerate(ordered)}
+    return {
+        "format_version": CATEGORY_TREE_FORMAT_VERSION,
+        "site_id": site_id,
+        "downloaded_at": time.time(),
+        "ids": ordered,
+        "names": [categories_by_id[c].get("name", "") for c in ordered],
+        "parents": [position.get(parent_of[c], -1) for c in ordered],
+        "total_items": [categories_by_id[c].get("total_items_in_this_category", 0) for c in ordered],
+    }
+
+
+class MLCategoryTreeService:
+    def __init__(self, site_id='MLB', max_age_seconds=CATEGORY_TREE_MAX_AGE_SECONDS):
+        self.site_id = site_id
+        self.max_age_seconds = max_age_seconds
+        self.filepath = category_tree_file(site_id)
+        self._tree = None
+        self._file_signature = None
+        self._last_reload_check = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._token_provider = None
+        self._refresher_thread = None
+        self._listeners = []
+        self._background_jobs = []
+
+    # --- Ciclo de vida ---
+    def init_app(self, app, token_provider, start_refresher=True):
+        """`token_provider()` retorna um access_token válido (qualquer conta serve; a árvore é pública)."""
+        self.site_id = app.config.get('ML_SITE_ID', self.site_id)
+        self.filepath = category_tree_file(self.site_id)
+        self._token_provider = token_provider
+        self._load_from_disk()
+        if start_refresher and (self._refresher_thread is None or not self._refresher_thread.is_alive()):
+            self._refresher_thread = threading.Thread(target=self._refresher_loop, name="ml-category-tree", daemon=True)
+            self._refresher_thread.start()
+
+    def run_once_in_background(self, job):
+        """
+        `job()` roda uma vez na thread de atualização, depois da espera inicial e da checagem
+        da árvore: tarefas de aquecimento ficam fora da importação do app (CLI, testes, workers).
+        """
+        self._background_jobs.append(job)
+
+    def add_listener(self, callback):
+        """`callback(tree)` a cada snapshot carregado (ex.: reconstruir índices derivados)."""
+        self._listeners.append(callback)
+        if self._tree is not None:
+            callback(self._tree)
+
+    # --- Leitura ---
+    def get_tree(self):
+        """Snapshot atual (None se ainda não há nenhum: as rotas caem na API)."""
+        now = time.monotonic()
+        if now - self._last_reload_check >= CATEGORY_TREE_RELOAD_CHECK_SECONDS:
+            self._last_reload_check = now
+            if self._signature_on_disk() != self._file_signature:
+                self._load_from_disk() # Outro worker gravou um snapshot novo
+        return self._tree
+
+    def age_seconds(self):
+        tree = self._tree
+        return time.time() - tree.downloaded_at if tree else None
+
+    def stats(self):
+        tree = self._tree
+        age = self.age_seconds()
+        return {
+            "site_id": self.site_id,
+            "loaded": tree is not None,
+            "categories": len(tree) if tree else 0,
+            "age_seconds": round(age) if age is not None else None,
+            "max_age_seconds": self.max_age_seconds
+        }
+
+    def _signature_on_disk(self):
+        try:
+            st = os.stat(self.filepath)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _load_from_disk(self):
+        with self._lock:
+            signature = self._signature_on_disk()
+            if signature is None:
+                return
+            try:
+                with open(self.filepath, 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+                if snapshot.get("format_version") != CATEGORY_TREE_FORMAT_VERSION:
+                    print(f"Category Tree: formato de {self.filepath} desatualizado; será baixado de novo.")
+                    self._file_signature = signature
+                    return
+                tree = CategoryTree(snapshot)
+            except (IOError, ValueError, KeyError) as e:
+                print(f"Category Tree: erro ao carregar {self.filepath}: {e}")
+                self._file_signature = signature
+                return
+            self._tree = tree
+            self._file_signature = signature
+        print(f"Category Tree: {len(tree)} categorias {self.site_id} carregadas do snapshot local.")
+        for callback in self._listeners:
+            callback(tree)
+
+    # --- Atualização ---
+    def refresh(self):
+        """Baixa a árvore completa e grava um snapshot novo. Retorna True se conseguiu."""
+        if not self._refresh_lock.acquire(blocking=False):
+            return False # Já há um download em andamento neste processo
+        lock_file = None
+        try:
+            if fcntl is not None:
+                lock_file = open(self.filepath + '.lock', 'w')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return False # Outro worker está baixando; o mtime avisa quando terminar
+            access_token = self._token_provider() if self._token_provider else None
+            if not access_token:
+                print("Category Tree: nenhum token ML disponível para baixar a árvore.")
+                return False
+            with ml_priority(PRIORITY_BACKGROUND):
+                categories_by_id = self._download(access_token)
+            if not categories_by_id:
+                return False
+            atomic_write_json(self.filepath, _compact_snapshot(self.site_id, categories_by_id), indent=None)
+            self._load_from_disk()
+            return True
+        except (requests.exceptions.RequestException, ValueError, OSError) as e:
+            print(f"Category Tree: falha ao atualizar a árvore de categorias: {e}")
+            return False
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+            self._refresh_lock.release()
+
+    def _download(self, access_token):
+        print(f"Category Tree: baixando /sites/{self.site_id}/categories/all ...")
+        started = time.time()
+        response = ml_get(ml_url(f"/sites/{self.site_id}/categories/all"), endpoint='categories_all', access_token=access_token, stream=True)
+        try:
+            response.raise_for_status()
+            # O dump é grande: vai para um arquivo temporário em vez de ficar todo na memória como bytes
+            with tempfile.TemporaryFile() as raw_file:
+                shutil.copyfileobj(response.raw, raw_file, length=1024 * 1024)
+                raw_file.seek(0)
+                compressed = raw_file.read(2) == b'\x1f\x8b' or response.headers.get('Content-Encoding') == 'gzip'
+                raw_file.seek(0)
+                stream = gzip.GzipFile(fileobj=raw_file) if compressed else raw_file
+                categories_by_id = json.load(stream)
+        finally:
+            response.close()
+        if not isinstance(categories_by_id, dict):
+            raise ValueError("Resposta de categories/all não é um objeto por id.")
+        print(f"Category Tree: {len(categories_by_id)} categorias baixadas em {time.time() - started:.1f}s.")
+        return categories_by_id
+
+    def _run_background_jobs(self):
+        while self._background_jobs:
+            job = self._background_jobs.pop(0)
+            try:
+                job()
+            except Exception as e:
+                print(f"Category Tree: erro em tarefa de segundo plano {getattr(job, '__name__', job)}: {e}")
+
+    def _refresher_loop(self):
+        time.sleep(random.uniform(5, 30)) # Workers não começam todos juntos
+        while True:
+            self.get_tree()
+            age = self.age_seconds()
+            wait = CATEGORY_TREE_CHECK_INTERVAL_SECONDS
+            if age is None or age >= self.max_age_seconds:
+                if not self.refresh() and self._tree is None:
+                    wait = CATEGORY_TREE_RETRY_AFTER_FAILURE_SECONDS
+            self._run_background_jobs()
+            time.sleep(wait)
+
+
+ml_category_tree = MLCategoryTreeService()
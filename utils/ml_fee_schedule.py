@@ -0,0 +1,93 @@
+# backend/utils/ml_fee_schedule.py
+import os
+import time
+import bisect
+import threading
+from collections import namedtuple
+from .config_manager import CACHE_DIR_PATH
+from .json_file_store import JsonFileStore
+
+# Cache da tabela de tarifas do ML (listing_prices).
+# A tarifa de venda é uma função em degraus de (categoria, tipo de anúncio, faixa de preço):
+# um percentual fixo por categoria/tipo e uma taxa fixa que só existe abaixo de R$79
+# (com valores diferentes em sub-faixas). Cada faixa é aprendida na primeira consulta
+# à API e depois respondida da memória até o TTL; o cache é persistido em disco.
+
+FEE_SCHEDULE_FILE = os.path.join(CACHE_DIR_PATH, 'ml_fee_schedule.json')
+FEE_SCHEDULE_TTL_SECONDS = 24 * 60 * 60
+# Limites (R$) das faixas de preço em que a taxa fixa do MLB muda
+ML_FEE_PRICE_CUTOFFS = {
+    'MLB': (29.00, 50.00, 79.00),
+}
+
+FeeTier = namedtuple('FeeTier', ['lower', 'upper', 'rate', 'fixed_fee'])
+
+_fee_store = JsonFileStore(FEE_SCHEDULE_FILE, dict, write_delay=2.0)
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def _cutoffs_for(site_id):
+    return ML_FEE_PRICE_CUTOFFS.get(site_id, ())
+
+
+def price_band(site_id, price):
+    """Índice da faixa de preço (0 = abaixo do primeiro limite)."""
+    return bisect.bisect_right(_cutoffs_for(site_id), float(price))
+
+
+def band_bounds(site_id, band_index):
+    cutoffs = _cutoffs_for(site_id)
+    lower = cutoffs[band_index - 1] if band_index > 0 else 0.0
+    upper = cutoffs[band_index] if band_index < len(cutoffs) else float('inf')
+    return lower, upper
+
+
+def _key(site_id, category_id, listing_type_id, band_index):
+    return f"{site_id}|{category_id}|{listing_type_id}|{band_index}"
+
+
+def lookup_fee_tier(site_id, category_id, listing_type_id, price):
+    """Retorna (rate, fixed_fee) da faixa de `price` se conhecida e dentro do TTL, senão None."""
+    key = _key(site_id, category_id, listing_type_id, price_band(site_id, price))
+    entry = _fee_store.read(lambda schedule: schedule.get(key))
+    fresh = entry is not None and time.time() - entry.get("learned_at", 0) < FEE_SCHEDULE_TTL_SECONDS
+    with _stats_lock:
+        _stats["hits" if fresh else "misses"] += 1
+    return (entry["rate"], entry["fixed_fee"]) if fresh else None
+
+
+def record_fee_tier(site_id, category_id, listing_type_id, price, rate, fixed_fee):
+    """Guarda a tarifa observada na API para a faixa de `price`."""
+    key = _key(site_id, category_id, listing_type_id, price_band(site_id, price))
+    entry = {"rate": float(rate), "fixed_fee": float(fixed_fee), "learned_at": time.time()}
+    _fee_store.update(lambda schedule: schedule.__setitem__(key, entry))
+
+
+def get_known_fee_tiers(site_id, category_id, listing_type_id):
+    """Lista de FeeTier (dentro do TTL) já aprendidos para a categoria/tipo, ordenada por preço."""
+    now = time.time()
+    prefix = f"{site_id}|{category_id}|{listing_type_id}|"
+    def _collect(schedule):
+        return {int(key[len(prefix):]): entry for key, entry in schedule.items()
+                if key.startswith(prefix) and now - entry.get("learned_at", 0) < FEE_SCHEDULE_TTL_SECONDS}
+    tiers = []
+    for band_index, entry in sorted(_fee_store.read(_collect).items()):
+        lower, upper = band_bounds(site_id, band_index)
+        tiers.append(FeeTier(lower, upper, entry["rate"], entry["fixed_fee"]))
+    return tiers
+
+
+def fee_schedule_category_ids(site_id):
+    """Categorias que já tiveram tarifa consultada (as que o catálogo de fato usa)."""
+    prefix = f"{site_id}|"
+    return _fee_store.read(lambda schedule: sorted({key.split('|')[1] for key in schedule if key.startswith(prefix)}))
+
+
+def fee_schedule_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    stats["entries"] = _fee_store.read(len)
+    return stats
@@ -0,0 +1,133 @@
+# backend/utils/ml_http_client.py
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from .ml_rate_governor import ml_rate_governor, token_fingerprint
+from .concurrency import SingleFlight
+
+# Cliente HTTP único para todas as chamadas à API do Mercado Livre.
+# Uma requests.Session com pool de conexões keep-alive evita um novo handshake
+# TCP+TLS com api.mercadolibre.com a cada chamada.
+
+# Pode ser apontada para um servidor local (benchmarks / testes manuais).
+ML_API_BASE_URL = os.environ.get('ML_API_BASE_URL', 'https://api.mercadolibre.com').rstrip('/')
+DEFAULT_USER_AGENT = "MeliUnlockerWebApp/1.0.PyWeb"
+
+# Conexões mantidas por host. O padrão acompanha o número de threads que podem
+# chamar o ML ao mesmo tempo neste processo (workers do servidor + fan-out por conta).
+ML_HTTP_POOL_CONNECTIONS = int(os.environ.get('ML_HTTP_POOL_CONNECTIONS', 4))
+ML_HTTP_POOL_MAXSIZE = int(os.environ.get('ML_HTTP_POOL_MAXSIZE', max(10, (os.cpu_count() or 1) * 4)))
+
+# Timeouts (connect, read) por endpoint. Os valores de leitura são os que cada
+# função usava individualmente antes do cliente compartilhado.
+ML_ENDPOINT_TIMEOUTS = {
+    'default': (3.05, 15),
+    'oauth_token': (3.05, 20),
+    'oauth_code_exchange': (3.05, 30),
+    'user_info': (3.05, 10),
+    'category_predictor': (3.05, 10),
+    'categories': (3.05, 10),
+    'categories_all': (3.05, 120), # Dump completo da árvore (dezenas de MB)
+    'category_search': (3.05, 15),
+    'category_attributes': (3.05, 15),
+    'items_search': (3.05, 20),
+    'items_multiget': (3.05, 25),
+    'listing_prices': (3.05, 10),
+    'shipping_free': (3.05, 20),
+    'pictures_upload': (3.05, 30), # Envio de imagem (multipart de até alguns MB)
+}
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+_user_agent = DEFAULT_USER_AGENT
+_inflight_gets = SingleFlight() # GETs idênticos em andamento (ver ml_get_coalesced)
+
+
+def ml_url(path):
+    """Monta a URL completa da API ML a partir de um caminho ('/users/me')."""
+    return f"{ML_API_BASE_URL}/{path.lstrip('/')}"
+
+
+def _build_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=ML_HTTP_POOL_CONNECTIONS, pool_maxsize=ML_HTTP_POOL_MAXSIZE, pool_block=False)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'User-Agent': _user_agent, 'Accept': 'application/json'})
+    return session
+
+
+def get_ml_session():
+    """Retorna a Session compartilhada do processo (recriada após fork)."""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                # Sockets herdados do processo pai não podem ser reutilizados no filho
+                _session = _build_session()
+                _session_pid = pid
+    return _session
+
+
+def configure_ml_http_client(user_agent=None):
+    """Ajusta os headers padrão do cliente (chamado uma vez na criação do app Flask)."""
+    global _user_agent
+    if user_agent:
+        _user_agent = user_agent
+        get_ml_session().headers['User-Agent'] = user_agent
+
+
+def ml_request(method, url, endpoint='default', access_token=None, headers=None, timeout=None, **kwargs):
+    """
+    Executa uma requisição ML pela Session compartilhada.
+    `url` pode ser completa ou um caminho relativo a ML_API_BASE_URL.
+    O header Authorization é injetado quando `access_token` é informado.
+    Exceções são as mesmas de requests (RequestException, HTTPError via raise_for_status).
+    Passa pelo governador de tráfego (limites por app/vendedor, Retry-After e novas tentativas de GET).
+    """
+    if not url.startswith('http'):
+        url = ml_url(url)
+    request_headers = {}
+    if access_token:
+        request_headers['Authorization'] = f'Bearer {access_token}'
+    if headers:
+        request_headers.update(headers)
+    if timeout is None:
+        timeout = ML_ENDPOINT_TIMEOUTS.get(endpoint, ML_ENDPOINT_TIMEOUTS['default'])
+    session = get_ml_session()
+    return ml_rate_governor.execute(
+        method,
+        lambda: session.request(method.upper(), url, headers=request_headers, timeout=timeout, **kwargs),
+        access_token=access_token
+    )
+
+
+def ml_get(url, **kwargs):
+    return ml_request('GET', url, **kwargs)
+
+
+def ml_post(url, **kwargs):
+    return ml_request('POST', url, **kwargs)
+
+
+def ml_get_coalesced(url, endpoint='default', access_token=None, params=None, auth_scope=None, **kwargs):
+    """
+    GET com coalescência: chamadas idênticas simultâneas (mesma URL, params e escopo de
+    autenticação) compartilham uma única requisição ao ML e recebem a mesma resposta.
+    A resposta é compartilhada: use apenas para leitura (status_code, json(), text).
+    `auth_scope='public'` para recursos que não dependem da conta (categorias, atributos,
+    preditor); sem ele o escopo é o próprio token.
+    """
+    if not url.startswith('http'):
+        url = ml_url(url)
+    scope = auth_scope or token_fingerprint(access_token)
+    key = (url, tuple(sorted((str(k), str(v)) for k, v in (params or {}).items())), scope)
+    return _inflight_gets.do(key, ml_get, url, endpoint=endpoint, access_token=access_token, params=params, **kwargs)
+
+
+def ml_coalescing_stats():
+    """GETs executados x respostas reaproveitadas por chamadas idênticas simultâneas."""
+    return _inflight_gets.stats()
@@ -4,6 +4,7 @@ import time
 import urllib.parse
 from flask import current_app # Para acessar config do Flask
 from .ml_api_helpers import get_ml_user_info # Importa da mesma pasta utils
+from .ml_http_client import ml_post
 
 def exchange_ml_code_for_token(auth_code, redirect_uri_used_for_auth):
     """Troca o código de autorização do ML por tokens de acesso e refresh."""
@@ -13,7 +14,6 @@ def exchange_ml_code_for_token(auth_code, redirect_uri_used_for_auth):
     client_id = current_app.config['ML_CLIENT_ID']
     client_secret = current_app.config['ML_CLIENT_SECRET']
     token_url = current_app.config['ML_TOKEN_URL']
-    app_user_agent = current_app.config['APP_USER_AGENT']
 
     payload = {
         'grant_type': 'authorization_code',
@@ -22,11 +22,9 @@ def exchange_ml_code_for_token(auth_code, redirect_uri_used_for_auth):
         'code': auth_code,
         'redirect_uri': redirect_uri_used_for_auth # Crucial que seja a mesma usada no início
     }
-    headers = {'Accept': 'application/json', 'User-Agent': app_user_agent}
-
     try:
         print(f"OAuth ML: Trocando código por token. redirect_uri usada na troca: {redirect_uri_used_for_auth}")
-        response = requests.post(token_url, data=payload, headers=headers, timeout=30)
+        response = ml_post(token_url, endpoint='oauth_code_exchange', data=payload)
         response.raise_for_status()
         token_data = response.json()
 
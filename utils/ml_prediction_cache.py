@@ -0,0 +1,69 @@
+# backend/utils/ml_prediction_cache.py
+import os
+import time
+import threading
+from .config_manager import CACHE_DIR_PATH
+from .json_file_store import JsonFileStore
+from .ml_category_search import fold_text
+
+# Cache das previsões de categoria por título (domain_discovery/search).
+# O título é normalizado (sem acento, minúsculas, pontuação e espaços repetidos
+# removidos), então "Fone  de Ouvido!" e "fone de ouvido" usam a mesma previsão.
+# Guarda a lista de candidatos mais longa já pedida: pedidos com top-N menor são
+# respondidos pelo começo dela.
+
+PREDICTION_CACHE_FILE = os.path.join(CACHE_DIR_PATH, 'ml_category_predictions.json')
+PREDICTION_CACHE_TTL_SECONDS = int(os.environ.get('ML_PREDICTION_CACHE_TTL_SECONDS', 7 * 24 * 60 * 60))
+PREDICTION_CACHE_PRUNE_INTERVAL_SECONDS = 60 * 60
+
+_prediction_store = JsonFileStore(PREDICTION_CACHE_FILE, dict, write_delay=2.0)
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+_last_prune = [0.0]
+
+
+def normalize_title(title):
+    return ' '.join(fold_text(title).split())
+
+
+def _key(site_id, title):
+    return f"{site_id}|{normalize_title(title)}"
+
+
+def lookup_prediction(site_id, title, limit):
+    """Até `limit` candidatos guardados para o título (dentro do TTL), ou None."""
+    key = _key(site_id, title)
+    entry = _prediction_store.read(lambda cache: cache.get(key))
+    usable = (entry is not None
+              and time.time() - entry.get("cached_at", 0) < PREDICTION_CACHE_TTL_SECONDS
+              # Se o ML devolveu menos candidatos que o pedido, não há mais o que buscar
+              and (entry["limit"] >= limit or len(entry["candidates"]) < entry["limit"]))
+    with _stats_lock:
+        _stats["hits" if usable else "misses"] += 1
+    return [dict(candidate) for candidate in entry["candidates"][:limit]] if usable else None
+
+
+def record_prediction(site_id, title, limit, candidates):
+    key = _key(site_id, title)
+    now = time.time()
+    entry = {"candidates": [dict(candidate) for candidate in candidates], "limit": limit, "cached_at": now}
+
+    def _store(cache):
+        current = cache.get(key)
+        if current and now - current.get("cached_at", 0) < PREDICTION_CACHE_TTL_SECONDS and current["limit"] > limit:
+            return # Já há uma lista maior e válida para o título
+        cache[key] = entry
+        if now - _last_prune[0] >= PREDICTION_CACHE_PRUNE_INTERVAL_SECONDS: # Remove expirados de tempos em tempos
+            _last_prune[0] = now
+            for stale_key in [k for k, v in cache.items() if now - v.get("cached_at", 0) >= PREDICTION_CACHE_TTL_SECONDS]:
+                del cache[stale_key]
+    _prediction_store.update(_store)
+
+
+def prediction_cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    stats["entries"] = _prediction_store.read(len)
+    return stats
@@ -0,0 +1,199 @@
+# backend/utils/ml_rate_governor.py
+import os
+import time
+import random
+import hashlib
+import threading
+import contextvars
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+import requests
+from .rate_limit import TokenBucket, KeyedRateLimiter
+
+# Governador de tráfego para a API do ML. Todas as chamadas de ml_http_client passam por aqui:
+# - token bucket por aplicação e por vendedor (chave = token de acesso), para não
+#   estourar os limites do ML em rajadas (fan-out por conta, multiget, lotes);
+# - 429 respeita o Retry-After e pausa o vendedor (ou o app todo) até o prazo;
+# - GETs (idempotentes) são repetidos com backoff exponencial com jitter em 429/5xx/falha de conexão;
+# - tráfego em segundo plano (renovação de tokens, lotes, pré-aquecimento de cache) não pode
+#   consumir a reserva do balde, que fica para as requisições interativas.
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BACKGROUND = 'background'
+
+# Limites locais (ajustáveis por instalação via variáveis de ambiente; 0 desliga o balde).
+# O balde por vendedor fica abaixo do balde do app (20 de 50/s) para que o lote de uma
+# conta não consuma todas as fichas: com várias contas em paralelo, cada uma ainda
+# consegue andar. Quem tem poucas contas e lotes grandes pode subir o valor; o ML
+# continua protegido pelo balde do app e pelo tratamento de 429.
+ML_APP_RATE_PER_SECOND = float(os.environ.get('ML_APP_RATE_PER_SECOND', 50))
+ML_APP_RATE_BURST = float(os.environ.get('ML_APP_RATE_BURST', 100))
+ML_SELLER_RATE_PER_SECOND = float(os.environ.get('ML_SELLER_RATE_PER_SECOND', 20))
+ML_SELLER_RATE_BURST = float(os.environ.get('ML_SELLER_RATE_BURST', 40))
+ML_BACKGROUND_RESERVE_FRACTION = 0.25 # Parte do balde reservada a requisições interativas
+ML_GET_MAX_RETRIES = int(os.environ.get('ML_GET_MAX_RETRIES', 3))
+ML_BACKOFF_BASE_SECONDS = 0.5
+ML_BACKOFF_MAX_SECONDS = 8.0
+ML_MAX_RATE_WAIT_SECONDS = 30.0 # Espera máxima por ficha/Retry-After antes de seguir mesmo assim
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_priority = contextvars.ContextVar('ml_request_priority', default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def ml_priority(priority):
+    """Define a prioridade das chamadas ML feitas dentro do bloco (propaga para pools via submit_in_app_context)."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_ml_priority():
+    return _priority.get()
+
+
+def token_fingerprint(access_token):
+    """Identifica o vendedor pelo token sem guardar o token em si (hash curto)."""
+    return hashlib.sha1(access_token.encode('utf-8')).hexdigest()[:16] if access_token else None
+
+
+def _parse_retry_after(response):
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class MLRateGovernor:
+    def __init__(self, app_rate=ML_APP_RATE_PER_SECOND, app_burst=ML_APP_RATE_BURST,
+                 seller_rate=ML_SELLER_RATE_PER_SECOND, seller_burst=ML_SELLER_RATE_BURST,
+                 max_get_retries=ML_GET_MAX_RETRIES):
+        self.app_bucket = TokenBucket(app_rate, app_burst) if app_rate > 0 else None
+        self.seller_limiter = KeyedRateLimiter(seller_rate, seller_burst) if seller_rate > 0 else None
+        self.limits = {"app_rate_per_second": app_rate, "app_burst": app_burst,
+                       "seller_rate_per_second": seller_rate, "seller_burst": seller_burst}
+        self.max_get_retries = max_get_retries
+        self._cooldowns = {} # chave do vendedor (None = app inteiro) -> time.monotonic() até quando pausar
+        self._lock = threading.Lock()
+        self._metrics = {
+            "requests": 0, "requests_background": 0,
+            "throttled_429": 0, "retry_after_honored": 0,
+            "retries": 0, "retries_exhausted": 0, "server_errors_5xx": 0, "connection_errors": 0,
+            "local_waits": 0, "local_wait_seconds": 0.0, "cooldown_wait_seconds": 0.0,
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._metrics[name] += amount
+
+    def metrics(self):
+        with self._lock:
+            snapshot = dict(self._metrics)
+            now = time.monotonic()
+            active_cooldowns = sum(1 for until in self._cooldowns.values() if until > now)
+        snapshot["local_wait_seconds"] = round(snapshot["local_wait_seconds"], 3)
+        snapshot["cooldown_wait_seconds"] = round(snapshot["cooldown_wait_seconds"], 3)
+        snapshot["active_cooldowns"] = active_cooldowns
+        snapshot["app_tokens_available"] = round(self.app_bucket.available(), 2) if self.app_bucket else None
+        snapshot["limits"] = dict(self.limits) # Taxa 0 = balde desligado
+        return snapshot
+
+    # --- Antes de enviar ---
+    def _wait_for_cooldown(self, seller_key):
+        with self._lock:
+            until = max(self._cooldowns.get(None, 0.0), self._cooldowns.get(seller_key, 0.0) if seller_key else 0.0)
+        wait = min(until - time.monotonic(), ML_MAX_RATE_WAIT_SECONDS)
+        if wait > 0:
+            self._count("cooldown_wait_seconds", wait)
+            time.sleep(wait)
+
+    def _acquire_tokens(self, seller_key, priority):
+        started = time.monotonic()
+        buckets = [self.app_bucket] if self.app_bucket else []
+        if seller_key and self.seller_limiter:
+            buckets.append(self.seller_limiter.bucket(seller_key))
+        for bucket in buckets:
+            reserve = 0.0
+            if priority == PRIORITY_BACKGROUND:
+                reserve = min(bucket.capacity * ML_BACKGROUND_RESERVE_FRACTION, bucket.capacity - 1.0)
+            bucket.acquire(1.0, timeout=ML_MAX_RATE_WAIT_SECONDS, reserve=reserve)
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            self._count("local_waits")
+            self._count("local_wait_seconds", waited)
+
+    def _start_cooldown(self, seller_key, seconds):
+        with self._lock:
+            until = time.monotonic() + seconds
+            if until > self._cooldowns.get(seller_key, 0.0):
+                self._cooldowns[seller_key] = until
+
+    @staticmethod
+    def _backoff_seconds(attempt):
+        # "Full jitter": espera aleatória entre 0 e o teto exponencial
+        return random.uniform(0, min(ML_BACKOFF_MAX_SECONDS, ML_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+    # --- Execução ---
+    def execute(self, method, send, access_token=None):
+        """
+        Envia a requisição (`send()` -> requests.Response) respeitando os limites.
+        GET/HEAD são repetidos em 429/5xx/erro de conexão; os demais métodos são enviados uma vez.
+        Esgotadas as tentativas, devolve a última resposta (ou relança a exceção de conexão).
+        """
+        seller_key = token_fingerprint(access_token)
+        priority = current_ml_priority()
+        idempotent = method.upper() in ('GET', 'HEAD')
+        attempt = 0
+        while True:
+            self._wait_for_cooldown(seller_key)
+            self._acquire_tokens(seller_key, priority)
+            self._count("requests")
+            if priority == PRIORITY_BACKGROUND:
+                self._count("requests_background")
+            try:
+                response = send()
+            except requests.exceptions.ConnectionError:
+                self._count("connection_errors")
+                if not idempotent or attempt >= self.max_get_retries:
+                    raise
+                self._count("retries")
+                time.sleep(self._backoff_seconds(attempt))
+                attempt += 1
+                continue
+
+            status = response.status_code
+            if status not in RETRYABLE_STATUS_CODES:
+                return response
+
+            wait = None
+            if status == 429:
+                self._count("throttled_429")
+                wait = _parse_retry_after(response)
+                if wait is not None:
+                    self._count("retry_after_honored")
+                # Pausa o vendedor (ou o app, se a chamada não tem token) para não insistir no limite
+                self._start_cooldown(seller_key, wait if wait is not None else self._backoff_seconds(attempt + 1))
+            else:
+                self._count("server_errors_5xx")
+
+            if not idempotent or attempt >= self.max_get_retries or (wait is not None and wait > ML_MAX_RATE_WAIT_SECONDS):
+                if idempotent:
+                    self._count("retries_exhausted")
+                return response
+            response.close()
+            self._count("retries")
+            if wait is None: # Com Retry-After, a espera acontece no cooldown antes da próxima tentativa
+                time.sleep(self._backoff_seconds(attempt))
+            attempt += 1
+
+
+ml_rate_governor = MLRateGovernor()
@@ -0,0 +1,71 @@
+# backend/utils/ml_shipping_cache.py
+import os
+import time
+import bisect
+import threading
+from .config_manager import CACHE_DIR_PATH
+from .json_file_store import JsonFileStore
+
+# Cache das simulações de frete grátis (/users/{seller_id}/shipping_options/free).
+# O custo para o vendedor só depende de vendedor, dimensões, CEP de origem, categoria,
+# tipo de anúncio e da faixa de preço do item (o ML cobra por faixas), então preços
+# diferentes dentro da mesma faixa reaproveitam a mesma resposta.
+
+SHIPPING_CACHE_FILE = os.path.join(CACHE_DIR_PATH, 'ml_shipping_costs.json')
+SHIPPING_CACHE_TTL_SECONDS = int(os.environ.get('ML_SHIPPING_CACHE_TTL_SECONDS', 6 * 60 * 60))
+SHIPPING_CACHE_PRUNE_INTERVAL_SECONDS = 60 * 60
+# Limites (R$) das faixas de preço em que o custo do frete grátis do MLB muda
+ML_SHIPPING_PRICE_CUTOFFS = {
+    'MLB': (79.00, 100.00, 120.00, 150.00, 200.00),
+}
+
+_shipping_store = JsonFileStore(SHIPPING_CACHE_FILE, dict, write_delay=2.0)
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+_last_prune = [0.0]
+
+
+def shipping_price_band(site_id, price):
+    """Índice da faixa de preço do frete (0 = abaixo do primeiro limite)."""
+    return bisect.bisect_right(ML_SHIPPING_PRICE_CUTOFFS.get(site_id, ()), float(price))
+
+
+def _key(site_id, seller_id, item_price, listing_type_id, category_id, dimensions_str, origin_zip):
+    band_index = shipping_price_band(site_id, item_price)
+    return f"{site_id}|{seller_id}|{category_id}|{listing_type_id}|{dimensions_str or ''}|{origin_zip or ''}|{band_index}"
+
+
+def lookup_shipping_cost(site_id, seller_id, item_price, listing_type_id, category_id, dimensions_str, origin_zip):
+    """Resultado da simulação guardado para a mesma faixa (dentro do TTL), ou None."""
+    key = _key(site_id, seller_id, item_price, listing_type_id, category_id, dimensions_str, origin_zip)
+    entry = _shipping_store.read(lambda cache: cache.get(key))
+    fresh = entry is not None and time.time() - entry.get("cached_at", 0) < SHIPPING_CACHE_TTL_SECONDS
+    with _stats_lock:
+        _stats["hits" if fresh else "misses"] += 1
+    return dict(entry["result"]) if fresh else None
+
+
+def record_shipping_cost(site_id, seller_id, item_price, listing_type_id, category_id, dimensions_str, origin_zip, result):
+    """Guarda uma simulação bem-sucedida (resultados com erro nunca são guardados)."""
+    if result.get("error"):
+        return
+    key = _key(site_id, seller_id, item_price, listing_type_id, category_id, dimensions_str, origin_zip)
+    now = time.time()
+    entry = {"result": dict(result), "cached_at": now}
+
+    def _store(cache):
+        cache[key] = entry
+        if now - _last_prune[0] >= SHIPPING_CACHE_PRUNE_INTERVAL_SECONDS: # Remove expirados de tempos em tempos
+            _last_prune[0] = now
+            for stale_key in [k for k, v in cache.items() if now - v.get("cached_at", 0) >= SHIPPING_CACHE_TTL_SECONDS]:
+                del cache[stale_key]
+    _shipping_store.update(_store)
+
+
+def shipping_cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    stats["entries"] = _shipping_store.read(len)
+    return stats
@@ -0,0 +1,213 @@
+# backend/utils/ml_token_broker.py
+import time
+import threading
+from contextlib import contextmanager
+from .config_manager import ACCOUNTS_FILE, load_ml_accounts, get_ml_account, upsert_ml_account, remove_ml_account
+from .ml_api_helpers import get_ml_user_info, refresh_ml_token
+from .ml_rate_governor import ml_priority, PRIORITY_BACKGROUND
+
+try:
+    import fcntl # Trava entre workers (POSIX); no Windows vale só o lock por conta do processo
+except ImportError:
+    fcntl = None
+
+# Broker central de tokens ML.
+# - Contas lidas do repositório de contas (em memória, relido quando outro worker grava
+#   ml_accounts.json), então contas adicionadas/removidas em um worker valem para todos.
+# - Refresh "single-flight" por conta: os refresh tokens do ML são de uso único,
+#   então duas requisições renovando a mesma conta ao mesmo tempo invalidariam a conta.
+#   Entre workers, conferir o arquivo, renovar e gravar acontece sob um flock.
+# - Thread de renovação que renova os tokens pouco antes de `expires_at`, tirando
+#   o refresh (e a escrita em ml_accounts.json) do caminho da requisição do usuário.
+
+TOKEN_REFRESH_MARGIN_SECONDS = 15 * 60 # Renova quando faltarem menos de 15 min
+TOKEN_RENEWER_INTERVAL_SECONDS = 60
+TOKEN_RENEWER_RETRY_AFTER_FAILURE_SECONDS = 5 * 60
+# Arquivo próprio: o ml_accounts.json.lock é tomado pela gravação do repositório, que
+# acontece dentro da sequência conferir-renovar-gravar
+ACCOUNTS_REFRESH_LOCK_FILE = ACCOUNTS_FILE + '.refresh.lock'
+
+
+def _token_is_valid(account_data, margin_seconds=0):
+    return bool(account_data.get('access_token')) and \
+        time.time() + margin_seconds < float(account_data.get('expires_at') or 0)
+
+
+@contextmanager
+def _accounts_process_lock():
+    """Trava exclusiva entre processos para alterar tokens/contas em ml_accounts.json."""
+    if fcntl is None:
+        yield
+        return
+    with open(ACCOUNTS_REFRESH_LOCK_FILE, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX) # Liberada ao fechar o arquivo
+        yield
+
+
+class MLTokenBroker:
+    def __init__(self, refresh_margin_seconds=TOKEN_REFRESH_MARGIN_SECONDS, renewer_interval_seconds=TOKEN_RENEWER_INTERVAL_SECONDS):
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.renewer_interval_seconds = renewer_interval_seconds
+        self._app = None
+        self._lock = threading.Lock() # Protege _refresh_locks
+        self._refresh_locks = {}
+        self._renewer_next_attempt = {} # nickname -> timestamp, após falha de refresh
+        self._wakeup = threading.Event()
+        self._renewer_thread = None
+
+    # --- Ciclo de vida ---
+    def init_app(self, app, start_renewer=True):
+        """Guarda o app (contexto das chamadas OAuth) e inicia a thread de renovação proativa."""
+        self._app = app
+        if start_renewer and (self._renewer_thread is None or not self._renewer_thread.is_alive()):
+            self._renewer_thread = threading.Thread(target=self._renewer_loop, name="ml-token-renewer", daemon=True)
+            self._renewer_thread.start()
+
+    def _app_context(self):
+        return self._app.app_context()
+
+    def _refresh_lock_for(self, nickname):
+        with self._lock:
+            lock = self._refresh_locks.get(nickname)
+            if lock is None:
+                lock = self._refresh_locks[nickname] = threading.Lock()
+            return lock
+
+    # --- Leitura ---
+    def list_accounts(self):
+        return load_ml_accounts()
+
+    def get_account(self, nickname):
+        return get_ml_account(nickname)
+
+    def has_account(self, nickname):
+        return get_ml_account(nickname) is not None
+
+    def is_token_valid(self, nickname):
+        account = self.get_account(nickname)
+        return bool(account) and _token_is_valid(account)
+
+    def get_token(self, nickname, need_seller_id=True):
+        """
+        Retorna (access_token, seller_id, erro) para a conta.
+        Caminho quente: token válido no repositório em memória, sem rede.
+        Só renova de forma síncrona se o token já expirou (ex.: servidor parado
+        por horas), e mesmo assim uma única vez por conta; depois de uma falha,
+        respeita o mesmo intervalo da thread de renovação antes de tentar de novo.
+        """
+        account = self.get_account(nickname)
+        if not account:
+            return None, None, "Nenhuma conta ML ativa selecionada." if not nickname else f"Conta ML '{nickname}' não encontrada."
+
+        if not _token_is_valid(account):
+            if not account.get('refresh_token'):
+                return None, None, f"Token ausente e sem refresh_token para '{nickname}'."
+            if time.time() < self._renewer_next_attempt.get(nickname, 0):
+                # O último refresh falhou há pouco: não repete a chamada OAuth a cada requisição
+                return None, None, f"Falha ao renovar token para '{nickname}'. Nova tentativa em instantes."
+            account = self._refresh_account(nickname)
+            if not account or not _token_is_valid(account):
+                return None, None, f"Falha ao renovar token para '{nickname}'."
+
+        if need_seller_id and not account.get('seller_id'):
+            account = self._ensure_seller_id(nickname)
+            if not account or not account.get('seller_id'):
+                return None, None, f"Falha ao obter Seller ID para {nickname} para chamada API."
+
+        return account.get('access_token'), account.get('seller_id'), None
+
+    # --- Escrita ---
+    def upsert_account(self, account_data):
+        """Adiciona/atualiza uma conta (ex.: callback OAuth) no arquivo (e para todos os workers)."""
+        nickname = account_data['nickname']
+        self._renewer_next_attempt.pop(nickname, None) # Tokens novos: esquece falhas anteriores
+        with _accounts_process_lock(): # Não intercala com um refresh em andamento em outro worker
+            self._persist(nickname, account_data)
+
+    def remove_account(self, nickname):
+        with _accounts_process_lock():
+            if get_ml_account(nickname, check_disk=True) is None:
+                return False
+            self._persist(nickname, None)
+        with self._lock:
+            self._refresh_locks.pop(nickname, None)
+        return True
+
+    def request_refresh(self, nickname=None):
+        """Acorda a thread de renovação (sem bloquear a requisição atual)."""
+        self._wakeup.set()
+
+    def _persist(self, nickname, account_data):
+        # Atualiza só a conta alterada no repositório (gravação em background)
+        if account_data is None:
+            remove_ml_account(nickname)
+        else:
+            upsert_ml_account(nickname, account_data)
+
+    def _refresh_account(self, nickname, margin_seconds=0):
+        with self._refresh_lock_for(nickname):
+            # Outra thread pode ter renovado enquanto esperávamos o lock
+            account = self.get_account(nickname)
+            if not account or _token_is_valid(account, margin_seconds):
+                return account
+
+            with _accounts_process_lock():
+                # Outro worker pode ter renovado (ou removido a conta) e gravado no arquivo enquanto
+                # esperávamos o flock: relê agora e usa o refresh_token mais recente
+                account = get_ml_account(nickname, check_disk=True)
+                if not account or _token_is_valid(account, margin_seconds):
+                    return account
+
+                print(f"Token Broker: renovando token de '{nickname}'...")
+                with self._app_context():
+                    new_token_info = refresh_ml_token(account.get('refresh_token'))
+                    if not new_token_info:
+                        print(f"Token Broker: falha ao renovar token de '{nickname}'.")
+                        self._renewer_next_attempt[nickname] = time.time() + TOKEN_RENEWER_RETRY_AFTER_FAILURE_SECONDS
+                        return account
+                    account.update(new_token_info)
+                    if not account.get('seller_id') and new_token_info.get('access_token'):
+                        user_info = get_ml_user_info(new_token_info['access_token'])
+                        if user_info and user_info.get("id"):
+                            account['seller_id'] = str(user_info.get("id"))
+
+                self._renewer_next_attempt.pop(nickname, None)
+                self._persist(nickname, account) # Gravado antes de liberar o flock
+            print(f"Token Broker: token de '{nickname}' renovado.")
+            return account
+
+    def _ensure_seller_id(self, nickname):
+        with self._refresh_lock_for(nickname):
+            account = self.get_account(nickname)
+            if not account or account.get('seller_id'):
+                return account
+            with self._app_context():
+                user_info = get_ml_user_info(account.get('access_token'))
+            if not user_info or not user_info.get("id"):
+                return account
+            account['seller_id'] = str(user_info.get("id"))
+            with _accounts_process_lock():
+                account_on_disk = get_ml_account(nickname, check_disk=True)
+                if account_on_disk is None: # Removida enquanto buscávamos o seller_id
+                    return account
+                account_on_disk['seller_id'] = account['seller_id'] # Não regrava tokens antigos por cima de um refresh
+                self._persist(nickname, account_on_disk)
+            return account_on_disk
+
+    # --- Renovação proativa ---
+    def _renewer_loop(self):
+        while True:
+            with ml_priority(PRIORITY_BACKGROUND): # Renovação antecipada não disputa com requisições de usuários
+                for nickname, account in self.list_accounts().items():
+                    if time.time() < self._renewer_next_attempt.get(nickname, 0):
+                        continue
+                    if account.get('refresh_token') and not _token_is_valid(account, self.refresh_margin_seconds):
+                        try:
+                            self._refresh_account(nickname, margin_seconds=self.refresh_margin_seconds)
+                        except Exception as e:
+                            print(f"Token Broker: erro inesperado ao renovar '{nickname}': {e}")
+            self._wakeup.wait(self.renewer_interval_seconds)
+            self._wakeup.clear()
+
+
+ml_token_broker = MLTokenBroker()
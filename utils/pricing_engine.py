@@ -0,0 +1,60 @@
+# backend/utils/pricing_engine.py
+from collections import namedtuple
+from .ml_fee_schedule import ML_FEE_PRICE_CUTOFFS, FeeTier
+
+# Solver de preço em forma fechada.
+# Dentro de uma faixa de tarifa (percentual + taxa fixa constantes) o preço que cobre
+# custo + lucro + frete + tarifas é exato:
+#     preço = (custo + lucro + frete + taxa_fixa) / (1 - percentual - antecipação)
+# Basta resolver cada faixa e ficar com o menor preço que cai dentro da própria faixa.
+# Se nenhuma faixa é autoconsistente (degrau de R$79: com a taxa fixa o preço passa de 79,
+# sem ela fica abaixo), a resposta é o piso da faixa de cima (o próprio degrau).
+
+ANTICIPATION_FEE_RATE = 0.038
+MIN_PRICE_DENOMINATOR = 0.05 # Abaixo disso a margem é pequena demais para um preço válido
+FEE_PROBE_DEFAULT_PRICE = 100.00 # Preço usado para consultar a faixa aberta (sem teto)
+
+PriceSolution = namedtuple('PriceSolution', ['price', 'tier'])
+
+
+def fee_bands(site_id):
+    """Faixas (lower, upper) de tarifa do site, da mais cara para a mais barata."""
+    bounds = (0.0,) + tuple(ML_FEE_PRICE_CUTOFFS.get(site_id, ())) + (float('inf'),)
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 2, -1, -1)]
+
+
+def band_probe_price(lower, upper):
+    """Preço representativo para consultar a tarifa de uma faixa."""
+    if upper == float('inf'):
+        return max(lower, FEE_PROBE_DEFAULT_PRICE)
+    return round((lower + upper) / 2.0, 2)
+
+
+def solve_price(site_id, fee_lookup, cost_price_adjusted, profit_value, shipping_cost, include_anticipation_fee=False):
+    """
+    Menor preço de venda que cobre custo, lucro, frete e tarifas do ML.
+    `fee_lookup(price)` retorna (percentual, taxa_fixa) da faixa de `price`; só é chamado
+    para faixas que podem conter a resposta (no máximo uma vez por faixa).
+    Retorna PriceSolution(price, tier) ou None se nenhuma faixa tiver denominador válido.
+    """
+    base_value = cost_price_adjusted + profit_value + shipping_cost
+    anticipation_rate = ANTICIPATION_FEE_RATE if include_anticipation_fee else 0.0
+    # Sem nenhuma tarifa o preço já seria este; faixas com teto abaixo dele são descartadas sem consulta
+    price_floor_without_fees = base_value / (1.0 - anticipation_rate)
+
+    best = None
+    for lower, upper in fee_bands(site_id):
+        if best is not None and lower >= best.price:
+            continue
+        if price_floor_without_fees >= upper:
+            continue
+        fee_rate, fixed_fee = fee_lookup(band_probe_price(lower, upper))
+        denominator = 1.0 - fee_rate - anticipation_rate
+        if denominator <= MIN_PRICE_DENOMINATOR:
+            continue
+        candidate = max((base_value + fixed_fee) / denominator, lower)
+        if candidate >= upper:
+            continue # Não cabe na própria faixa
+        if best is None or candidate < best.price:
+            best = PriceSolution(candidate, FeeTier(lower, upper, fee_rate, fixed_fee))
+    return best
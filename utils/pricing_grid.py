@@ -0,0 +1,87 @@
+# backend/utils/pricing_grid.py
+try:
+    import numpy as np
+except ImportError: # NumPy é opcional; sem ele só a grade fica indisponível
+    np = None
+
+from .pricing_engine import ANTICIPATION_FEE_RATE, solve_price
+
+# Grade de sensibilidade de preço: lucro, tarifas e margem para uma faixa inteira de
+# preços candidatos, calculados de uma vez (vetorizado) a partir das faixas de tarifa
+# já conhecidas, sem nenhuma chamada à API por ponto da grade.
+
+PRICE_GRID_MAX_POINTS = 20000
+
+
+def numpy_available():
+    return np is not None
+
+
+def _tier_lookup(fee_tiers):
+    def fee_lookup(price):
+        tier = next((t for t in fee_tiers if t.lower <= price < t.upper), fee_tiers[-1])
+        return tier.rate, tier.fixed_fee
+    return fee_lookup
+
+
+def _fixed_fee_cliffs(fee_tiers, cost_price_adjusted, shipping_cost, anticipation_rate):
+    """
+    Degraus onde a tarifa muda entre faixas (ex.: fim da taxa fixa em R$79), com o lucro
+    logo abaixo e no próprio degrau. `profit_jump` > 0: qualquer preço da faixa de baixo
+    lucra menos que cobrar exatamente o degrau.
+    """
+    cliffs = []
+    for below, above in zip(fee_tiers, fee_tiers[1:]):
+        if (below.rate, below.fixed_fee) == (above.rate, above.fixed_fee):
+            continue
+        cliff_price = above.lower
+        profit_at_cliff = cliff_price * (1.0 - above.rate - anticipation_rate) - above.fixed_fee - shipping_cost - cost_price_adjusted
+        profit_just_below = cliff_price * (1.0 - below.rate - anticipation_rate) - below.fixed_fee - shipping_cost - cost_price_adjusted
+        cliffs.append({
+            "price": cliff_price,
+            "fixed_fee_below": below.fixed_fee, "fixed_fee_above": above.fixed_fee,
+            "rate_below": below.rate, "rate_above": above.rate,
+            "profit_just_below": round(profit_just_below, 2),
+            "profit_at_cliff": round(profit_at_cliff, 2),
+            "profit_jump": round(profit_at_cliff - profit_just_below, 2)
+        })
+    return cliffs
+
+
+def evaluate_price_grid(site_id, fee_tiers_by_type, cost_price_adjusted, shipping_cost, price_min, price_max, price_step):
+    """
+    Avalia todos os preços de `price_min` a `price_max` (passo `price_step`) para cada tipo de anúncio
+    em `fee_tiers_by_type` ({listing_type_id: [FeeTier, ...] em ordem crescente}), com e sem antecipação.
+    Retorna as curvas, o preço de equilíbrio (lucro zero) e os degraus de tarifa de cada combinação.
+    """
+    if np is None:
+        return {"error": True, "message": "NumPy não está instalado no servidor; grade de preços indisponível."}
+    if price_step <= 0 or price_max < price_min or price_min < 0:
+        return {"error": True, "message": "Faixa de preços inválida."}
+    points = int((price_max - price_min) / price_step) + 1
+    if points > PRICE_GRID_MAX_POINTS:
+        return {"error": True, "message": f"Grade muito grande ({points} pontos; máximo {PRICE_GRID_MAX_POINTS})."}
+
+    prices = np.round(price_min + np.arange(points) * price_step, 2)
+    curves = {}
+    for listing_type_id, fee_tiers in fee_tiers_by_type.items():
+        lowers = np.array([t.lower for t in fee_tiers])
+        band_index = np.clip(np.searchsorted(lowers, prices, side='right') - 1, 0, len(fee_tiers) - 1)
+        sale_fee = prices * np.array([t.rate for t in fee_tiers])[band_index] + np.array([t.fixed_fee for t in fee_tiers])[band_index]
+        net_before_anticipation = prices - sale_fee - shipping_cost - cost_price_adjusted
+
+        listing_curves = {"sale_fee": np.round(sale_fee, 2).tolist()}
+        for include_anticipation_fee in (False, True):
+            anticipation_rate = ANTICIPATION_FEE_RATE if include_anticipation_fee else 0.0
+            profit = net_before_anticipation - prices * anticipation_rate
+            margin_percent = np.divide(profit * 100.0, prices, out=np.zeros_like(profit), where=prices > 0)
+            break_even = solve_price(site_id, _tier_lookup(fee_tiers), cost_price_adjusted, 0.0, shipping_cost, include_anticipation_fee)
+            listing_curves["with_anticipation" if include_anticipation_fee else "without_anticipation"] = {
+                "profit": np.round(profit, 2).tolist(),
+                "margin_percent": np.round(margin_percent, 2).tolist(),
+                "break_even_price": round(break_even.price, 2) if break_even else None,
+                "cliffs": _fixed_fee_cliffs(fee_tiers, cost_price_adjusted, shipping_cost, anticipation_rate)
+            }
+        curves[listing_type_id] = listing_curves
+
+    return {"error": False, "prices": prices.tolist(), "curves": curves}
@@ -8,6 +8,10 @@ from flask import current_app # Para acessar app.config com constantes ML
 # Para simplificar, vamos assumir que o token passado para as funções de cálculo
 # já foi validado/refrescado pelo endpoint no app.py.
 from .ml_api_helpers import get_ml_user_info, refresh_ml_token # Para garantir que temos seller_id e token válido
+from .ml_http_client import ml_get, ml_url
+from .ml_fee_schedule import FeeTier, lookup_fee_tier, record_fee_tier
+from .pricing_engine import solve_price, fee_bands, band_probe_price, ANTICIPATION_FEE_RATE
+from .ml_shipping_cache import lookup_shipping_cost, record_shipping_cost
 
 # Função para buscar taxas do ML (adaptada do seu código Tkinter)
 def get_ml_api_fees_for_type_logic(category_id, sell_price, listing_type_id, access_token):
@@ -17,23 +21,26 @@ def get_ml_api_fees_for_type_logic(category_id, sell_price, listing_type_id, acc
         return 0.19, 6.00, (sell_price * 0.19) + 6.00 # Fallback MUITO genérico se falhar
 
     # Constantes que viriam do app.config
-    ml_site_listing_prices_url = f"https://api.mercadolibre.com/sites/{current_app.config['ML_SITE_ID']}/listing_prices"
-    app_user_agent = current_app.config['APP_USER_AGENT']
+    ml_site_listing_prices_url = ml_url(f"/sites/{current_app.config['ML_SITE_ID']}/listing_prices")
     ml_site_id_const = current_app.config['ML_SITE_ID']
 
+    # Tarifas são degraus por faixa de preço: se a faixa já é conhecida, responde da memória
+    cached_tier = lookup_fee_tier(ml_site_id_const, category_id, listing_type_id, sell_price)
+    if cached_tier:
+        fee_rate_cached, fixed_fee_cached = cached_tier
+        return fee_rate_cached, fixed_fee_cached, (float(sell_price) * fee_rate_cached) + fixed_fee_cached
 
     params = {
         "category_id": category_id,
         "price": round(float(sell_price), 2),
         "listing_type_id": listing_type_id
     }
-    headers = {'Authorization': f'Bearer {access_token}', 'User-Agent': app_user_agent, 'Accept': 'application/json'}
-    
+
     fee_rate_api, fixed_fee_api, sale_fee_total_from_api = 0.0, 0.0, 0.0
     print(f"Pricing Logic (get_fees): Buscando taxas para Cat:{category_id}, Preço:{sell_price}, Tipo:{listing_type_id}")
 
     try:
-        response = requests.get(ml_site_listing_prices_url, params=params, headers=headers, timeout=10)
+        response = ml_get(ml_site_listing_prices_url, endpoint='listing_prices', access_token=access_token, params=params)
         response.raise_for_status()
         data = response.json()
 
@@ -63,6 +70,7 @@ def get_ml_api_fees_for_type_logic(category_id, sell_price, listing_type_id, acc
                 fee_rate_api = (sale_fee_total_from_api - fixed_fee_api) / float(sell_price)
             
             print(f"  Pricing Logic (get_fees): Retornado da API -> Rate:{fee_rate_api:.4f}, Fixed:{fixed_fee_api:.2f}, TotalFeeAPI:{sale_fee_total_from_api:.2f}")
+            record_fee_tier(ml_site_id_const, category_id, listing_type_id, sell_price, fee_rate_api, fixed_fee_api)
         else:
             print(f"  Pricing Logic (get_fees): Nenhuma informação de preço encontrada para os parâmetros.")
             # Fallback para taxas altas se a API falhar em retornar dados
@@ -88,8 +96,13 @@ def simulate_ml_free_shipping_logic(access_token, seller_id, item_price, listing
     if not dimensions_str and origin_zip: # Precisa de dimensões e CEP se não for usar um item_id existente
          return {"error": True, "message": "Dimensões ou CEP de origem ausentes para simulação de frete.", "cost": 9999.99}
 
+    # Mesma combinação vendedor/dimensões/CEP/categoria/tipo/faixa de preço já simulada: responde do cache
+    cache_args = (current_app.config['ML_SITE_ID'], seller_id, item_price, listing_type_id, category_id, dimensions_str, origin_zip)
+    cached_result = lookup_shipping_cost(*cache_args)
+    if cached_result is not None:
+        return cached_result
 
-    url = f"https://api.mercadolibre.com/users/{seller_id}/shipping_options/free"
+    url = ml_url(f"/users/{seller_id}/shipping_options/free")
     params = {
         "item_price": round(float(item_price), 2),
         "listing_type_id": listing_type_id,
@@ -103,11 +116,10 @@ def simulate_ml_free_shipping_logic(access_token, seller_id, item_price, listing
     if dimensions_str: params["dimensions"] = dimensions_str
     if origin_zip: params["zip_code"] = origin_zip
 
-    headers = {'Authorization': f'Bearer {access_token}', 'User-Agent': current_app.config['APP_USER_AGENT']}
     print(f"Pricing Logic (simulate_shipping): Params: {params}")
 
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=20)
+        response = ml_get(url, endpoint='shipping_free', access_token=access_token, params=params)
         response.raise_for_status()
         data = response.json()
         print(f"Pricing Logic (simulate_shipping): Resposta API: {data}")
@@ -127,7 +139,7 @@ def simulate_ml_free_shipping_logic(access_token, seller_id, item_price, listing
             print("  Pricing Logic (simulate_shipping): 'list_cost' não encontrado na resposta. Assumindo R$0 ou erro.")
             # Para itens onde frete grátis não se aplica (ex: abaixo de R$79), a API pode não retornar custo.
             # Vamos retornar um objeto mais completo
-            return {
+            shipping_result = {
                 "error": False, # Não necessariamente um erro da nossa parte se a API não deu custo
                 "message": "Custo de frete não aplicável ou não retornado pela API.",
                 "cost": 0.0, # Custo final para o vendedor
@@ -135,16 +147,20 @@ def simulate_ml_free_shipping_logic(access_token, seller_id, item_price, listing
                 "promoted_amount_api": 0.0,
                 "rate_api": 0.0
             }
+            record_shipping_cost(*cache_args, shipping_result)
+            return shipping_result
 
         final_cost_for_seller = float(list_cost_api_val)
         
-        return {
+        shipping_result = {
             "error": False,
             "cost": round(final_cost_for_seller, 2),
             "list_cost_api": round(float(list_cost_api_val), 2),
             "promoted_amount_api": round(float(promoted_amount_api_val if promoted_amount_api_val is not None else list_cost_api_val), 2),
             "rate_api": rate_api_val
         }
+        record_shipping_cost(*cache_args, shipping_result)
+        return shipping_result
 
     except requests.exceptions.HTTPError as e_http:
         err_detail = e_http.response.text[:150] if hasattr(e_http, 'response') and e_http.response else str(e_http)
@@ -156,12 +172,33 @@ def simulate_ml_free_shipping_logic(access_token, seller_id, item_price, listing
         return {"error": True, "message": f"Erro ao simular frete: {str(e)}", "cost": 9999.99}
 
 
+def _listing_fee_lookup(category_id, listing_type_id, access_token):
+    """Consulta de tarifa por preço para o solver (cache de faixas primeiro, API só em faixa nova)."""
+    def fee_lookup(price):
+        fee_rate, fixed_fee, _ = get_ml_api_fees_for_type_logic(category_id, price, listing_type_id, access_token)
+        if fee_rate < 0 or fee_rate >= 1: # Fallback se taxa inválida
+            print(f"  Aviso: Taxa percentual da API inválida ({fee_rate}), usando fallback.")
+            fee_rate = 0.19 if listing_type_id == 'gold_pro' else 0.15
+        return fee_rate, fixed_fee
+    return fee_lookup
+
+
+
+def get_fee_tiers_for_listing_type(category_id, listing_type_id, access_token):
+    """Todas as faixas de tarifa do tipo de anúncio (FeeTier em ordem crescente de preço); API só para faixas ainda não aprendidas."""
+    fee_lookup = _listing_fee_lookup(category_id, listing_type_id, access_token)
+    fee_tiers = []
+    for lower, upper in reversed(fee_bands(current_app.config['ML_SITE_ID'])):
+        fee_rate, fixed_fee = fee_lookup(band_probe_price(lower, upper))
+        fee_tiers.append(FeeTier(lower, upper, fee_rate, fixed_fee))
+    return fee_tiers
+
 def calculate_final_price_for_listing_type(
     cost_price_adjusted, desired_profit, profit_type_is_percent,
     shipping_cost_for_seller, category_id, listing_type_id,
     access_token, include_anticipation_fee=False
 ):
-    """Calcula o preço final iterativamente para um tipo de anúncio."""
+    """Calcula o preço final para um tipo de anúncio, resolvendo cada faixa de tarifa em forma fechada."""
     
     base_for_profit_calc = cost_price_adjusted + shipping_cost_for_seller
     actual_desired_profit_value = 0
@@ -170,54 +207,23 @@ def calculate_final_price_for_listing_type(
     else:
         actual_desired_profit_value = desired_profit
 
-    # Estimativa inicial de taxas
-    current_ml_fee_rate, current_ml_fixed_fee, _ = get_ml_api_fees_for_type_logic(
-        category_id, 100, listing_type_id, access_token # Usa um preço de R$100 para estimativa inicial de taxa
+    solution = solve_price(
+        current_app.config['ML_SITE_ID'],
+        _listing_fee_lookup(category_id, listing_type_id, access_token),
+        cost_price_adjusted, actual_desired_profit_value, shipping_cost_for_seller,
+        include_anticipation_fee
     )
-    if current_ml_fee_rate < 0 or current_ml_fee_rate >= 1: # Fallback se taxa inválida
-        current_ml_fee_rate = 0.19 if listing_type_id == 'gold_pro' else 0.15
-        print(f"  Aviso: Taxa percentual da API inválida ({current_ml_fee_rate}), usando fallback.")
-
-
-    calculated_price = 0.0
-    # Iteração para convergir o preço
-    for i in range(5): # Iterar algumas vezes para estabilizar
-        denominator = 1.0 - current_ml_fee_rate
-        if include_anticipation_fee:
-            denominator -= 0.038 # Exemplo de taxa de antecipação
-
-        if denominator <= 0.05: # Evita divisão por zero ou margens muito pequenas
-            print(f"Erro: Denominador muito baixo ou negativo ({denominator}) no cálculo de preço para {listing_type_id}.")
-            return {"price": 0.00, "fees_info": "Erro no cálculo (denominador inválido)", "final_sale_fee":0, "anticipation_value":0}
-
-        price_before_fees = cost_price_adjusted + actual_desired_profit_value + shipping_cost_for_seller + current_ml_fixed_fee
-        new_price = price_before_fees / denominator
-
-        if abs(new_price - calculated_price) < 0.01 and i > 0 : # Convergiu
-            calculated_price = new_price
-            break
-        calculated_price = new_price
-        # Re-busca taxas com o novo preço estimado para a próxima iteração
-        current_ml_fee_rate, current_ml_fixed_fee, _ = get_ml_api_fees_for_type_logic(
-            category_id, calculated_price, listing_type_id, access_token
-        )
-        if current_ml_fee_rate < 0 or current_ml_fee_rate >= 1: # Fallback
-             current_ml_fee_rate = 0.19 if listing_type_id == 'gold_pro' else 0.15
-
+    if solution is None:
+        print(f"Erro: Denominador muito baixo ou negativo em todas as faixas no cálculo de preço para {listing_type_id}.")
+        return {"price": 0.00, "fees_info": "Erro no cálculo (denominador inválido)", "final_sale_fee":0, "anticipation_value":0}
 
-    final_price = round(calculated_price, 2)
+    final_price = round(solution.price, 2)
     if final_price <=0: final_price = 0.01 # Preço mínimo
 
-    # Obter taxas finais com o preço calculado
-    final_fee_rate, final_fixed_fee, final_total_sale_fee_api = get_ml_api_fees_for_type_logic(
-        category_id, final_price, listing_type_id, access_token
-    )
-    # Recalcula a taxa de venda com os valores obtidos, para consistência, ou usa o da API se disponível e confiável
-    calculated_sale_fee = (final_price * final_fee_rate) + final_fixed_fee
-    display_sale_fee = final_total_sale_fee_api if abs(final_total_sale_fee_api - calculated_sale_fee) < 0.05 else calculated_sale_fee
-
+    final_fee_rate, final_fixed_fee = solution.tier.rate, solution.tier.fixed_fee
+    display_sale_fee = (final_price * final_fee_rate) + final_fixed_fee
 
-    anticipation_value = final_price * 0.038 if include_anticipation_fee else 0.0
+    anticipation_value = final_price * ANTICIPATION_FEE_RATE if include_anticipation_fee else 0.0
 
     fees_info_str = f"Tarifa ML: R${display_sale_fee:.2f} ({final_fee_rate*100:.1f}% + R${final_fixed_fee:.2f})"
     if include_anticipation_fee:
@@ -228,4 +234,99 @@ def calculate_final_price_for_listing_type(
         "fees_info": fees_info_str,
         "final_sale_fee": round(display_sale_fee,2),
         "anticipation_value": round(anticipation_value,2)
-    }
\ No newline at end of file
+    }
+
+
+def build_shipping_dimensions_str(dimensions):
+    """'AxLxC,peso_g' no formato da API de frete, ou None se alguma medida faltar."""
+    dimensions = dimensions or {}
+    if not all((dimensions.get(k) or 0) > 0 for k in ['height', 'width', 'length', 'weight_kg']):
+        return None
+    return f"{int(dimensions['height'])}x{int(dimensions['width'])}x{int(dimensions['length'])},{int(dimensions['weight_kg'] * 1000)}"
+
+
+
+def build_quote_request(payload):
+    """Normaliza os campos do produto (formato do /api/ml/calculate-prices) para quote_prices_for_account."""
+    cost_price_base = float(payload['cost_price'])
+    if payload.get('apply_discount_10'):
+        cost_price_base *= 0.90
+    return {
+        "cost_price_base": cost_price_base,
+        "desired_profit": float(payload['desired_profit']),
+        "profit_is_percent": payload['profit_type'] == 'PERCENT',
+        "category_id": payload['product_category_id'],
+        "offer_free_shipping": bool(payload.get('offer_free_shipping')),
+        "dimensions_str": build_shipping_dimensions_str(payload.get('dimensions')),
+        "origin_zip": payload.get('origin_zip'),
+        "publish_classic": payload.get('publish_classic', True),
+        "publish_premium": payload.get('publish_premium', True),
+        "include_anticipation_fee": payload.get('include_anticipation_fee', False),
+    }
+
+def quote_prices_for_account(quote_request, shipping_mode, access_token, seller_id, shipping_simulations=None):
+    """
+    Cotação completa de uma conta: simulação de frete grátis (se pedida) + preço Clássico e Premium.
+    `quote_request` traz os parâmetros do produto já normalizados pelo endpoint.
+    `shipping_simulations` (SingleFlight opcional) junta simulações idênticas em andamento da mesma conta
+    (ex.: linhas repetidas de um lote); o frete é simulado por vendedor, então nunca é compartilhado entre contas.
+    """
+    acc_result_calc = {
+        "account_shipping_mode": shipping_mode, "shipping_final_cost": 0.0,
+        "shipping_list_cost_api": 0.0, "shipping_promoted_amount_api": 0.0, "shipping_api_discount_rate": 0.0,
+        "classic_price": 0.0, "classic_fees_info": "Não calculado",
+        "premium_price": 0.0, "premium_fees_info": "Não calculado",
+        "error": None
+    }
+    cost_price_base = quote_request["cost_price_base"]
+    desired_profit = quote_request["desired_profit"]
+    profit_is_percent = quote_request["profit_is_percent"]
+    category_id = quote_request["category_id"]
+
+    shipping_cost_for_seller_calc = 0.0
+    if quote_request.get("offer_free_shipping") and shipping_mode == 'me2':
+        dims_str_calc = quote_request.get("dimensions_str")
+        zip_calc = quote_request.get("origin_zip")
+        if dims_str_calc and zip_calc:
+            # Estimativa de preço para simulação de frete (melhorada)
+            profit_val_for_est = cost_price_base * (desired_profit / 100.0) if profit_is_percent else desired_profit
+            est_price_for_ship_sim_calc = (cost_price_base + profit_val_for_est + 25.0 + 6.0) / 0.83 # Denom. para Premium aprox.
+            if est_price_for_ship_sim_calc <= 0: est_price_for_ship_sim_calc = cost_price_base + profit_val_for_est + 5.0
+
+            # Simula com premium para custo seguro
+            sim_args = (access_token, seller_id, est_price_for_ship_sim_calc, "gold_pro", category_id, dims_str_calc, zip_calc)
+            if shipping_simulations is not None:
+                # /users/{seller_id}/shipping_options/free: o custo depende do vendedor (reputação/desconto)
+                sim_key = (seller_id, round(est_price_for_ship_sim_calc, 2), "gold_pro", category_id, dims_str_calc, zip_calc)
+                shipping_sim_result_calc = shipping_simulations.do(sim_key, simulate_ml_free_shipping_logic, *sim_args)
+            else:
+                shipping_sim_result_calc = simulate_ml_free_shipping_logic(*sim_args)
+
+            if shipping_sim_result_calc.get("error"):
+                acc_result_calc["error"] = f"Falha frete: {shipping_sim_result_calc.get('message')}"
+                return acc_result_calc
+            shipping_cost_for_seller_calc = shipping_sim_result_calc.get("cost", 0.0)
+            acc_result_calc.update({
+                "shipping_final_cost": shipping_cost_for_seller_calc,
+                "shipping_list_cost_api": shipping_sim_result_calc.get("list_cost_api"),
+                "shipping_promoted_amount_api": shipping_sim_result_calc.get("promoted_amount_api"),
+                "shipping_api_discount_rate": shipping_sim_result_calc.get("rate_api")
+            })
+        else:
+            acc_result_calc["error"] = "Frete grátis sel., mas dims/CEP ausentes."
+            return acc_result_calc
+
+    listing_types = []
+    if quote_request.get("publish_classic", True): listing_types.append(('classic', 'gold_special'))
+    if quote_request.get("publish_premium", True): listing_types.append(('premium', 'gold_pro'))
+    for result_prefix, listing_type_id in listing_types:
+        calc_res = calculate_final_price_for_listing_type(
+            cost_price_base, desired_profit, profit_is_percent,
+            shipping_cost_for_seller_calc, category_id,
+            listing_type_id, access_token,
+            quote_request.get("include_anticipation_fee", False)
+        )
+        acc_result_calc[f"{result_prefix}_price"] = calc_res["price"]
+        acc_result_calc[f"{result_prefix}_fees_info"] = calc_res["fees_info"]
+
+    return acc_result_calc
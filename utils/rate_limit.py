@@ -0,0 +1,70 @@
+# backend/utils/rate_limit.py
+import time
+import threading
+
+
+class TokenBucket:
+    """Token bucket simples e thread-safe: `rate` fichas/segundo, no máximo `capacity` acumuladas."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated_at
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+
+    def try_acquire(self, tokens=1.0, reserve=0.0):
+        """
+        Consome sem esperar. Retorna 0.0 se conseguiu, ou quantos segundos faltam.
+        `reserve`: fichas que precisam sobrar no balde (ex.: tráfego de baixa prioridade
+        não pode esvaziá-lo e deixar o tráfego interativo sem fichas).
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens - tokens >= reserve:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens + reserve - self._tokens) / self.rate
+
+    def available(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+    def acquire(self, tokens=1.0, timeout=None, reserve=0.0):
+        """Bloqueia até conseguir as fichas. Retorna False se `timeout` estourar."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens, reserve)
+            if wait == 0.0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class KeyedRateLimiter:
+    """Um TokenBucket por chave (ex.: uma conta ML), criado sob demanda."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+            return bucket
+
+    def acquire(self, key, tokens=1.0, timeout=None, reserve=0.0):
+        return self.bucket(key).acquire(tokens, timeout, reserve)
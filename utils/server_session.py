@@ -0,0 +1,168 @@
+# backend/utils/server_session.py
+import os
+import time
+import secrets
+import sqlite3
+import threading
+from collections import OrderedDict
+from flask.sessions import SessionInterface, SessionMixin
+from flask.json.tag import TaggedJSONSerializer
+from itsdangerous import Signer, BadSignature
+from werkzeug.datastructures import CallbackDict
+
+# Sessão server-side: o cookie carrega apenas um ID opaco (assinado), e os dados
+# ficam num SQLite local com um LRU em memória na frente. Tokens ML e chaves de API
+# não trafegam mais no cookie a cada requisição.
+
+SESSION_LRU_SIZE = 512
+SESSION_CLEANUP_INTERVAL_SECONDS = 60 * 60
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.previous_sid = None
+
+    def regenerate(self):
+        """Troca o ID da sessão (ex.: no login) para evitar fixação de sessão."""
+        if not self.new:
+            self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+class SqliteSessionStore:
+    def __init__(self, db_path, lru_size=SESSION_LRU_SIZE):
+        self.db_path = db_path
+        self.lru_size = lru_size
+        self._serializer = TaggedJSONSerializer()
+        self._lru = OrderedDict() # sid -> (dados serializados, expires_at)
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)")
+        self._data_version = self._current_data_version()
+
+    def _current_data_version(self):
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _invalidate_if_changed_elsewhere(self):
+        # data_version muda quando outra conexão (outro worker) grava no banco;
+        # nesse caso o LRU deste processo pode estar desatualizado.
+        data_version = self._current_data_version()
+        if data_version != self._data_version:
+            self._lru.clear()
+            self._data_version = data_version
+
+    def _remember(self, sid, payload, expires_at):
+        self._lru[sid] = (payload, expires_at)
+        self._lru.move_to_end(sid)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get(self, sid):
+        with self._lock:
+            self._invalidate_if_changed_elsewhere()
+            cached = self._lru.get(sid)
+            if cached is None:
+                row = self._conn.execute("SELECT data, expires_at FROM sessions WHERE sid = ?", (sid,)).fetchone()
+                if row is None:
+                    return None
+                cached = (row[0], row[1])
+            payload, expires_at = cached
+            if expires_at <= time.time():
+                self._lru.pop(sid, None)
+                self._conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+                return None
+            self._remember(sid, payload, expires_at)
+        return self._serializer.loads(payload)
+
+    def set(self, sid, data, expires_at):
+        payload = self._serializer.dumps(dict(data))
+        with self._lock:
+            cached = self._lru.get(sid)
+            if cached and cached[0] == payload and abs(cached[1] - expires_at) < 60:
+                return # Nada mudou; evita escrita no SQLite
+            self._conn.execute("INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)", (sid, payload, expires_at))
+            self._remember(sid, payload, expires_at)
+            self._maybe_cleanup()
+
+    def delete(self, sid):
+        with self._lock:
+            self._lru.pop(sid, None)
+            self._conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def _maybe_cleanup(self):
+        now = time.time()
+        if now - self._last_cleanup < SESSION_CLEANUP_INTERVAL_SECONDS:
+            return
+        self._last_cleanup = now
+        self._conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+
+
+class ServerSideSessionInterface(SessionInterface):
+    def __init__(self, store):
+        self.store = store
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='server-side-session')
+
+    def open_session(self, app, request):
+        cookie_value = request.cookies.get(self.get_cookie_name(app))
+        if cookie_value:
+            try:
+                sid = self._signer(app).unsign(cookie_value).decode('utf-8')
+            except BadSignature:
+                sid = None
+            if sid:
+                data = self.store.get(sid)
+                if data is not None:
+                    return ServerSideSession(data, sid=sid)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        cookie_name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.previous_sid:
+            self.store.delete(session.previous_sid)
+            session.previous_sid = None
+
+        # Sessão só com a flag '_permanent' (visitante anônimo) não é persistida
+        if not any(key != '_permanent' for key in session):
+            if not session.new:
+                self.store.delete(session.sid)
+            if session.modified:
+                response.delete_cookie(cookie_name, domain=domain, path=path)
+            return
+
+        expires = self.get_expiration_time(app, session)
+        expires_at = expires.timestamp() if expires else time.time() + app.permanent_session_lifetime.total_seconds()
+        self.store.set(session.sid, session, expires_at)
+
+        if not self.should_set_cookie(app, session) and not session.new and not session.modified:
+            return
+        response.set_cookie(
+            cookie_name,
+            self._signer(app).sign(session.sid).decode('utf-8'),
+            expires=expires,
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def init_server_side_sessions(app, db_path):
+    """Substitui a sessão em cookie do Flask pela sessão server-side."""
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    app.session_interface = ServerSideSessionInterface(SqliteSessionStore(db_path))
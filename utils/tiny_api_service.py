@@ -1,7 +1,7 @@
 import requests
 import time
 import json
-from .config_manager import load_app_config, save_app_config
+from .config_manager import get_app_config, update_app_config
 
 # Constantes da API Tiny v3
 TINY_V3_TOKEN_URL = "https://accounts.tiny.com.br/realms/tiny/protocol/openid-connect/token"
@@ -9,10 +9,10 @@ TINY_V3_API_BASE_URL = "https://api.tiny.com.br/public-api/v3"
 
 def _refresh_tiny_v3_token():
     """Tenta renovar o token de acesso Tiny v3."""
-    config = load_app_config()
-    refresh_token = config.get('tiny_v3_refresh_token')
-    client_id = config.get('tiny_v3_client_id')
-    client_secret = config.get('tiny_v3_client_secret')
+    config = get_app_config()
+    refresh_token = config.tiny_v3_refresh_token
+    client_id = config.tiny_v3_client_id
+    client_secret = config.tiny_v3_client_secret
 
     if not all([refresh_token, client_id, client_secret]):
         print("TINY REFRESH: Faltam credenciais para renovar o token.")
@@ -30,23 +30,25 @@ def _refresh_tiny_v3_token():
         response.raise_for_status()
         token_data = response.json()
         
-        config['tiny_v3_access_token'] = token_data['access_token']
+        changes = {
+            'tiny_v3_access_token': token_data['access_token'],
+            'tiny_v3_expires_at': time.time() + token_data['expires_in'] - 60
+        }
         if 'refresh_token' in token_data:
-            config['tiny_v3_refresh_token'] = token_data['refresh_token']
-        config['tiny_v3_expires_at'] = time.time() + token_data['expires_in'] - 60
-        
-        save_app_config(config)
+            changes['tiny_v3_refresh_token'] = token_data['refresh_token']
+
+        config = update_app_config(**changes)
         print("TINY REFRESH: Token atualizado com sucesso.")
-        return config['tiny_v3_access_token']
+        return config.tiny_v3_access_token
     except requests.RequestException as e:
         print(f"TINY REFRESH: Erro ao tentar renovar token: {e}")
         return None
 
 def _get_tiny_v3_access_token():
     """Retorna um token v3 válido, tentando refresh se necessário."""
-    config = load_app_config()
-    token = config.get('tiny_v3_access_token')
-    expires_at = float(config.get('tiny_v3_expires_at', 0))
+    config = get_app_config() # Snapshot em memória, sem leitura de arquivo
+    token = config.tiny_v3_access_token
+    expires_at = config.tiny_v3_expires_at
 
     if not token or time.time() >= expires_at:
         return _refresh_tiny_v3_token()